@@ -1,6 +1,28 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(sender, using, **kwargs):
+    # SQLite drops the search triggers whenever a migration rebuilds api_order.
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+
+    from .search import ensure_search_index
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if ('api', '0015_order_search') not in MigrationRecorder(connection).applied_migrations():
+        return
+    if ensure_search_index(connection):
+        print("Recreated the order search index")
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(repair_search_index, sender=self)
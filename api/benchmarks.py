@@ -0,0 +1,457 @@
+"""
+Endpoint benchmarks (`manage.py run_benchmarks`).
+
+DatasetGenerator fills the database with a synthetic shop: sellers, a staff
+user, products and variants, designs and mockups (with small files under
+MEDIA_ROOT), and any number of orders spread over the last year, written with
+bulk_create in batches. BenchmarkSuite then drives the main API paths through
+the test client, with the courier replaced by a local HTTP server
+(LocalCourier) so export and return sync run their real client code.
+
+Every scenario is run once to record its query count and peak Python memory
+(tracemalloc), then `repeat` more times for wall-clock timings. Anything a run
+consumes (a pending order to move, shipped orders to export, returns to
+sync) is set up before it outside the timing. `compare` checks a result set
+against a stored baseline and reports regressions beyond a threshold.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import catalog, courier, jobs, recipients, rollups
+from .collection import COLLECTED_FOLDER
+from .dates import business_today
+from .models import (
+    CourierExportJob, Design, InventoryItem, InventoryProduct, Mockup, Order, OrderItem, OrderSequence,
+)
+from .storage import blob_name_for
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+STAFF_USERNAME = 'bench-staff'
+SELLER_PREFIX = 'bench-seller-'
+PRODUCTS = ['t-shirt', 'hoodie', 'sweatshirt', 'tank-top', 'polo', 'cap', 'mug', 'tote-bag', 'sticker', 'poster']
+SIZES_AVAILABLE = ['S', 'M', 'L', 'XL', 'XXL']
+COLORS = ['black', 'white', 'red', 'navy']
+# Shipped orders only appear when a scenario sets them up.
+STATUS_WEIGHTS = {
+    'delivered': 40, 'completed': 30, 'pending': 10, 'processing': 10, 'cancelled': 5, 'returned': 5,
+}
+# Timings below this many milliseconds apart are noise, whatever the ratio.
+MIN_TIME_DELTA_MS = 2.0
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def parse_size(value):
+    """'10k' / '100k' / '1m' or a plain number of orders."""
+    value = str(value).strip().lower()
+    if value in SIZES:
+        return SIZES[value]
+    try:
+        return int(value.replace('_', ''))
+    except ValueError:
+        raise BenchmarkError(f"Unknown dataset size '{value}'; use one of {', '.join(SIZES)} or a number.")
+
+
+class LocalCourier:
+    """A local HTTP server answering export submissions and the returns feed.
+
+    `returns` holds the records the returns feed serves, paged by
+    (write_date, id) like the courier's search_read.
+    """
+
+    def __init__(self):
+        self.returns = []
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+                stub.requests += 1
+                payload = json.dumps(stub.handle(body)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def handle(self, body):
+        params = body.get('params') if isinstance(body, dict) else None
+        if not params:
+            return {'result': True}
+        records = self.returns
+        domain = params['domain']
+        if len(domain) > 1:
+            after = (domain[2][2], domain[5][2])
+            records = [record for record in records if (record['write_date'], record['id']) > after]
+        return {'result': {'records': records[:params['limit']]}}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DatasetGenerator:
+    """Writes `orders` synthetic orders plus the users, stock and files they use."""
+
+    def __init__(self, orders, seed=0, batch_size=5000, progress=None):
+        self.orders = orders
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.sellers = min(max(orders // 2000, 5), 500)
+
+    def exists(self):
+        """True if the database already holds a dataset of this size."""
+        return User.objects.filter(username=STAFF_USERNAME).exists() and Order.objects.count() >= self.orders
+
+    def generate(self):
+        users = self._users()
+        self._stock()
+        assets = self._assets(users)
+        self._orders(users, assets)
+        rollups.rebuild()
+        catalog.invalidate()
+
+    def _users(self):
+        User.objects.create_user(STAFF_USERNAME, password='bench', is_staff=True)
+        User.objects.bulk_create(
+            User(username=f"{SELLER_PREFIX}{number}", password='!') for number in range(self.sellers)
+        )
+        return list(User.objects.filter(username__startswith=SELLER_PREFIX).order_by('id'))
+
+    def _stock(self):
+        InventoryProduct.objects.bulk_create(
+            InventoryProduct(name=name, price=20 + index * 5) for index, name in enumerate(PRODUCTS)
+        )
+        InventoryItem.objects.bulk_create(
+            InventoryItem(product=product, size=size, color=color, quantity=10 ** 9)
+            for product in InventoryProduct.objects.filter(name__in=PRODUCTS)
+            for size in SIZES_AVAILABLE
+            for color in COLORS
+        )
+
+    def _write_blob(self, content, extension):
+        name = blob_name_for(hashlib.sha256(content).hexdigest(), extension)
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(content)
+        return name
+
+    def _assets(self, users):
+        designs, mockups = [], []
+        for user in users:
+            for number in range(3):
+                tag = f"{user.id}-{number}".encode()
+                designs.append(Design(
+                    user=user, name=f"design {number}", original_filename=f"design-{number}.png",
+                    file=self._write_blob(b'\x89PNG' + tag * 200, '.png'),
+                ))
+                mockups.append(Mockup(
+                    user=user, name=f"mockup {number}", original_filename=f"mockup-{number}.png",
+                    file=self._write_blob(b'\x89PNG mockup' + tag * 200, '.png'),
+                ))
+        Design.objects.bulk_create(designs)
+        Mockup.objects.bulk_create(mockups)
+        assets = {}
+        for design in Design.objects.filter(user__in=users):
+            assets.setdefault(design.user_id, ([], []))[0].append(design.id)
+        for mockup in Mockup.objects.filter(user__in=users):
+            assets.setdefault(mockup.user_id, ([], []))[1].append(mockup.id)
+        return assets
+
+    def _orders(self, users, assets):
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        today = business_today()
+        phones = [f"059{number:07d}" for number in self.random.sample(range(10 ** 7), max(self.orders // 3, 1))]
+        numbers = {user.id: 0 for user in users}
+        written = 0
+        while written < self.orders:
+            count = min(self.batch_size, self.orders - written)
+            orders, item_specs = [], []
+            for index in range(written, written + count):
+                user = users[self.random.randrange(len(users))]
+                numbers[user.id] += 1
+                status = self.random.choices(statuses, weights)[0]
+                price = self.random.randrange(60, 300)
+                orders.append(Order(
+                    user=user,
+                    unique_id=f"{user.username}-{numbers[user.id]}",
+                    name=f"Customer {self.random.randrange(100000)}",
+                    phone=self.random.choice(phones),
+                    area='Ramallah',
+                    areaId=self.random.randrange(1, 40),
+                    price=0 if status in ('cancelled', 'returned') else price,
+                    profit=0 if status in ('cancelled', 'returned') else price // 3,
+                    status=status,
+                    # Today gets its share of orders so date-scoped paths have work.
+                    business_date=today - timedelta(days=index % 365),
+                ))
+                design_ids, mockup_ids = assets[user.id]
+                item_specs.append([
+                    (self.random.choice(PRODUCTS), self.random.choice(SIZES_AVAILABLE), self.random.choice(COLORS),
+                     self.random.choice(design_ids), self.random.choice(mockup_ids))
+                    for _ in range(self.random.randint(1, 3))
+                ])
+            recipients.link(orders)
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, type=kind, size=size, color=color, design_id=design_id, mockup_id=mockup_id)
+                for order, specs in zip(orders, item_specs)
+                for kind, size, color, design_id, mockup_id in specs
+            )
+            written += count
+            self.progress(f"Generated {written}/{self.orders} orders")
+        OrderSequence.objects.bulk_create(
+            OrderSequence(user_id=user_id, last_number=last_number) for user_id, last_number in numbers.items()
+        )
+
+
+@dataclass
+class Scenario:
+    name: str
+    run: Callable
+    prepare: Optional[Callable] = None
+    expected_status: int = 200
+
+
+class BenchmarkSuite:
+    def __init__(self, repeat=5, batch=None):
+        self.repeat = repeat
+        # Orders exported / returned / designs collected per run
+        self.batch = batch or max(1, min(200, Order.objects.count() // 100))
+        self.courier = None
+        self.staff = User.objects.get(username=STAFF_USERNAME)
+        # The seller with the most orders; their lists are the fullest.
+        self.seller = (
+            User.objects.filter(username__startswith=SELLER_PREFIX)
+            .annotate(order_count=Count('orders'))
+            .order_by('-order_count', 'id')
+            .first()
+        )
+        self.staff_client = APIClient()
+        self.staff_client.force_authenticate(self.staff)
+        self.seller_client = APIClient()
+        self.seller_client.force_authenticate(self.seller)
+        self.detail_id = Order.objects.filter(user=self.seller).order_by('-id').values_list('id', flat=True).first()
+        self.today = business_today().strftime('%Y-%m-%d')
+        self._target = None
+
+    def _order_payload(self, name='Benchmark customer'):
+        return {
+            'name': name, 'phone': '0599000001', 'area': 'Nablus', 'areaId': 7, 'price': '150.00',
+            'items': [
+                {'type': 't-shirt', 'size': 'M', 'color': 'black'},
+                {'type': 'hoodie', 'size': 'L', 'color': 'navy'},
+            ],
+        }
+
+    def _take(self, status, count):
+        """Ids of `count` orders in `status`; runs consume them."""
+        ids = list(Order.objects.filter(status=status).order_by('id').values_list('id', flat=True)[:count])
+        if not ids:
+            raise BenchmarkError(f"No '{status}' orders left to benchmark with; generate a larger dataset.")
+        return ids
+
+    def _prepare_update_status(self):
+        self._target = Order.objects.create(
+            user=self.seller, name='Benchmark customer', phone='0599000001', area='Nablus', areaId=7, price=150,
+        ).id
+
+    def _prepare_update(self):
+        self._target = self.seller_client.post('/api/orders/', self._order_payload(), format='json').data['id']
+
+    def _prepare_export(self):
+        Order.objects.filter(id__in=self._take('completed', self.batch)).update(status='shipped')
+        CourierExportJob.objects.all().delete()
+
+    def _run_export(self):
+        response = self.staff_client.get('/api/orders/export/')
+        jobs.run_pending_jobs()
+        return response
+
+    def _prepare_collect(self):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, COLLECTED_FOLDER), ignore_errors=True)
+        # Give the collection today's designs to copy.
+        Design.objects.filter(id__in=Design.objects.order_by('-id').values('id')[:self.batch]).update(
+            created_at=timezone.now()
+        )
+
+    def _prepare_returns(self):
+        unique_ids = Order.objects.filter(id__in=self._take('delivered', self.batch)).values_list('unique_id', flat=True)
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.courier.returns = [
+            {'id': index + 1, 'reference_id': unique_id, 'state': 'completed_returned', 'write_date': stamp}
+            for index, unique_id in enumerate(unique_ids)
+        ]
+
+    def scenarios(self):
+        staff, seller = self.staff_client, self.seller_client
+        return [
+            Scenario('orders_list_staff', lambda: staff.get('/api/orders/', {'page_size': 50})),
+            Scenario('orders_list_seller', lambda: seller.get('/api/orders/', {'page_size': 50})),
+            Scenario('orders_search_staff', lambda: staff.get('/api/orders/', {'search': '0599'})),
+            Scenario('order_detail_staff', lambda: staff.get(f'/api/orders/{self.detail_id}/')),
+            Scenario('order_detail_seller', lambda: seller.get(f'/api/orders/{self.detail_id}/')),
+            Scenario(
+                'order_create', lambda: seller.post('/api/orders/', self._order_payload(), format='json'),
+                expected_status=201,
+            ),
+            Scenario(
+                'order_update',
+                lambda: seller.put(f'/api/orders/{self._target}/', self._order_payload('Renamed'), format='json'),
+                prepare=self._prepare_update,
+            ),
+            Scenario(
+                'update_status',
+                lambda: seller.patch(f'/api/orders/{self._target}/update_status/', {'status': 'processing'}),
+                prepare=self._prepare_update_status,
+            ),
+            Scenario('export', self._run_export, prepare=self._prepare_export, expected_status=202),
+            Scenario(
+                'export_designs_by_order_date',
+                lambda: staff.get(
+                    '/api/orders/export_designs_by_order_date/', {'start_date': self.today, 'end_date': self.today}
+                ),
+            ),
+            Scenario('collect_designs', lambda: staff.post('/api/designs/collect_designs/'), prepare=self._prepare_collect),
+            Scenario(
+                'sync_returns', lambda: staff.get('/api/orders/sync_returns/', {'full': 'true'}),
+                prepare=self._prepare_returns,
+            ),
+        ]
+
+    def _call(self, scenario):
+        response = scenario.run()
+        if response.status_code != scenario.expected_status:
+            raise BenchmarkError(
+                f"{scenario.name}: expected {scenario.expected_status}, got {response.status_code}: "
+                f"{getattr(response, 'data', '')}"
+            )
+        return response
+
+    def measure(self, scenario):
+        if scenario.prepare:
+            scenario.prepare()
+        # The query log is a bounded deque; a full one would capture nothing.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            tracemalloc.start()
+            try:
+                self._call(scenario)
+                _current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        # captured_queries reads the live log, which later requests reset.
+        query_count = len(queries.captured_queries)
+
+        timings = []
+        for _ in range(self.repeat):
+            if scenario.prepare:
+                scenario.prepare()
+            started = time.perf_counter()
+            self._call(scenario)
+            timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'median_ms': round(statistics.median(timings), 3) if timings else None,
+            'min_ms': round(min(timings), 3) if timings else None,
+            'max_ms': round(max(timings), 3) if timings else None,
+            'runs': len(timings),
+            'queries': query_count,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, only=None, progress=None):
+        """Measure every scenario (or those named in `only`); returns {name: result}."""
+        results = {}
+        courier.breaker.reset()
+        with LocalCourier() as local_courier, override_settings(
+            COURIER_EXPORT_URL=f"{local_courier.url}/create_super_multi_orders",
+            COURIER_RETURNS_URL=f"{local_courier.url}/web/dataset/search_read",
+            COURIER_EXPORT_RETRY_BACKOFF=0,
+            THUMBNAIL_MODE='off',
+        ):
+            self.courier = local_courier
+            for scenario in self.scenarios():
+                if only and scenario.name not in only:
+                    continue
+                results[scenario.name] = self.measure(scenario)
+                if progress:
+                    progress(scenario.name, results[scenario.name])
+        return results
+
+
+def metadata(orders):
+    return {
+        'orders': orders,
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+    }
+
+
+def compare(results, baseline, threshold=0.25):
+    """Regression messages for `results` against `baseline` (both as saved to JSON).
+
+    A scenario regresses if its median time or peak memory grew by more than
+    `threshold` (a fraction), or if it runs more queries than before.
+    """
+    if baseline.get('meta', {}).get('orders') != results.get('meta', {}).get('orders'):
+        raise BenchmarkError('The baseline was recorded with a different number of orders.')
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            continue
+        if (
+            current['median_ms'] is not None and previous.get('median_ms') is not None
+            and current['median_ms'] > previous['median_ms'] * (1 + threshold)
+            and current['median_ms'] - previous['median_ms'] > MIN_TIME_DELTA_MS
+        ):
+            regressions.append(f"{name}: median {current['median_ms']:.1f} ms, was {previous['median_ms']:.1f} ms")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: {current['queries']} queries, was {previous['queries']}")
+        if current['peak_memory_kb'] > previous['peak_memory_kb'] * (1 + threshold):
+            regressions.append(
+                f"{name}: peak memory {current['peak_memory_kb']:.0f} KiB, was {previous['peak_memory_kb']:.0f} KiB"
+            )
+    return regressions
@@ -0,0 +1,206 @@
+"""
+Bulk order import.
+
+Takes a batch of orders (a JSON list or a CSV upload), validates every row,
+checks the whole batch against inventory in one locked pass, hands out
+unique_ids as one block from the seller's OrderSequence and writes orders
+and items with bulk_create. Two modes:
+
+- atomic: any invalid row, or any shortage, rejects the whole batch.
+- best_effort: valid rows that fit the remaining stock are created in row
+  order; the rest are reported with their errors.
+"""
+
+import csv
+import io
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import recipients, rollups
+from .dates import to_business_date
+from .inventory import InventoryReservation
+from .models import Order, OrderItem, OrderSequence
+from .pricing import PriceBook
+from .serializers import OrderSerializer, set_order_profit
+
+ATOMIC = 'atomic'
+BEST_EFFORT = 'best_effort'
+MODES = (ATOMIC, BEST_EFFORT)
+
+ORDER_COLUMNS = ('name', 'phone', 'area', 'areaId', 'cod', 'price')
+ITEM_COLUMNS = ('type', 'size', 'color', 'mockup', 'design')
+
+
+class BulkOrderRowSerializer(OrderSerializer):
+    def validate(self, data):
+        # Stock is checked once for the whole batch by BulkOrderImport.
+        return data
+
+
+def parse_csv(upload):
+    """Orders from a CSV upload, one item per line.
+
+    Consecutive lines that share a non-empty `ref` column are items of the
+    same order; the order columns are taken from the first of them.
+    """
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    orders = []
+    for line in csv.DictReader(text):
+        line = {key.strip(): value.strip() for key, value in line.items() if key and value and value.strip()}
+        ref = line.get('ref')
+        item = {column: line[column] for column in ITEM_COLUMNS if column in line}
+        if ref and orders and orders[-1].get('ref') == ref:
+            orders[-1]['items'].append(item)
+            continue
+        order = {column: line[column] for column in ORDER_COLUMNS if column in line}
+        order['items'] = [item] if item else []
+        if ref:
+            order['ref'] = ref
+        orders.append(order)
+    return orders
+
+
+class BulkOrderImport:
+    def __init__(self, user, rows, mode=ATOMIC, context=None):
+        self.user = user
+        self.rows = rows
+        self.mode = mode
+        self.context = context or {}
+        self.results = [None] * len(rows)
+
+    def _result(self, index, status, **extra):
+        result = {'row': index + 1, 'status': status}
+        ref = self.rows[index].get('ref') if isinstance(self.rows[index], dict) else None
+        if ref:
+            result['ref'] = ref
+        result.update(extra)
+        self.results[index] = result
+
+    def _validate_rows(self):
+        valid = []
+        for index, row in enumerate(self.rows):
+            if not isinstance(row, dict):
+                self._result(index, 'error', errors={'non_field_errors': ['Expected an order object.']})
+                continue
+            serializer = BulkOrderRowSerializer(data=row, context=self.context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                self._result(index, 'error', errors=serializer.errors)
+        return valid
+
+    def _allocate(self, valid):
+        """Lock the batch's variants and assign stock to rows in order."""
+        demands = {
+            index: Counter((item.get('type'), item.get('size'), item.get('color')) for item in data.get('items', []))
+            for index, data in valid
+        }
+        keys = set().union(*demands.values()) if demands else set()
+        stock = {key: quantity for key, (_pk, quantity) in InventoryReservation().resolve(keys, lock=True).items()}
+
+        reservation = InventoryReservation()
+        accepted = []
+        for index, data in valid:
+            shortages = []
+            for (name, size, color), needed in demands[index].items():
+                available = stock.get((name, size, color))
+                if available is None:
+                    shortages.append(f"Inventory item not found for {name} (Size: {size}, Color: {color}).")
+                elif available < needed:
+                    shortages.append(
+                        f"Insufficient stock for {name} (Size: {size}, Color: {color}). Available: {available}"
+                    )
+            if shortages:
+                self._result(index, 'error', errors={'non_field_errors': shortages})
+                continue
+            for (name, size, color), needed in demands[index].items():
+                stock[(name, size, color)] -= needed
+                reservation.take(name, size, color, needed)
+            accepted.append((index, data))
+        return accepted, reservation
+
+    def _write(self, accepted):
+        numbers = OrderSequence.reserve(self.user.id, len(accepted))
+        business_date = to_business_date(timezone.now())
+        price_book = PriceBook().load(
+            [self.user.id], {item.get('type') for _, data in accepted for item in data.get('items', [])}
+        )
+
+        orders, items_per_order = [], []
+        for number, (_index, data) in zip(numbers, accepted):
+            data = dict(data)
+            items_data = data.pop('items', [])
+            data.pop('owner_mockups', None)
+            data.pop('owner_designs', None)
+            order = Order(
+                user=self.user, unique_id=f"{self.user.username}-{number}", business_date=business_date, **data
+            )
+            set_order_profit(order, [item.get('type') for item in items_data], price_book)
+            orders.append(order)
+            items_per_order.append(items_data)
+
+        recipients.link(orders)
+        Order.objects.bulk_create(orders)
+        self._match_business_dates(orders)
+        rollups.record_created(orders)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, **item_data)
+            for order, items_data in zip(orders, items_per_order)
+            for item_data in items_data
+        ])
+        for order, (index, _data) in zip(orders, accepted):
+            self._result(index, 'created', id=order.id, unique_id=order.unique_id)
+        return orders
+
+    def _match_business_dates(self, orders):
+        # bulk_create stamps created_at itself (auto_now_add overrides any
+        # preset value), a moment after business_date was picked. Across local
+        # midnight the two disagree; move those orders to created_at's day.
+        moved = {}
+        for order in orders:
+            business_date = to_business_date(order.created_at)
+            if business_date != order.business_date:
+                order.business_date = business_date
+                moved.setdefault(business_date, []).append(order.id)
+        for business_date, ids in moved.items():
+            Order.objects.filter(id__in=ids).update(business_date=business_date)
+
+    def run(self):
+        """Import the batch; returns the list of created orders."""
+        valid = self._validate_rows()
+        created = []
+        with transaction.atomic():
+            if valid and (self.mode == BEST_EFFORT or len(valid) == len(self.rows)):
+                accepted, reservation = self._allocate(valid)
+                if accepted and (self.mode == BEST_EFFORT or len(accepted) == len(valid)):
+                    reservation.apply()
+                    created = self._write(accepted)
+
+        if self.mode == ATOMIC and not created:
+            for index, result in enumerate(self.results):
+                if result is None:
+                    self._result(index, 'skipped', errors={'non_field_errors': ['Batch rejected; not created.']})
+        return created
+
+    @property
+    def error_count(self):
+        return sum(1 for result in self.results if result['status'] != 'created')
+
+
+def rows_from_request(request):
+    """Order rows from a JSON body (list or {"orders": [...]}) or a CSV upload."""
+    upload = request.FILES.get('file')
+    if upload is not None:
+        try:
+            return parse_csv(upload)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise serializers.ValidationError({'file': [f'Could not read CSV: {exc}']})
+    data = request.data
+    if isinstance(data, dict):
+        data = data.get('orders')
+    if not isinstance(data, list):
+        raise serializers.ValidationError({'orders': ['Expected a list of orders or a CSV file.']})
+    return data
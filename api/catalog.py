@@ -0,0 +1,152 @@
+"""
+Cached public product catalog.
+
+The catalog (every InventoryProduct with its variants, as served by
+InventoryProductViewSet) is read with a single LEFT JOIN query, rendered to
+plain data once and kept in Django's cache together with a strong ETag per
+product and for the whole list. Requests carrying a matching If-None-Match get
+`304 Not Modified`.
+
+Entries are keyed by a generation number; saving or deleting a product or a
+variant, or any stock change made through InventoryReservation, bumps the
+generation once the transaction commits (see api.signals), so stale entries
+are simply never read again. The cache must be shared by all workers
+(settings.CACHES: Redis, or the file cache on a single host) for a change
+handled by one worker to invalidate the others. Misses are coalesced: within a
+process one thread builds while the others wait on a lock, and across
+processes the builder holds a short `cache.add` lock while the others poll for
+its result. `add` is atomic on Redis; on the file cache two workers may
+rarely both build, which costs a query but never serves stale data.
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from .models import InventoryProduct
+
+GENERATION_CACHE_KEY = "catalog:generation"
+
+_build_lock = threading.Lock()
+_datetime_field = serializers.DateTimeField()
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+
+
+def _generation():
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        cache.add(GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_CACHE_KEY)
+    return generation
+
+
+def etag_for(data):
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return f'"{hashlib.sha256(encoded).hexdigest()[:32]}"'
+
+
+def _timestamp(value):
+    return _datetime_field.to_representation(value) if value else None
+
+
+def build():
+    """Render the catalog from one query. Same shape as InventoryProductSerializer."""
+    rows = InventoryProduct.objects.order_by("id", "variants__id").values_list(
+        "id", "name", "price", "description", "image", "created_at", "updated_at",
+        "variants__id", "variants__size", "variants__color", "variants__quantity",
+        "variants__created_at", "variants__updated_at",
+    )
+    products = {}
+    for (product_id, name, price, description, image, created_at, updated_at,
+         variant_id, size, color, quantity, variant_created_at, variant_updated_at) in rows:
+        product = products.get(product_id)
+        if product is None:
+            product = products[product_id] = {
+                "id": product_id,
+                "name": name,
+                "price": price,
+                "description": description,
+                "image": default_storage.url(image) if image else None,
+                "variants": [],
+                "created_at": _timestamp(created_at),
+                "updated_at": _timestamp(updated_at),
+            }
+        if variant_id is not None:
+            product["variants"].append({
+                "id": variant_id,
+                "product_name": name,
+                "size": size,
+                "color": color,
+                "quantity": quantity,
+                "created_at": _timestamp(variant_created_at),
+                "updated_at": _timestamp(variant_updated_at),
+            })
+    products = list(products.values())
+    return {
+        "products": products,
+        "etag": etag_for(products),
+        "product_etags": {product["id"]: etag_for(product) for product in products},
+    }
+
+
+def get_catalog():
+    """The current catalog entry, building it at most once per generation."""
+    key = f"catalog:{_generation()}"
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    timeout = getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+    with _build_lock:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        lock_key = f"{key}:building"
+        if cache.add(lock_key, 1, getattr(settings, "CATALOG_BUILD_LOCK_TIMEOUT", 10)):
+            try:
+                entry = build()
+                cache.set(key, entry, timeout)
+            finally:
+                cache.delete(lock_key)
+            return entry
+
+        # Another process is building this generation: wait for its result.
+        deadline = time.monotonic() + getattr(settings, "CATALOG_BUILD_WAIT", 2)
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return build()
+
+
+def not_modified(request, etag):
+    """Whether the request's If-None-Match already matches `etag`."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def with_absolute_images(products, request):
+    if not any(product["image"] for product in products):
+        return products
+    return [
+        dict(product, image=request.build_absolute_uri(product["image"])) if product["image"] else product
+        for product in products
+    ]
@@ -0,0 +1,98 @@
+"""
+Daily design collection.
+
+Each business day has a folder `collected_designs/<date>/`, an archive
+`collected_designs/<date>.zip` and a manifest `collected_designs/<date>.json`
+listing the designs already collected (id -> archive name). A run copies and
+appends only the designs missing from the manifest, so repeated runs during
+the day cost as much as the designs uploaded since the previous one. Runs are
+serialised with a lock file so two staff members collecting at once cannot
+append the same design twice.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .dates import business_day_bounds, business_today
+from .exports import ArchiveNames, append_zip
+from .models import Design
+
+COLLECTED_FOLDER = 'collected_designs'
+
+
+class DailyCollection:
+    def __init__(self, day=None, root=None):
+        self.day = day or business_today()
+        self.root = root or os.path.join(settings.MEDIA_ROOT, COLLECTED_FOLDER)
+        self.label = self.day.strftime('%Y-%m-%d')
+        self.folder = os.path.join(self.root, self.label)
+        self.zip_path = f"{self.folder}.zip"
+        self.manifest_path = f"{self.folder}.json"
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {'date': self.label, 'designs': {}, 'last_run_at': None}
+
+    def _save_manifest(self, manifest):
+        partial_path = f"{self.manifest_path}.part"
+        with open(partial_path, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+        os.replace(partial_path, self.manifest_path)
+
+    def pending(self, manifest):
+        start, end = business_day_bounds(self.day)
+        collected_ids = [int(design_id) for design_id in manifest['designs']]
+        return (
+            Design.objects.filter(created_at__gte=start, created_at__lt=end)
+            .exclude(id__in=collected_ids)
+            .exclude(file='')
+            .order_by('id')
+        )
+
+    def collect(self):
+        """Collect the designs not in the manifest yet.
+
+        Returns (added, manifest): the designs added by this run as
+        {id, name, filename} dicts, and the updated manifest.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        with open(f"{self.folder}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.load_manifest()
+            archive_name = ArchiveNames(manifest['designs'].values())
+
+            designs, entries = [], []
+            for design in self.pending(manifest):
+                if not default_storage.exists(design.file.name):
+                    # Not recorded, so a later run picks it up if it reappears.
+                    print(f"Warning: design file missing from storage: {design.file.name}")
+                    continue
+                arcname = archive_name(design.display_filename)
+                designs.append((design, arcname))
+                entries.append((arcname, design.file.name))
+
+            archived = set(append_zip(entries, self.zip_path))
+            added = []
+            for design, arcname in designs:
+                if arcname not in archived:
+                    continue
+                try:
+                    shutil.copy(default_storage.path(design.file.name), os.path.join(self.folder, arcname))
+                except OSError as e:
+                    print(f"Error copying file {arcname}: {str(e)}")
+                manifest['designs'][str(design.id)] = arcname
+                added.append({'id': design.id, 'name': design.name, 'filename': arcname})
+
+            manifest['previous_run_at'] = manifest.get('last_run_at')
+            manifest['last_run_at'] = timezone.now().isoformat()
+            self._save_manifest(manifest)
+        return added, manifest
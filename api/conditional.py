@@ -0,0 +1,69 @@
+"""
+Conditional GET for orders.
+
+Order responses are validated with values the database can produce without
+loading the order graph: `updated_at` of the order for a detail, and
+`max(updated_at)` plus the row count of the filtered queryset for a list (the
+count catches deletions). The ETag also covers the requesting user and the
+full query string, so pages, filters and per-user scoping each get their own
+validator. `OrderViewSet` checks these before serializing and answers `304`
+when the client's copy is current.
+
+Responses embed signed media URLs (api.media) and thumbnail URLs that change
+without touching any order, so the ETag also covers the current signing window
+and the thumbnail generation (api.thumbnails). No Last-Modified is sent: a
+date cannot express either, and If-Modified-Since alone would keep answering
+304 with URLs that have expired.
+
+Other changes that do not touch an order's `updated_at` (e.g. edits to a
+seller's mockups shown inline with `owner_assets`) are not reflected.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import media, thumbnails
+
+
+def make_etag(request, *parts):
+    digest = hashlib.sha256()
+    for part in (request.user.pk, request.get_full_path(), media.signing_window(), thumbnails.generation(), *parts):
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def list_validators(request, queryset):
+    """ETag for a filtered order queryset, from one aggregate query."""
+    stats = queryset.order_by().aggregate(last_modified=Max("updated_at"), count=Count("id"))
+    return make_etag(request, stats["last_modified"], stats["count"])
+
+
+def detail_validators(request, queryset, pk):
+    """ETag for one order, or None if it is not in `queryset`."""
+    try:
+        updated_at = queryset.order_by().filter(pk=pk).values_list("updated_at", flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    return make_etag(request, pk, updated_at)
+
+
+def validator_headers(etag):
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def not_modified_response(request, etag):
+    """A 304 (or 412) response if the request's If-None-Match matches, else None."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        return None
+    if response.status_code == status.HTTP_304_NOT_MODIFIED:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag))
+    return response
@@ -0,0 +1,171 @@
+"""
+HTTP client for the courier API.
+
+Every call to the courier goes through `post()`, which:
+
+- reuses one keep-alive `requests.Session` (connection pool) per process,
+- always sends connect/read timeouts (settings.COURIER_TIMEOUT),
+- retries connection errors, timeouts and 429/5xx responses with jittered
+  exponential backoff,
+- fails fast with CourierUnavailable while the circuit breaker is open, i.e.
+  after COURIER_BREAKER_THRESHOLD consecutive failures and until
+  COURIER_BREAKER_RESET seconds have passed (then one trial call decides),
+- records the latency and outcome of every attempt per operation (see
+  `latency_stats()`); calls slower than COURIER_SLOW_CALL are printed.
+"""
+
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class CourierUnavailable(requests.RequestException):
+    """The circuit breaker is open; the courier was not contacted."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            pool_size = _setting('COURIER_POOL_SIZE', 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Whether a call may go out now (a single trial once the reset time passes)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self.opened_at < _setting('COURIER_BREAKER_RESET', 30):
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= _setting('COURIER_BREAKER_THRESHOLD', 5):
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+
+class LatencyStats:
+    """Per-operation call counts and timings for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation, seconds, outcome):
+        with self._lock:
+            stats = self._stats.setdefault(
+                operation, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'last_seconds': 0.0}
+            )
+            stats['calls'] += 1
+            stats['errors'] += outcome != 'ok'
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['last_seconds'] = seconds
+        if seconds >= _setting('COURIER_SLOW_CALL', 5):
+            print(f"Warning: courier {operation} call took {seconds:.2f}s ({outcome})")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: dict(stats, mean_seconds=stats['total_seconds'] / stats['calls'])
+                for operation, stats in self._stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+latency = LatencyStats()
+
+
+def latency_stats():
+    return latency.snapshot()
+
+
+def backoff_delay(attempt, backoff):
+    """Full jitter: anywhere between 0 and backoff * 2**attempt seconds."""
+    return random.uniform(0, backoff * (2 ** attempt))
+
+
+def post(url, operation, retries=None, backoff=None, on_attempt=None, **kwargs):
+    """POST to the courier and return the final response.
+
+    Responses outside RETRY_STATUSES are returned as they are for the caller
+    to judge; after the last retry the last response is returned or the last
+    error raised. `on_attempt(attempt)` is called before every attempt.
+    """
+    retries = _setting('COURIER_MAX_RETRIES', 3) if retries is None else retries
+    backoff = _setting('COURIER_RETRY_BACKOFF', 0.5) if backoff is None else backoff
+    kwargs.setdefault('timeout', _setting('COURIER_TIMEOUT', (5, 30)))
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CourierUnavailable(f"Courier circuit open after {breaker.failures} consecutive failures")
+        if on_attempt is not None:
+            on_attempt(attempt)
+        started = time.monotonic()
+        try:
+            response = session.post(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            latency.record(operation, time.monotonic() - started, type(exc).__name__)
+            breaker.record_failure()
+            if attempt == retries:
+                raise
+        else:
+            latency.record(operation, time.monotonic() - started, 'ok' if response.ok else str(response.status_code))
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response
+        time.sleep(backoff_delay(attempt, backoff))
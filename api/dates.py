@@ -0,0 +1,55 @@
+"""
+Business-day helpers. Orders are bucketed by the local calendar day of the
+business (settings.BUSINESS_TIME_ZONE), not by UTC.
+"""
+
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def business_tz():
+    return ZoneInfo(getattr(settings, 'BUSINESS_TIME_ZONE', settings.TIME_ZONE))
+
+
+def to_business_date(value):
+    """Local business date of an aware datetime."""
+    return timezone.localtime(value, business_tz()).date()
+
+
+def business_today():
+    return to_business_date(timezone.now())
+
+
+def business_day_bounds(day):
+    """Aware [start, end) datetimes covering business date `day`."""
+    start = datetime.combine(day, time.min, tzinfo=business_tz())
+    return start, datetime.combine(day + timedelta(days=1), time.min, tzinfo=business_tz())
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def shortcut_range(shortcut, today=None):
+    """Half-open [start, end) date range for a 'date' shortcut, or None."""
+    today = today or business_today()
+    if shortcut == 'today':
+        return today, today + timedelta(days=1)
+    if shortcut == 'yesterday':
+        return today - timedelta(days=1), today
+    if shortcut == 'this_week':
+        return today - timedelta(days=today.weekday()), today + timedelta(days=1)
+    if shortcut == 'this_month':
+        start = today.replace(day=1)
+        return start, next_month(start)
+    return None
+
+
+def month_range(month, today=None):
+    """Half-open range covering `month` of the current business year."""
+    today = today or business_today()
+    start = date(today.year, month, 1)
+    return start, next_month(start)
@@ -0,0 +1,150 @@
+"""
+Streaming ZIP archives for design exports.
+
+Files are read from storage in fixed-size chunks and written straight into a
+ZIP stream; nothing is copied to a temporary folder first and memory use is
+bounded by the chunk size whatever the archive size. Formats that are already
+compressed (PNG, JPEG, ...) are stored rather than deflated again.
+"""
+
+import os
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+CHUNK_SIZE = 1024 * 1024
+
+# Already-compressed formats: deflating them again costs CPU and saves nothing.
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.zip', '.gz', '.pdf', '.mp4'}
+
+
+class _StreamSink:
+    """Write-only, non-seekable file object that hands written bytes back out."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArchiveNames:
+    """Resolves duplicate names in memory: a.png, a_copy1.png, a_copy2.png..."""
+
+    def __init__(self, used=()):
+        self._used = set(used)
+
+    def __call__(self, filename):
+        name = filename
+        stem, extension = os.path.splitext(filename)
+        counter = 1
+        while name in self._used:
+            name = f"{stem}_copy{counter}{extension}"
+            counter += 1
+        self._used.add(name)
+        return name
+
+
+def compress_type_for(name):
+    extension = os.path.splitext(name)[1].lower()
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries, storage=None, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of `entries`, a sequence of (arcname, storage path).
+
+    Entries whose file has gone missing from storage are skipped.
+    """
+    storage = storage or default_storage
+    sink = _StreamSink()
+    date_time = timezone.localtime().timetuple()[:6]
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for arcname, path in entries:
+            try:
+                source = storage.open(path, 'rb')
+            except (FileNotFoundError, OSError):
+                print(f"Warning: design file missing from storage: {path}")
+                continue
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.compress_type = compress_type_for(arcname)
+            with source, archive.open(info, 'w', force_zip64=True) as target:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    target.write(data)
+                    yield from _pending(sink)
+            yield from _pending(sink)
+    yield from _pending(sink)
+
+
+def _pending(sink):
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def write_zip(entries, output_path, storage=None):
+    """Stream `entries` into a single ZIP file at `output_path`.
+
+    Written to a `.part` file first and renamed, so a half-written archive is
+    never served.
+    """
+    partial_path = f"{output_path}.part"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(partial_path, 'wb') as output:
+        for data in stream_zip(entries, storage=storage):
+            output.write(data)
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def append_zip(entries, zip_path, storage=None, chunk_size=CHUNK_SIZE):
+    """Add `entries` to the ZIP at `zip_path` (created if missing) in place.
+
+    Existing members are left untouched; only the central directory is
+    rewritten. Entries already in the archive or missing from storage are
+    skipped. Returns the arcnames of `entries` that are now in the archive
+    (added, or already there from an interrupted earlier run).
+    """
+    storage = storage or default_storage
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    date_time = timezone.localtime().timetuple()[:6]
+    added = []
+    with zipfile.ZipFile(zip_path, 'a', allowZip64=True) as archive:
+        present = set(archive.namelist())
+        for arcname, path in entries:
+            if arcname in present:
+                added.append(arcname)
+                continue
+            try:
+                source = storage.open(path, 'rb')
+            except (FileNotFoundError, OSError):
+                print(f"Warning: design file missing from storage: {path}")
+                continue
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.compress_type = compress_type_for(arcname)
+            with source, archive.open(info, 'w', force_zip64=True) as target:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    target.write(data)
+            present.add(arcname)
+            added.append(arcname)
+    return added
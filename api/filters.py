@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from rest_framework.filters import BaseFilterBackend
+
+from .dates import shortcut_range, month_range
+from .search import search_orders
+
+
+class BusinessDateFilterBackend(BaseFilterBackend):
+    """
+    Turns the `specific_date`, `date` (today / yesterday / this_week /
+    this_month) and `month` query parameters into half-open range predicates
+    on the view's `business_date_field`, so the filter is an index range
+    scan instead of a per-row date cast.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'business_date_field', 'business_date')
+        for start, end in self.get_ranges(request):
+            queryset = queryset.filter(**{f'{field}__gte': start, f'{field}__lt': end})
+        return queryset
+
+    def get_ranges(self, request):
+        specific_date = request.query_params.get('specific_date')
+        date_filter = request.query_params.get('date')
+        month = request.query_params.get('month')
+        ranges = []
+
+        if specific_date:
+            try:
+                day = datetime.strptime(specific_date, '%Y-%m-%d').date()
+                ranges.append((day, day + timedelta(days=1)))
+            except ValueError:
+                pass
+        elif date_filter:
+            date_range = shortcut_range(date_filter)
+            if date_range:
+                ranges.append(date_range)
+
+        if month:
+            try:
+                ranges.append(month_range(int(month)))
+            except ValueError:
+                # Not a month number (or out of range); ignore like before.
+                pass
+        return ranges
+
+
+class OrderSearchFilterBackend(BaseFilterBackend):
+    """
+    `?search=` over unique_id, phone, name and seller username through the
+    search indexes (see api.search); exact matches rank first.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '')
+        return search_orders(queryset, term) if term.strip() else queryset
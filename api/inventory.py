@@ -0,0 +1,136 @@
+"""
+Inventory reservation for orders.
+
+Stock changes for an order are collected per (product name, size, color) key
+and applied together: every key is resolved in one query, the rows are locked
+in primary-key order (so two orders touching the same variants can never
+deadlock), and each change is a conditional `UPDATE ... SET quantity =
+quantity + n` that refuses to go below zero. All shortages are reported at
+once instead of failing on the first one.
+"""
+
+from collections import Counter
+from functools import reduce
+import operator
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import catalog
+from .models import InventoryItem
+
+
+class InventoryShortage(Exception):
+    """Raised when one or more variants cannot cover the requested stock."""
+
+    def __init__(self, messages):
+        super().__init__("; ".join(messages))
+        self.messages = messages
+
+
+class InventoryReservation:
+    """Accumulates stock deltas per variant key and applies them atomically."""
+
+    def __init__(self):
+        self.changes = Counter()
+
+    def take(self, product_name, size, color, quantity=1):
+        self.changes[(product_name, size, color)] -= quantity
+        return self
+
+    def release(self, product_name, size, color, quantity=1):
+        self.changes[(product_name, size, color)] += quantity
+        return self
+
+    def take_items(self, items):
+        for item in items:
+            self.take(*_item_fields(item))
+        return self
+
+    def release_items(self, items):
+        for item in items:
+            self.release(*_item_fields(item))
+        return self
+
+    @property
+    def pending(self):
+        return {key: delta for key, delta in self.changes.items() if delta}
+
+    def resolve(self, keys, lock=False):
+        """Fetch every variant for `keys` in one query, keyed by variant key."""
+        if not keys:
+            return {}
+        condition = reduce(
+            operator.or_,
+            (Q(product__name=name, size=size, color=color) for name, size, color in keys),
+        )
+        queryset = InventoryItem.objects.filter(condition).order_by("id")
+        if lock:
+            queryset = queryset.select_for_update(of=("self",))
+        rows = queryset.values_list("id", "product__name", "size", "color", "quantity")
+        return {(name, size, color): (pk, quantity) for pk, name, size, color, quantity in rows}
+
+    def shortages(self, resolved=None):
+        """Messages for every key the current stock cannot cover."""
+        pending = self.pending
+        if resolved is None:
+            resolved = self.resolve(list(pending))
+        messages = []
+        for (name, size, color), delta in pending.items():
+            if delta >= 0:
+                continue
+            row = resolved.get((name, size, color))
+            if row is None:
+                messages.append(f"Inventory item not found for {name} (Size: {size}, Color: {color}).")
+            elif row[1] + delta < 0:
+                messages.append(
+                    f"Insufficient stock for {name} (Size: {size}, Color: {color}). Available: {row[1]}"
+                )
+        return messages
+
+    def check(self):
+        """Raise InventoryShortage without touching stock."""
+        messages = self.shortages()
+        if messages:
+            raise InventoryShortage(messages)
+
+    def apply(self):
+        """Lock, verify and apply every pending change, or none of them."""
+        pending = self.pending
+        if not pending:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            resolved = self.resolve(list(pending), lock=True)
+            messages = self.shortages(resolved)
+            if messages:
+                raise InventoryShortage(messages)
+
+            # Apply in primary-key order, the same order the rows were locked in.
+            for key, (pk, _quantity) in sorted(
+                ((key, row) for key, row in resolved.items() if key in pending), key=lambda entry: entry[1][0]
+            ):
+                delta = pending[key]
+                updated = InventoryItem.objects.filter(pk=pk, quantity__gte=max(-delta, 0)).update(
+                    quantity=F("quantity") + delta, updated_at=now
+                )
+                if not updated:
+                    # Only reachable on backends without row locks (SQLite
+                    # serialises writers, so not there either).
+                    name, size, color = key
+                    raise InventoryShortage([f"Insufficient stock for {name} (Size: {size}, Color: {color})."])
+
+            for name, size, color in (key for key, delta in pending.items() if delta > 0 and key not in resolved):
+                print(f"Warning: Inventory item not found for restocked item: {name}, {size}, {color}")
+
+            # Stock moved with UPDATEs, which send no signals; refresh the catalog.
+            transaction.on_commit(catalog.invalidate)
+
+        self.changes.clear()
+
+
+def _item_fields(item):
+    if isinstance(item, dict):
+        return item.get("type"), item.get("size"), item.get("color")
+    return item.type, item.size, item.color
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api import recipients
+
+
+class Command(BaseCommand):
+    help = "Link existing orders to the recipient directory, creating recipients as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Orders per transaction.')
+
+    def handle(self, *args, **options):
+        def progress(linked, last_id):
+            self.stdout.write(f"Linked {linked} orders (up to id {last_id})")
+
+        linked = recipients.backfill(options['chunk_size'], progress=progress)
+        self.stdout.write(f"Done: {linked} orders linked")
@@ -0,0 +1,66 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.models import Design, Mockup
+from api.storage import add_reference, blob_storage, is_blob_name
+
+
+class Command(BaseCommand):
+    help = "Move existing design and mockup files into content-addressed blob storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be moved without changing anything.")
+        parser.add_argument(
+            '--delete-originals', action='store_true',
+            help="Remove the old files once no Design or Mockup row references them.",
+        )
+
+    def handle(self, *args, **options):
+        storage = blob_storage()
+        moved = missing = 0
+        blobs = set()
+        originals = set()
+
+        for model in (Design, Mockup):
+            rows = (
+                model.objects.exclude(file='').exclude(file__startswith='blobs/')
+                .values_list('id', 'file', 'original_filename')
+            )
+            for pk, name, original_filename in rows.iterator(chunk_size=options['chunk_size']):
+                if not default_storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f"Missing file for {model.__name__} {pk}: {name}")
+                    continue
+                if options['dry_run']:
+                    moved += 1
+                    continue
+                with default_storage.open(name, 'rb') as source:
+                    blob_name = storage.save(name, File(source, name=name))
+                # Queryset update: the signal handlers are not involved, so the
+                # reference is counted explicitly.
+                model.objects.filter(pk=pk).update(
+                    file=blob_name, original_filename=original_filename or os.path.basename(name)
+                )
+                add_reference(blob_name)
+                blobs.add(blob_name)
+                originals.add(name)
+                moved += 1
+
+        deleted = 0
+        if options['delete_originals'] and not options['dry_run']:
+            for name in sorted(originals):
+                if is_blob_name(name):
+                    continue
+                if Design.objects.filter(file=name).exists() or Mockup.objects.filter(file=name).exists():
+                    continue
+                default_storage.delete(name)
+                deleted += 1
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(
+            f"{verb} {moved} files into {len(blobs)} blobs; {missing} missing; {deleted} originals deleted"
+        )
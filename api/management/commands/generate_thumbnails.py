@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api import thumbnails
+from api.models import StoredBlob
+
+
+class Command(BaseCommand):
+    help = "Render missing mockup and design thumbnails and record them on their blobs (failed ones included)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+
+    def handle(self, *args, **options):
+        names = StoredBlob.objects.filter(ref_count__gt=0).values_list('name', flat=True)
+
+        tasks = {}
+        missing = 0
+        for name in names.iterator():
+            if not thumbnails.is_thumbnailable(name):
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                thumbnails.record(name, FileNotFoundError(name))
+                continue
+            targets = [
+                (default_storage.path(thumbnails.thumbnail_name(name, size_name)), max_side)
+                for size_name, max_side in thumbnails.missing_sizes(name)
+            ]
+            if targets:
+                tasks[name] = (default_storage.path(name), targets)
+            else:
+                thumbnails.record(name)
+
+        rendered = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(thumbnails.render_sizes, *task): name for name, task in tasks.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                thumbnails.record(name, future.exception())
+                if future.exception() is None:
+                    rendered += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"Failed {name}: {future.exception()}")
+        self.stdout.write(f"Rendered thumbnails for {rendered} files; {failed} failed; {missing} missing")
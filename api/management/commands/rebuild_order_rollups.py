@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the order rollups from the orders (all days, or an inclusive date range)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First business date to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end-date', help='Last business date to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date'] else None
+            end = datetime.strptime(options['end_date'], '%Y-%m-%d').date() + timedelta(days=1) if options['end_date'] else None
+        except ValueError:
+            raise CommandError('Date format should be YYYY-MM-DD.')
+        count = rollups.rebuild(start, end)
+        self.stdout.write(f"Rebuilt {count} rollup rows")
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main order endpoints against a generated dataset in a throwaway test database. "
+        "Writes the results as JSON and fails if they regress past --threshold from --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', default='10k', help="Dataset size: 10k, 100k, 1m or a number of orders.")
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per scenario.')
+        parser.add_argument('--only', nargs='*', help='Scenario names to run (default: all).')
+        parser.add_argument('--output', help='Results file (default: benchmark_results/results-<orders>.json).')
+        parser.add_argument('--baseline', help='Results file to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed growth in median time and peak memory, as a fraction (default 0.25).')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database and media between runs and reuse the generated dataset. '
+                                 'With SQLite set DJANGO_TEST_DB_NAME to a file for this to persist.')
+
+    def handle(self, *args, **options):
+        try:
+            orders = benchmarks.parse_size(options['orders'])
+        except benchmarks.BenchmarkError as exc:
+            raise CommandError(str(exc))
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+
+        keepdb = options['keepdb']
+        media_root = os.path.join(tempfile.gettempdir(), f"order-benchmarks-{orders}")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, DEBUG=False, THUMBNAIL_MODE='off'):
+                generator = benchmarks.DatasetGenerator(orders, progress=self.stdout.write)
+                if keepdb and generator.exists():
+                    self.stdout.write(f"Reusing the generated dataset ({orders} orders)")
+                else:
+                    generator.generate()
+                suite = benchmarks.BenchmarkSuite(repeat=options['repeat'])
+                results = {
+                    'meta': {**benchmarks.metadata(orders), 'repeat': options['repeat'], 'batch': suite.batch},
+                    'results': suite.run(only=options['only'], progress=self._report),
+                }
+        except benchmarks.BenchmarkError as exc:
+            raise CommandError(str(exc))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+            if not keepdb:
+                shutil.rmtree(media_root, ignore_errors=True)
+
+        output = options['output'] or os.path.join(settings.BASE_DIR, 'benchmark_results', f"results-{orders}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, indent=2)
+        self.stdout.write(f"Results written to {output}")
+
+        if baseline is not None:
+            try:
+                regressions = benchmarks.compare(results, baseline, options['threshold'])
+            except benchmarks.BenchmarkError as exc:
+                raise CommandError(str(exc))
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"{name:<30} median {result['median_ms'] or 0:>9.1f} ms  "
+            f"{result['queries']:>4} queries  peak {result['peak_memory_kb']:>9.0f} KiB"
+        )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued courier export jobs (runs until stopped unless --once is given)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the jobs that are queued now, then exit.")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds to wait between polls.")
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f"Processed {count} export job(s)")
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,251 @@
+"""
+Access-checked serving of MEDIA_ROOT.
+
+Every /media/ request goes through `serve_media`, which identifies the
+caller and checks ownership. Browsers send no Authorization header for
+`<img src>` loads and download links, so the API hands out signed URLs
+(`signed_url`: user id, path and expiry signed with SECRET_KEY) for uploads,
+thumbnails and ZIPs; a valid signature stands for that user. Requests without
+one are authenticated with the API's authentication classes. Then:
+
+- products/ (catalog images) are public;
+- blobs/ (design and mockup uploads) and their thumbnails/ are served to
+  staff and to users owning a Design or Mockup pointing at that content;
+- the legacy per-user designs/ and mockups/ folders likewise;
+- everything else (export and collection ZIPs, ...) is staff only.
+
+Refused and missing files both answer 404. The bytes are then sent according
+to settings.MEDIA_SERVE_MODE:
+
+- 'x-accel': an empty response with `X-Accel-Redirect` to MEDIA_ACCEL_PREFIX
+  (an nginx `internal` location aliased to MEDIA_ROOT);
+- 'x-sendfile': an empty response with `X-Sendfile` (Apache / lighttpd);
+- 'django' (default): a FileResponse honouring single `Range` requests. Under
+  gunicorn the file object is handed to `wsgi.file_wrapper`, which sends it
+  with os.sendfile() without copying it through Python.
+
+Content-addressed files (blobs/, thumbnails/) never change under the same
+name and are sent with a one-year immutable Cache-Control; everything else
+must be revalidated (ETag / Last-Modified, answered with 304). Signed URLs
+stay the same for MEDIA_SIGNED_URL_TTL seconds (and are valid for up to twice
+that), so repeated API responses keep pointing at browser-cached copies.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Design, Mockup
+from .storage import BLOB_PREFIX, digest_from_name
+
+PUBLIC_PREFIXES = ('products/',)
+IMMUTABLE_PREFIXES = (f'{BLOB_PREFIX}/', 'thumbnails/')
+OWNED_PREFIXES = ('designs/', 'mockups/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """A file object limited to `length` bytes from `start`.
+
+    Keeps `fileno()` so wsgi.file_wrapper can still os.sendfile() it; the
+    server sends Content-Length bytes from the current offset.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _signature(user_id, expires, path):
+    return signing.Signer(salt='api.media').signature(f"{user_id}:{expires}:{path}")
+
+
+def signed_url_ttl():
+    return getattr(settings, 'MEDIA_SIGNED_URL_TTL', 6 * 60 * 60)
+
+
+def signing_window():
+    """Index of the current MEDIA_SIGNED_URL_TTL window; signed URLs change with it."""
+    return int(time.time()) // signed_url_ttl()
+
+
+def signed_url(path, user):
+    """MEDIA_URL link to `path` that `user` can open without an Authorization header."""
+    url = default_storage.url(path)
+    if user is None or not user.is_authenticated or path.startswith(PUBLIC_PREFIXES):
+        return url
+    # Rounded up to the next window boundary, so the URL is stable within it.
+    expires = (signing_window() + 2) * signed_url_ttl()
+    return f"{url}?{urlencode({'u': user.pk, 'e': expires, 's': _signature(user.pk, expires, path)})}"
+
+
+def signed_user(request, path):
+    """The user a valid, unexpired signature on this request stands for, else None."""
+    try:
+        user_id, expires = int(request.GET['u']), int(request.GET['e'])
+    except (KeyError, ValueError):
+        return None
+    if expires < time.time() or not constant_time_compare(_signature(user_id, expires, path), request.GET.get('s', '')):
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+def authenticated_user(request):
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user
+    except Exception:
+        return None
+
+
+def can_access(user, path):
+    if path.startswith(PUBLIC_PREFIXES):
+        return True
+    if user is None or not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+
+    if path.startswith(f'{BLOB_PREFIX}/') or path.startswith(OWNED_PREFIXES):
+        match = Q(file=path)
+    elif path.startswith('thumbnails/'):
+        # thumbnails/<source digest>/<size>.webp
+        digest = path.split('/')[1] if path.count('/') >= 2 else ''
+        if not digest:
+            return False
+        match = Q(file__startswith=f"{BLOB_PREFIX}/{digest[:2]}/{digest}.")
+    else:
+        return False
+    return (
+        Design.objects.filter(match, user=user).exists()
+        or Mockup.objects.filter(match, user=user).exists()
+    )
+
+
+def validators(path, stat):
+    if path.startswith(f'{BLOB_PREFIX}/'):
+        etag = quote_etag(digest_from_name(path))
+    else:
+        etag = quote_etag(f"{stat.st_size:x}-{int(stat.st_mtime_ns):x}")
+    return etag, int(stat.st_mtime)
+
+
+def cache_headers(response, path, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    scope = 'public' if path.startswith(PUBLIC_PREFIXES) else 'private'
+    if path.startswith(IMMUTABLE_PREFIXES):
+        response['Cache-Control'] = f'{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'{scope}, no-cache'
+    if scope == 'private':
+        response['Vary'] = 'Authorization, Cookie'
+    return response
+
+
+def parse_range(header, size):
+    """(start, length) for a single satisfiable byte range, None for no/ignored
+    Range, or False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes.
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or end < start:
+        return False
+    return start, end - start + 1
+
+
+def _file_response(request, full_path, path, stat, content_type):
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if request.headers.get('If-Range') and request.headers['If-Range'] != validators(path, stat)[0]:
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    handle = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(RangeFile(handle, start, length), content_type=content_type, status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    path = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    user = signed_user(request, path) if 's' in request.GET else authenticated_user(request)
+    if not can_access(user, path) or not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    stat = os.stat(full_path)
+    etag, last_modified = validators(path, stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return cache_headers(not_modified, path, etag, last_modified)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{quote(path)}"
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = _file_response(request, full_path, path, stat, content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    return cache_headers(response, path, etag, last_modified)
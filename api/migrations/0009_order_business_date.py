@@ -0,0 +1,44 @@
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_business_date(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    tz = ZoneInfo(getattr(settings, 'BUSINESS_TIME_ZONE', settings.TIME_ZONE))
+    batch = []
+    for order in Order.objects.only('id', 'created_at').iterator(chunk_size=2000):
+        order.business_date = timezone.localtime(order.created_at, tz).date()
+        batch.append(order)
+        if len(batch) >= 2000:
+            Order.objects.bulk_update(batch, ['business_date'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['business_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_order_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='business_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_business_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='business_date',
+            field=models.DateField(db_index=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'business_date'], name='order_user_business_date_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    # Start every seller's counter at the highest number already issued.
+    Order = apps.get_model('api', 'Order')
+    OrderSequence = apps.get_model('api', 'OrderSequence')
+    last_numbers = {}
+    for user_id, unique_id in Order.objects.values_list('user_id', 'unique_id').iterator(chunk_size=2000):
+        try:
+            number = int(unique_id.split('-')[-1])
+        except ValueError:
+            continue
+        if number > last_numbers.get(user_id, 0):
+            last_numbers[user_id] = number
+    OrderSequence.objects.bulk_create(
+        [OrderSequence(user_id=user_id, last_number=number) for user_id, number in last_numbers.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_order_business_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:44
+
+import api.models
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_courierexportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='design',
+            name='original_filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='mockup',
+            name='original_filename',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='design',
+            name='file',
+            field=models.FileField(storage=api.storage.blob_storage, upload_to=api.models.user_design_path),
+        ),
+        migrations.AlterField(
+            model_name='mockup',
+            name='file',
+            field=models.ImageField(storage=api.storage.blob_storage, upload_to=api.models.user_mockup_path),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_content_addressed_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierSyncState',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_write_date', models.CharField(blank=True, default='', max_length=32)),
+                ('last_record_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:55
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def build_rollups(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderRollup = apps.get_model('api', 'OrderRollup')
+    totals = (
+        Order.objects.order_by()
+        .values('user_id', 'business_date', 'status')
+        .annotate(
+            order_count=Count('id'),
+            revenue_sum=Coalesce(Sum('price'), Value(Decimal(0))),
+            profit_sum=Coalesce(Sum('profit'), Value(0)),
+        )
+    )
+    OrderRollup.objects.bulk_create(
+        [
+            OrderRollup(
+                user_id=row['user_id'], business_date=row['business_date'], status=row['status'],
+                order_count=row['order_count'], revenue=row['revenue_sum'], profit=row['profit_sum'],
+            )
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_couriersyncstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('returned', 'Returned')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('profit', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['business_date', 'status'], name='order_rollup_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'business_date', 'status'), name='order_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
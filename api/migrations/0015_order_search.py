@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+from api.search import ensure_search_index
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_order_search_delete",
+    "DROP TRIGGER IF EXISTS api_order_search_update",
+    "DROP TRIGGER IF EXISTS api_order_search_insert",
+    "DROP TABLE IF EXISTS api_order_search",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS user_username_trgm_idx",
+    "DROP INDEX IF EXISTS order_unique_id_trgm_idx",
+    "DROP INDEX IF EXISTS order_phone_trgm_idx",
+    "DROP INDEX IF EXISTS order_name_trgm_idx",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 table + sync triggers on SQLite, pg_trgm GIN indexes on PostgreSQL
+    ensure_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_orderrollup'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='phone',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_recipient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storedblob',
+            name='sha256',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+    ]
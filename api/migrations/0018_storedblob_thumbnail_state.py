@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_storedblob_sha256_not_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedblob',
+            name='thumbnail_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storedblob',
+            name='thumbnail_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storedblob',
+            name='thumbnail_sizes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='storedblob',
+            name='thumbnail_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# LIKE 'prefix%' only uses a B-tree index under the C collation unless the
+# column is indexed with varchar_pattern_ops; Django adds one for db_index /
+# unique fields, not for Meta.indexes or UniqueConstraint (see api.search.prefix_q).
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS recipient_user_phone_like_idx ON api_recipient (user_id, phone varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS recipient_phone_like_idx ON api_recipient (phone varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS recipient_user_name_like_idx ON api_recipient (user_id, name varchar_pattern_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS recipient_user_name_like_idx",
+    "DROP INDEX IF EXISTS recipient_phone_like_idx",
+    "DROP INDEX IF EXISTS recipient_user_phone_like_idx",
+]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    # SQLite seeks a range on the regular indexes instead
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_storedblob_thumbnail_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
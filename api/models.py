@@ -1,34 +1,80 @@
-from django.db import models
+import os
+
+from django.db import connection, models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from .dates import to_business_date
+from .storage import blob_storage
 def user_mockup_path(instance, filename):
-    # File will be uploaded to MEDIA_ROOT/mockups/user_<id>/<filename>
+    # Nominal upload path; blob_storage keeps only the extension and stores
+    # the file under MEDIA_ROOT/blobs/ by content hash
     return f"mockups/user_{instance.user.id}/{filename}"
 
 def user_design_path(instance, filename):
-    # File will be uploaded to MEDIA_ROOT/designs/user_<id>/<filename>
+    # Nominal upload path, see user_mockup_path
     return f"designs/user_{instance.user.id}/{filename}"
 
 def product_image_path(instance, filename):
     # File will be uploaded to MEDIA_ROOT/products/<product_name>/<filename>
     return f"products/{instance.name}/{filename}"
 
+def remember_original_filename(instance):
+    # A file that has not been committed yet is a fresh upload
+    if instance.file and not instance.file._committed:
+        instance.original_filename = os.path.basename(instance.file.name)[:255]
+
+class StoredBlob(models.Model):
+    """A content-addressed file shared by the Design/Mockup rows that use it."""
+    name = models.CharField(max_length=255, unique=True)
+    # Not unique: the same bytes uploaded as .png and .jpg are two blobs.
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Thumbnail rendering (see api.thumbnails), read by the serializers
+    # instead of checking the thumbnail files on every request.
+    THUMBNAIL_STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+    thumbnail_status = models.CharField(max_length=10, choices=THUMBNAIL_STATUS_CHOICES, default="pending")
+    thumbnail_sizes = models.JSONField(default=list, blank=True)
+    thumbnail_attempts = models.PositiveSmallIntegerField(default=0)
+    # Earliest time a render may be (re)queued; also covers renders in flight.
+    thumbnail_retry_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
 class Design(models.Model):
     """Model for storing reusable design files per user"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="designs")
     name = models.CharField(max_length=100)
-    file = models.FileField(upload_to=user_design_path)
+    file = models.FileField(upload_to=user_design_path, storage=blob_storage)
+    # Uploaded filename; the stored name is the content hash (see api.storage)
+    original_filename = models.CharField(max_length=255, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        remember_original_filename(self)
+        super().save(*args, **kwargs)
+
+    @property
+    def display_filename(self):
+        return self.original_filename or os.path.basename(self.file.name)
+
 class Mockup(models.Model):
     """Model for storing reusable mockup files per user, potentially linked to a design"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="mockups")
     name = models.CharField(max_length=100)
-    file = models.ImageField(upload_to=user_mockup_path)
+    file = models.ImageField(upload_to=user_mockup_path, storage=blob_storage)
+    original_filename = models.CharField(max_length=255, blank=True, default="")
     # Link to a specific design (optional)
     linked_design = models.ForeignKey(
         Design, 
@@ -43,6 +89,45 @@ class Mockup(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        remember_original_filename(self)
+        super().save(*args, **kwargs)
+
+    @property
+    def display_filename(self):
+        return self.original_filename or os.path.basename(self.file.name)
+
+
+class Recipient(models.Model):
+    """A seller's customer, keyed by normalized phone number.
+
+    Holds the name/area of the customer's latest order; orders point here
+    through Order.recipient (see api.recipients).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recipients")
+    # Digits only, local form (see api.recipients.normalize_phone)
+    phone = models.CharField(max_length=20)
+    name = models.CharField(max_length=100)
+    area = models.CharField(max_length=100, blank=True, default="")
+    areaId = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "phone"], name="recipient_user_phone_unique"),
+        ]
+        indexes = [
+            # Prefix autocomplete: phone within a seller uses the unique index,
+            # across sellers (staff) this one; names within a seller. On
+            # PostgreSQL LIKE uses varchar_pattern_ops copies (migration 0019).
+            models.Index(fields=["phone"], name="recipient_phone_idx"),
+            models.Index(fields=["user", "name"], name="recipient_user_name_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.phone})"
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -57,7 +142,8 @@ class Order(models.Model):
     profit = models.IntegerField(null=True , blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     name = models.CharField(max_length=100)
-    phone = models.CharField(max_length=20)
+    # Indexed for phone prefix search (see api.search)
+    phone = models.CharField(max_length=20, db_index=True)
     area = models.CharField(max_length=100)
     areaId = models.IntegerField(max_length=100 , null=True , blank=True)
     cod = models.BooleanField(default=False)
@@ -66,6 +152,25 @@ class Order(models.Model):
     unique_id = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Local calendar day (settings.BUSINESS_TIME_ZONE) the order was placed on.
+    # Date filters range-scan this instead of casting created_at per row.
+    business_date = models.DateField(db_index=True, editable=False)
+    # Set from phone on save (see api.recipients)
+    recipient = models.ForeignKey(
+        Recipient, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="orders",
+        db_index=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Recipient order counts, overall and recent
+            models.Index(fields=["recipient", "created_at"], name="order_recipient_created_idx"),
+            # Keyset pagination seeks on (created_at, id), scoped per seller
+            # for non-staff users.
+            models.Index(fields=["user", "created_at", "id"], name="order_user_created_id_idx"),
+            models.Index(fields=["created_at", "id"], name="order_created_id_idx"),
+            models.Index(fields=["user", "business_date"], name="order_user_business_date_idx"),
+        ]
     
     def __str__(self):
         return self.unique_id
@@ -73,20 +178,43 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         # Generate unique_id if not provided
         if not self.unique_id and self.user:
-            latest_order = Order.objects.filter(user=self.user).order_by("-id").first()
-            order_number = 1
-            if latest_order:
-                try:
-                    last_unique_id = latest_order.unique_id
-                    last_order_number = int(last_unique_id.split("-")[-1])
-                    order_number = last_order_number + 1
-                except:
-                    order_number = latest_order.id + 1 # Fallback
-            
+            order_number = OrderSequence.reserve(self.user_id)[0]
             self.unique_id = f"{self.user.username}-{order_number}"
+
+        if self.business_date is None:
+            # created_at is only stamped inside super().save(); "now" is the
+            # same instant for the purpose of picking the local day.
+            self.business_date = to_business_date(self.created_at or timezone.now())
         
         super().save(*args, **kwargs)
 
+class OrderSequence(models.Model):
+    """Last order number handed out per user; backs Order.unique_id."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="order_sequence")
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.last_number}"
+
+    @classmethod
+    def reserve(cls, user_id, count=1):
+        """Atomically reserve `count` consecutive order numbers for a user.
+
+        A single upsert bumps the counter and returns the new value, so
+        concurrent workers never see the same number and no row scan of
+        Order is needed. Returns the reserved numbers as a range.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, last_number) VALUES (%s, %s) "
+                f"ON CONFLICT (user_id) DO UPDATE SET last_number = {table}.last_number + %s "
+                f"RETURNING last_number",
+                [user_id, count, count],
+            )
+            last_number = cursor.fetchone()[0]
+        return range(last_number - count + 1, last_number + 1)
+
 class OrderItem(models.Model):
     
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
@@ -142,3 +270,73 @@ class UserProductPrice(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}: {self.custom_price}"
+
+
+class CourierExportJob(models.Model):
+    """A queued submission of shipped orders to the courier.
+
+    Created by OrderViewSet.export and processed by the `run_export_jobs`
+    management command (see api.jobs).
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued", db_index=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="export_jobs")
+    order_ids = models.JSONField(default=list)
+    chunk_size = models.PositiveIntegerField(default=50)
+    total = models.PositiveIntegerField(default=0)
+    submitted = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export job {self.id} ({self.status})"
+
+
+class CourierSyncState(models.Model):
+    """High-water mark of a feed pulled from the courier (see api.returns).
+
+    `last_write_date` is kept in the courier's own format so it can be sent
+    back verbatim; `last_record_id` breaks ties between records written in
+    the same second.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    last_write_date = models.CharField(max_length=32, blank=True, default="")
+    last_record_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_write_date or '-'} #{self.last_record_id}"
+
+
+class OrderRollup(models.Model):
+    """Order count, revenue and profit per seller, business day and status.
+
+    Maintained incrementally alongside order writes (see api.rollups).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="order_rollups")
+    business_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    profit = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "business_date", "status"], name="order_rollup_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["business_date", "status"], name="order_rollup_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.business_date} {self.status}: {self.order_count}"
@@ -0,0 +1,160 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OwnerAssetPagination(PageNumberPagination):
+    """Pages through an order owner's mockup or design library."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on (ordering field, id).
+
+    The cursor carries the last row's ordering value and id, and the next page
+    is a range seek `(field, id) < (value, id)` on the composite index rather
+    than an OFFSET, so page N costs the same as page 1. The ordering field is
+    whatever the filter backends left on the queryset (e.g. `?ordering=` from
+    OrderingFilter), falling back to the view's default ordering. When the
+    queryset carries the `rank_annotation` (search relevance), rows are ordered
+    by it first and the cursor records it too.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    rank_annotation = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field_name, self.descending = self.get_ordering(queryset, view)
+        field = queryset.model._meta.get_field(self.field_name)
+        self.rank = self.rank_annotation if self.rank_annotation in queryset.query.annotations else None
+
+        cursor = self.decode_cursor(request)
+        # Walking backwards (previous link) flips the scan direction and the
+        # page is re-reversed below.
+        self.reverse = cursor is not None and cursor['r']
+        scan_descending = self.descending != self.reverse
+        prefix = '-' if scan_descending else ''
+        ordering = [f'{prefix}{self.field_name}', f'{prefix}id']
+        if self.rank:
+            ordering.insert(0, f"{'-' if self.reverse else ''}{self.rank}")
+        queryset = queryset.order_by(*ordering)
+
+        if cursor is not None:
+            try:
+                value = field.to_python(cursor['v'])
+            except Exception:
+                raise NotFound(self.invalid_cursor_message)
+            op = 'lt' if scan_descending else 'gt'
+            seek = (
+                Q(**{f'{self.field_name}__{op}': value})
+                | Q(**{self.field_name: value, f'id__{op}': cursor['id']})
+            )
+            if self.rank:
+                if cursor['k'] is None:
+                    raise NotFound(self.invalid_cursor_message)
+                rank_op = 'lt' if self.reverse else 'gt'
+                seek = Q(**{f'{self.rank}__{rank_op}': cursor['k']}) | (Q(**{self.rank: cursor['k']}) & seek)
+            queryset = queryset.filter(seek)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, queryset, view):
+        ordering = [
+            entry for entry in queryset.query.order_by
+            if not (isinstance(entry, str) and self.rank_annotation and entry.lstrip('-') == self.rank_annotation)
+        ] or list(getattr(view, 'ordering', None) or ['-created_at'])
+        first = ordering[0]
+        if not isinstance(first, str):
+            first = '-created_at'
+        return first.lstrip('-'), first.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            rank = cursor.get('k')
+            return {
+                'r': bool(cursor['r']), 'v': cursor['v'], 'id': int(cursor['id']),
+                'k': None if rank is None else int(rank),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field_name)
+        cursor = {'r': reverse, 'v': None if value is None else str(value), 'id': obj.pk}
+        if self.rank:
+            cursor['k'] = getattr(obj, self.rank)
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Stepped back past the first row; the next page is the start again.
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OrderCursorPagination(KeysetPagination):
+    """Orders newest first, seeking on the (created_at, id) indexes."""
+    page_size = 50
+    rank_annotation = 'search_rank'
@@ -0,0 +1,80 @@
+"""
+Price book for order cost/profit calculation.
+
+A PriceBook answers "what does this seller pay for one unit of product X" (the
+seller's UserProductPrice if there is one, otherwise InventoryProduct.price).
+Lookups are loaded in bulk - one query for base prices and one for custom
+prices - and memoized on the instance for the request. Nothing is kept
+across requests: profit is stored with the order, so it must be computed from
+the prices committed at that moment, not from a copy another worker may still
+hold after a price edit.
+"""
+
+from .models import InventoryProduct, UserProductPrice
+
+# Sentinel for "no custom price for this seller/product", so misses are memoized too.
+NO_CUSTOM_PRICE = object()
+
+
+class PriceBook:
+    """Per-request view over product prices; see the module docstring."""
+
+    def __init__(self):
+        self._base = {}    # product name -> (product id, base price) or None if unknown
+        self._custom = {}  # (user id, product id) -> custom price or NO_CUSTOM_PRICE
+
+    def load(self, user_ids, product_names):
+        """Make sure every (user, product) pair is priced; at most two queries."""
+        names = {name for name in product_names if name and name not in self._base}
+        if names:
+            loaded = {name: None for name in names}
+            for product_id, name, price in InventoryProduct.objects.filter(name__in=names).values_list(
+                "id", "name", "price"
+            ):
+                loaded[name] = (product_id, price)
+            self._base.update(loaded)
+
+        product_ids = {
+            self._base[name][0] for name in product_names if name and self._base.get(name) is not None
+        }
+        pairs = {
+            (user_id, product_id)
+            for user_id in user_ids
+            for product_id in product_ids
+            if (user_id, product_id) not in self._custom
+        }
+        if pairs:
+            loaded = {pair: NO_CUSTOM_PRICE for pair in pairs}
+            for user_id, product_id, price in UserProductPrice.objects.filter(
+                user_id__in={user_id for user_id, _ in pairs},
+                product_id__in={product_id for _, product_id in pairs},
+            ).values_list("user_id", "product_id", "custom_price"):
+                if (user_id, product_id) in loaded:
+                    loaded[(user_id, product_id)] = price
+            self._custom.update(loaded)
+        return self
+
+    def unit_cost(self, user_id, product_name):
+        """What the seller pays for one unit, or None for an unknown product."""
+        self.load([user_id], [product_name])
+        base = self._base.get(product_name)
+        if base is None:
+            return None
+        product_id, price = base
+        custom = self._custom.get((user_id, product_id), NO_CUSTOM_PRICE)
+        if custom is not NO_CUSTOM_PRICE:
+            return custom
+        return price if price is not None else 0
+
+    def total_cost(self, user_id, product_names):
+        """Summed unit cost of `product_names`; unknown products are skipped."""
+        product_names = [name for name in product_names if name]
+        self.load([user_id], product_names)
+        total = 0
+        for name in product_names:
+            cost = self.unit_cost(user_id, name)
+            if cost is None:
+                print(f"Warning: InventoryProduct not found for type: {name}")
+                continue
+            total += cost
+        return total
@@ -0,0 +1,152 @@
+"""
+Opt-in request profiling (settings.PROFILING_ENABLED).
+
+ProfilingMiddleware measures a sample of requests (PROFILING_SAMPLE_RATE) and
+reports, as `Server-Timing` response headers:
+
+- db: time spent executing SQL on every database alias, with the query
+  count, collected through `connection.execute_wrapper` (works with DEBUG
+  off, no query log is kept);
+- serialize: time spent producing serializer `.data` (serializers opt in
+  with TimedDataMixin; SQL run while serializing is counted in db too);
+- total: the whole request, rendering included.
+
+Queries slower than PROFILING_SLOW_QUERY_MS are printed with the first frame
+of our own code that ran them. Requests whose path matches one of
+PROFILING_CPROFILE_PATHS are additionally run under cProfile at
+PROFILING_CPROFILE_SAMPLE_RATE and the stats dumped into
+PROFILING_CPROFILE_DIR (open with `python -m pstats` or snakeviz).
+
+When PROFILING_ENABLED is off the middleware removes itself at startup and
+`span` is a context-variable lookup, so leaving it installed costs nothing.
+"""
+
+import cProfile
+import os
+import random
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+_current = ContextVar('request_profile', default=None)
+
+# Frames from these files are never reported as a query's call site.
+_SKIPPED_FRAMES = (os.sep + 'site-packages' + os.sep, os.sep + 'lib' + os.sep + 'python', __file__)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds):
+        entries = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        entries.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(entries)
+
+
+@contextmanager
+def span(name):
+    """Add the block's wall time to the current request's `name` timing."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+
+class TimedDataMixin:
+    """Times a serializer's `.data` as the request's `serialize` span."""
+
+    @property
+    def data(self):
+        with span('serialize'):
+            return super().data
+
+
+def call_site():
+    """'file:line in function' of the innermost frame outside Django and this module."""
+    root = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(root) and not any(part in frame.filename for part in _SKIPPED_FRAMES):
+            return f"{os.path.relpath(frame.filename, root)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+def _query_timer(profile, slow_seconds):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            profile.queries += 1
+            profile.db_seconds += elapsed
+            if elapsed >= slow_seconds:
+                print(f"Warning: slow query ({elapsed * 1000:.1f} ms) at {call_site()}: {sql[:500]}")
+    return wrapper
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.slow_seconds = getattr(settings, 'PROFILING_SLOW_QUERY_MS', 200) / 1000
+        self.cprofile_paths = [re.compile(pattern) for pattern in getattr(settings, 'PROFILING_CPROFILE_PATHS', [])]
+        self.cprofile_rate = getattr(settings, 'PROFILING_CPROFILE_SAMPLE_RATE', 0.01)
+        self.cprofile_dir = getattr(settings, 'PROFILING_CPROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        profiler = None
+        try:
+            with ExitStack() as stack:
+                wrapper = _query_timer(profile, self.slow_seconds)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(wrapper))
+                if self._should_cprofile(request):
+                    profiler = cProfile.Profile()
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        response['Server-Timing'] = profile.server_timing(time.perf_counter() - profile.started)
+        if profiler is not None:
+            self._dump(profiler, request)
+        return response
+
+    def _should_cprofile(self, request):
+        return (
+            any(pattern.search(request.path) for pattern in self.cprofile_paths)
+            and random.random() < self.cprofile_rate
+        )
+
+    def _dump(self, profiler, request):
+        os.makedirs(self.cprofile_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{os.getpid()}-{random.randrange(10 ** 6)}.prof"
+        profiler.dump_stats(os.path.join(self.cprofile_dir, name))
@@ -0,0 +1,142 @@
+"""
+Recipient directory.
+
+Every order is linked to a Recipient: the seller's customer with that
+normalized phone number (unique per seller). Linking is an
+`INSERT ... ON CONFLICT (user_id, phone) DO UPDATE` that refreshes the
+recipient's name/area from the order and returns its id, so a repeat customer
+costs one statement. `Order.save()` links through the signals in api.signals
+when an order is created or its contact details change; bulk import calls
+`link` for the whole batch. Orders written before the directory existed are
+linked by `manage.py backfill_recipients`.
+
+`autocomplete` answers a phone (or name) prefix from the directory's indexes
+and counts each recipient's orders through the (recipient, created_at) index
+on Order, all in one query.
+"""
+
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import Order, Recipient
+from .search import prefix_q
+
+CONTACT_FIELDS = ('phone', 'name', 'area', 'areaId')
+LOCAL_PREFIXES = ('970', '972')
+
+
+def normalize_phone(phone, partial=False):
+    """Digits of `phone` in local form: '+970 59-912 3456' -> '0599123456'.
+
+    Arabic-Indic digits count as digits. With `partial`, `phone` is the start
+    of a number being typed ('+970 59' -> '059'). Returns '' if there are no
+    digits.
+    """
+    digits = ''.join(
+        str(unicodedata.decimal(char)) for char in phone or '' if unicodedata.decimal(char, None) is not None
+    )
+    if digits.startswith('00'):
+        digits = digits[2:]
+    for prefix in LOCAL_PREFIXES:
+        if digits.startswith(prefix) and (len(digits) == len(prefix) + 9 or partial and len(digits) > len(prefix)):
+            return '0' + digits[len(prefix):]
+    if len(digits) == 9 and digits.startswith('5'):
+        return '0' + digits
+    return digits
+
+
+def contact(order):
+    """The recipient-relevant fields of `order`, or None if any is deferred."""
+    values = order.__dict__
+    if any(field not in values for field in CONTACT_FIELDS):
+        return None
+    return tuple(values[field] for field in CONTACT_FIELDS)
+
+
+def link(orders):
+    """Point each order at its recipient, creating or refreshing recipients.
+
+    Sets `recipient_id` on the instances without saving them. When several
+    orders share a recipient the last one's name/area wins.
+    """
+    latest = {}
+    for order in orders:
+        phone = normalize_phone(order.phone)
+        if not phone:
+            order.recipient_id = None
+            continue
+        latest[(order.user_id, phone)] = order
+    if not latest:
+        return
+    recipients = Recipient.objects.bulk_create(
+        [
+            Recipient(user_id=user_id, phone=phone, name=order.name, area=order.area or '', areaId=order.areaId)
+            for (user_id, phone), order in latest.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'phone'],
+        update_fields=['name', 'area', 'areaId', 'updated_at'],
+    )
+    ids = {(recipient.user_id, recipient.phone): recipient.pk for recipient in recipients}
+    for order in orders:
+        phone = normalize_phone(order.phone)
+        if phone:
+            order.recipient_id = ids[(order.user_id, phone)]
+
+
+def autocomplete(queryset, term, limit=10):
+    """Recipients from `queryset` whose phone (or, without digits, name) starts
+    with `term`, most recently ordering first, with their order counts."""
+    phone = normalize_phone(term, partial=True)
+    if phone:
+        matches = prefix_q('phone', phone)
+    elif len(term.strip()) >= 2:
+        matches = prefix_q('name', term.strip())
+    else:
+        return []
+    since = timezone.now() - timedelta(days=getattr(settings, 'RECIPIENT_RECENT_DAYS', 90))
+    return list(
+        queryset.filter(matches)
+        .annotate(
+            order_count=Count('orders'),
+            recent_order_count=Count('orders', filter=Q(orders__created_at__gte=since)),
+            returned_count=Count('orders', filter=Q(orders__status='returned')),
+            last_order_at=Max('orders__created_at'),
+        )
+        .order_by('-last_order_at', 'name')
+        .values(
+            'id', 'user_id', 'phone', 'name', 'area', 'areaId',
+            'order_count', 'recent_order_count', 'returned_count', 'last_order_at',
+        )[:limit]
+    )
+
+
+def backfill(chunk_size=1000, progress=None):
+    """Link orders that have no recipient yet, `chunk_size` orders per transaction.
+
+    Walks the orders by id so each chunk is an index seek and the process
+    can be interrupted and re-run. Returns the number of orders linked.
+    """
+    linked, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(recipient__isnull=True, id__gt=last_id)
+                .order_by('id')
+                .only('id', 'user_id', *CONTACT_FIELDS)[:chunk_size]
+            )
+            if not orders:
+                return linked
+            last_id = orders[-1].id
+            link(orders)
+            orders = [order for order in orders if order.recipient_id]
+            # bulk_update skips signals and auto_now: nothing else about the order changes.
+            Order.objects.bulk_update(orders, ['recipient'])
+        linked += len(orders)
+        if progress:
+            progress(linked, last_id)
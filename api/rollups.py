@@ -0,0 +1,186 @@
+"""
+Per-seller daily order rollups.
+
+OrderRollup holds, for every (user, business_date, status), the number of
+orders and their summed price and profit. It is kept up to date
+incrementally: each write that changes an order's user, business day,
+status, price or profit subtracts the order's old contribution and adds the
+new one with an `INSERT ... ON CONFLICT DO UPDATE` per touched row, inside the
+same transaction as the order write. `Order.save()` and `delete()` are covered
+by the signals in api.signals, which read the row's stored state first so a
+stale instance cannot skew the totals; code that writes orders in bulk (bulk
+import, return sync, courier export) locks the rows it changes and calls
+`record_created` / `record_changes` itself.
+`manage.py rebuild_order_rollups` recomputes the table from Order.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Order, OrderRollup
+
+SNAPSHOT_FIELDS = ('user_id', 'business_date', 'status', 'price', 'profit')
+
+
+def snapshot(order):
+    """The rollup-relevant state of `order`, or None if any of it is deferred."""
+    values = order.__dict__
+    if any(field not in values for field in SNAPSHOT_FIELDS):
+        return None
+    return tuple(values[field] for field in SNAPSHOT_FIELDS)
+
+
+def _add(deltas, state, sign):
+    if state is None or state[1] is None:
+        return
+    user_id, business_date, status, price, profit = state
+    delta = deltas[(user_id, business_date, status)]
+    delta[0] += sign
+    delta[1] += sign * Decimal(price or 0)
+    delta[2] += sign * (profit or 0)
+
+
+def apply(deltas):
+    """Add {(user_id, business_date, status): [count, revenue, profit]} to the rollups."""
+    rows = [
+        (user_id, business_date, status, count, revenue, profit)
+        for (user_id, business_date, status), (count, revenue, profit) in sorted(deltas.items())
+        if count or revenue or profit
+    ]
+    if not rows:
+        return
+    table = connection.ops.quote_name(OrderRollup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (user_id, business_date, status, order_count, revenue, profit) "
+            f"VALUES (%s, %s, %s, %s, %s, %s) "
+            f"ON CONFLICT (user_id, business_date, status) DO UPDATE SET "
+            f"order_count = {table}.order_count + excluded.order_count, "
+            f"revenue = {table}.revenue + excluded.revenue, "
+            f"profit = {table}.profit + excluded.profit",
+            rows,
+        )
+
+
+def record_changes(orders):
+    """Roll up the difference between each order's last snapshot and its state now.
+
+    Snapshots are refreshed afterwards.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0), 0])
+    deferred = [order.pk for order in orders if snapshot(order) is None]
+    stored = stored_snapshots(deferred) if deferred else {}
+    for order in orders:
+        before = getattr(order, '_rollup_snapshot', None)
+        after = snapshot(order) or stored.get(order.pk)
+        if before == after:
+            continue
+        _add(deltas, before, -1)
+        _add(deltas, after, 1)
+        order._rollup_snapshot = after
+    apply(deltas)
+
+
+def record_created(orders):
+    """Roll up orders written without Order.save() (e.g. bulk_create)."""
+    for order in orders:
+        order._rollup_snapshot = None
+    record_changes(orders)
+
+
+def record_deleted(order):
+    deltas = defaultdict(lambda: [0, Decimal(0), 0])
+    _add(deltas, getattr(order, '_rollup_snapshot', None), -1)
+    order._rollup_snapshot = None
+    apply(deltas)
+
+
+def _empty_totals():
+    return {'orders': 0, 'revenue': Decimal(0), 'profit': 0, 'returned': 0, 'cancelled': 0, 'by_status': {}}
+
+
+def _add_totals(totals, status, order_count, revenue, profit):
+    totals['orders'] += order_count
+    totals['revenue'] += revenue or 0
+    totals['profit'] += profit or 0
+    totals['by_status'][status] = totals['by_status'].get(status, 0) + order_count
+    if status in ('returned', 'cancelled'):
+        totals[status] += order_count
+
+
+def report(rollups, group_by='day'):
+    """Totals per day or month (and overall) of an OrderRollup queryset, in one query."""
+    period = TruncMonth('business_date') if group_by == 'month' else F('business_date')
+    rows = (
+        rollups.annotate(period=period)
+        .values('period', 'status')
+        .annotate(order_count=Sum('order_count'), revenue_sum=Sum('revenue'), profit_sum=Sum('profit'))
+        .order_by('period', 'status')
+    )
+    periods, overall = {}, _empty_totals()
+    for row in rows:
+        if not row['order_count']:
+            continue
+        totals = periods.setdefault(row['period'], _empty_totals())
+        for target in (totals, overall):
+            _add_totals(target, row['status'], row['order_count'], row['revenue_sum'], row['profit_sum'])
+    return {
+        'group_by': group_by,
+        'results': [
+            {'period': period.strftime('%Y-%m' if group_by == 'month' else '%Y-%m-%d'), **totals}
+            for period, totals in periods.items()
+        ],
+        'totals': overall,
+    }
+
+
+def stored_snapshots(order_ids):
+    """Snapshots read back from the database, for instances that lack one."""
+    return {
+        values[0]: values[1:]
+        for values in Order.objects.filter(pk__in=order_ids).values_list('pk', *SNAPSHOT_FIELDS)
+    }
+
+
+def rebuild(start=None, end=None):
+    """Recompute the rollups (optionally only business days in [start, end)).
+
+    Returns the number of rollup rows written.
+    """
+    orders = Order.objects.all()
+    rollups = OrderRollup.objects.all()
+    if start:
+        orders, rollups = orders.filter(business_date__gte=start), rollups.filter(business_date__gte=start)
+    if end:
+        orders, rollups = orders.filter(business_date__lt=end), rollups.filter(business_date__lt=end)
+
+    totals = (
+        orders.order_by()
+        .values('user_id', 'business_date', 'status')
+        .annotate(
+            order_count=Count('id'),
+            revenue_sum=Coalesce(Sum('price'), Value(Decimal(0))),
+            profit_sum=Coalesce(Sum('profit'), Value(0)),
+        )
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = OrderRollup.objects.bulk_create(
+            (
+                OrderRollup(
+                    user_id=row['user_id'],
+                    business_date=row['business_date'],
+                    status=row['status'],
+                    order_count=row['order_count'],
+                    revenue=row['revenue_sum'],
+                    profit=row['profit_sum'],
+                )
+                for row in totals.iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(created)
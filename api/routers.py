@@ -0,0 +1,119 @@
+"""
+Read replica routing.
+
+When settings.DATABASE_READ_REPLICA names a database alias, views that opt in
+with ReplicaReadMixin (order lists/details, reports, recipient autocomplete)
+read from it; everything else, all writes and migrations stay on `default`.
+Reads go back to the primary for the rest of the request as soon as the
+request writes, inside any transaction on `default` (select_for_update and
+read-modify-write blocks must see the primary), and for
+DATABASE_REPLICA_PIN_SECONDS after a user's write request, so a client
+re-reading right after a change is not served the replica's lagging copy.
+The pin is kept in the shared cache (settings.CACHES), so it holds whichever
+worker serves the next request.
+
+Without DATABASE_READ_REPLICA the router returns None everywhere and Django
+uses `default` as usual.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = 'replica-pin:{}'
+
+# Per request (or per thread outside requests): may reads use the replica,
+# and has anything been written yet.
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+def replica_alias():
+    return getattr(settings, 'DATABASE_READ_REPLICA', None)
+
+
+def in_transaction():
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+@contextmanager
+def replica_reads():
+    """Let reads inside the block go to the replica (until something writes)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reset():
+    _replica_reads.set(False)
+    _wrote.set(False)
+
+
+def has_written():
+    return _wrote.get()
+
+
+def pin_user(user):
+    """Send `user`'s reads to the primary for DATABASE_REPLICA_PIN_SECONDS."""
+    if replica_alias() and user is not None and user.is_authenticated:
+        cache.set(PIN_KEY.format(user.pk), True, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user):
+    return user is not None and user.is_authenticated and bool(cache.get(PIN_KEY.format(user.pk)))
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and _replica_reads.get() and not _wrote.get() and not in_transaction():
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = replica_alias()
+        return None if not alias or db != alias else False
+
+
+class ReplicaReadsMiddleware:
+    """Starts every request on the primary and pins users who wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        response = self.get_response(request)
+        if has_written():
+            pin_user(getattr(request, 'user', None))
+        reset()
+        return response
+
+
+class ReplicaReadMixin:
+    """Serve the viewset's `replica_actions` from the read replica on safe methods."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # After authentication, which reads the user from the primary.
+        if (
+            replica_alias()
+            and request.method in ('GET', 'HEAD')
+            and self.action in self.replica_actions
+            and not is_pinned(request.user)
+        ):
+            _replica_reads.set(True)
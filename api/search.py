@@ -0,0 +1,153 @@
+"""
+Indexed order search (`?search=` on /api/orders/).
+
+A search term matches, best first:
+
+0. orders whose unique_id or phone equals the term,
+1. orders whose unique_id or phone starts with it - B-tree range/prefix
+   lookups on the unique_id and phone indexes,
+2. orders whose name, phone, unique_id or seller username contain a word
+   starting with it (SQLite: the FTS5 table `api_order_search`) or contain it
+   (PostgreSQL: `icontains`, served by pg_trgm GIN indexes).
+
+The rank is exposed as the `search_rank` annotation, which KeysetPagination
+orders by before its usual (field, id) keys.
+
+On SQLite the FTS table is kept in sync by triggers on api_order (and
+username changes by a signal, since a trigger on auth_user referencing
+api_order would break migrations that rebuild api_order). SQLite drops the
+triggers whenever a migration rebuilds the table, so `ensure_search_index`
+(run after every migrate) recreates anything missing and reindexes.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+RANK_ANNOTATION = 'search_rank'
+FTS_TABLE = 'api_order_search'
+# Below this length a contains-match would hit most rows; only exact/prefix apply.
+MIN_TEXT_SEARCH_LENGTH = 2
+
+SQLITE_TABLE = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, phone, unique_id, username,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)"""
+
+SQLITE_REINDEX = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""INSERT INTO {FTS_TABLE} (rowid, name, phone, unique_id, username)
+    SELECT o.id, o.name, o.phone, o.unique_id, u.username
+    FROM api_order o JOIN auth_user u ON u.id = o.user_id""",
+]
+
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON api_order BEGIN
+    INSERT INTO {FTS_TABLE} (rowid, name, phone, unique_id, username)
+    VALUES (new.id, new.name, new.phone, new.unique_id, (SELECT username FROM auth_user WHERE id = new.user_id));
+END""",
+    f"{FTS_TABLE}_update": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+AFTER UPDATE OF name, phone, unique_id, user_id ON api_order BEGIN
+    UPDATE {FTS_TABLE}
+    SET name = new.name, phone = new.phone, unique_id = new.unique_id,
+        username = (SELECT username FROM auth_user WHERE id = new.user_id)
+    WHERE rowid = old.id;
+END""",
+    f"{FTS_TABLE}_delete": f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON api_order BEGIN
+    DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+END""",
+}
+
+# Trigram GIN indexes matching the UPPER(col::text) LIKE that icontains emits.
+POSTGRESQL_INDEXES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS order_name_trgm_idx ON api_order USING gin (UPPER(name::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS order_phone_trgm_idx ON api_order USING gin (UPPER(phone::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS order_unique_id_trgm_idx ON api_order USING gin (UPPER(unique_id::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS user_username_trgm_idx ON auth_user USING gin (UPPER(username::text) gin_trgm_ops)",
+]
+
+
+def ensure_search_index(using_connection=None):
+    """Create the search table/triggers/indexes if missing. Safe to re-run."""
+    using_connection = using_connection or connection
+    with using_connection.cursor() as cursor:
+        if using_connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND name LIKE %s)",
+                [FTS_TABLE, f"{FTS_TABLE}_%"],
+            )
+            present = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in (FTS_TABLE, *SQLITE_TRIGGERS) if name not in present]
+            if not missing:
+                return False
+            cursor.execute(SQLITE_TABLE)
+            for statement in SQLITE_TRIGGERS.values():
+                cursor.execute(statement)
+            for statement in SQLITE_REINDEX:
+                cursor.execute(statement)
+            return True
+        if using_connection.vendor == 'postgresql':
+            for statement in POSTGRESQL_INDEXES:
+                cursor.execute(statement)
+    return False
+
+
+def sync_username(user):
+    """Propagate a renamed seller to the SQLite search table."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET username = %s WHERE rowid IN (SELECT id FROM api_order WHERE user_id = %s)",
+            [user.username, user.pk],
+        )
+
+
+def prefix_q(field, value):
+    """`field` starts with `value`, in a form the field's B-tree index serves."""
+    if connection.vendor == 'postgresql':
+        # LIKE 'value%' needs a varchar_pattern_ops index under non-C collations:
+        # Django adds one for db_index/unique fields, migration 0019 for Recipient.
+        return Q(**{f'{field}__startswith': value})
+    # SQLite's LIKE is case-insensitive and skips binary indexes; seek a range.
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + '\U0010ffff'})
+
+
+def fts_query(term):
+    words = re.findall(r'\w+', term)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def text_q(term):
+    if connection.vendor == 'sqlite':
+        query = fts_query(term)
+        if not query:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query]))
+    return (
+        Q(name__icontains=term) | Q(phone__icontains=term)
+        | Q(unique_id__icontains=term) | Q(user__username__icontains=term)
+    )
+
+
+def search_orders(queryset, term):
+    """Filter `queryset` to orders matching `term`, annotated with `search_rank`."""
+    term = term.strip()
+    if not term:
+        return queryset
+    exact = Q(unique_id=term) | Q(phone=term)
+    prefix = prefix_q('unique_id', term) | prefix_q('phone', term)
+    matches = exact | prefix
+    if len(term) >= MIN_TEXT_SEARCH_LENGTH:
+        matches |= text_q(term)
+    return queryset.filter(matches).annotate(**{
+        RANK_ANNOTATION: Case(
+            When(exact, then=Value(0)),
+            When(prefix, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    })
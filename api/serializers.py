@@ -1,26 +1,86 @@
+from itertools import chain
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction # Import transaction
-from .models import Order, OrderItem, Mockup, Design, InventoryProduct, InventoryItem , UserProductPrice
+from .models import Order, OrderItem, Mockup, Design, InventoryProduct, InventoryItem , UserProductPrice, CourierExportJob
+from .inventory import InventoryReservation, InventoryShortage
+from .media import signed_url
+from .pricing import PriceBook
+from .profiling import TimedDataMixin
+from .thumbnails import ThumbnailStates, thumbnail_urls
+from .transitions import ERROR as TRANSITION_ERROR, TransitionError, check as check_transition, transition
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "email", "is_staff"]
 
-class DesignSerializer(serializers.ModelSerializer):
+def asset_file_names(assets):
+    """File names of Designs/Mockups, their loaded linked designs and the
+    loaded mockups/designs of OrderItems, for ThumbnailStates.load()."""
+    names = set()
+    for asset in assets:
+        if isinstance(asset, OrderItem):
+            related = [
+                getattr(asset, field) for field in ("mockup", "design")
+                if OrderItem._meta.get_field(field).is_cached(asset)
+            ]
+            names |= asset_file_names(related)
+            continue
+        if asset is None:
+            continue
+        if asset.file:
+            names.add(asset.file.name)
+        if isinstance(asset, Mockup) and Mockup._meta.get_field("linked_design").is_cached(asset):
+            names |= asset_file_names([asset.linked_design])
+    return names
+
+
+class SignedFileField(serializers.FileField):
+    """Serializes to a /media/ URL signed for the requesting user (see api.media)."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get("request")
+        url = signed_url(value.name, getattr(request, "user", None))
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class ThumbnailListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # One StoredBlob query for the thumbnails of the whole list.
+        iterable = data.all() if hasattr(data, "all") else data
+        ThumbnailStates.for_context(self.context).load(asset_file_names(iterable))
+        return [self.child.to_representation(item) for item in iterable]
+
+
+class ThumbnailsMixin(serializers.Serializer):
+    # Signed, so <img src> and download links work without an Authorization header
+    file = SignedFileField()
+    # WebP previews by size; the original file URL until they are generated
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.file, self.context.get("request"), ThumbnailStates.for_context(self.context))
+
+class DesignSerializer(ThumbnailsMixin, serializers.ModelSerializer):
     class Meta:
         model = Design
-        fields = ["id", "name", "file", "created_at", "updated_at"]
+        list_serializer_class = ThumbnailListSerializer
+        fields = ["id", "name", "file", "thumbnails", "created_at", "updated_at"]
         read_only_fields = ["user"]
 
-class MockupSerializer(serializers.ModelSerializer):
+class MockupSerializer(ThumbnailsMixin, serializers.ModelSerializer):
     # Include linked_design field
     linked_design_details = DesignSerializer(source="linked_design", read_only=True)
 
     class Meta:
         model = Mockup
-        fields = ["id", "name", "file", "linked_design", "linked_design_details", "created_at", "updated_at"]
+        list_serializer_class = ThumbnailListSerializer
+        fields = ["id", "name", "file", "thumbnails", "linked_design", "linked_design_details", "created_at", "updated_at"]
         read_only_fields = ["user"]
         extra_kwargs = {
             "linked_design": {"write_only": False, "required": False, "allow_null": True},
@@ -32,6 +92,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
+        list_serializer_class = ThumbnailListSerializer
         fields = ["id", "mockup", "design", "type", "size", "color", "created_at", "updated_at",
                   "mockup_details", "design_details"]
         extra_kwargs = {
@@ -40,7 +101,95 @@ class OrderItemSerializer(serializers.ModelSerializer):
             "type": {"required": True},
         }
 
-class OrderSerializer(serializers.ModelSerializer):
+def set_order_profit(order_instance, product_types, price_book=None):
+    """Set order_instance.profit from its price, item costs and delivery area.
+
+    Does not save; callers decide whether to save one order or bulk-write many.
+    """
+    total_cost_of_items = (price_book or PriceBook()).total_cost(order_instance.user_id, product_types)
+
+    # Ensure profit is an integer as per your model
+    # Also ensure order_instance.price is treated as a number
+    order_selling_price = order_instance.price if order_instance.price is not None else 0
+    order_instance.profit = int(order_selling_price - total_cost_of_items)
+
+    # --- NEW LOGIC: Deduct from profit based on areaId ---
+    area_id = order_instance.areaId # Assuming areaId exists on order_instance
+
+    if area_id == 590:
+        order_instance.profit -= 30
+    elif area_id is not None and area_id > 593:
+        order_instance.profit -= 55
+    else:
+        order_instance.profit -= 20
+    # --- END NEW LOGIC ---
+    return order_instance.profit
+
+
+# Query parameter that lets staff clients drop the inlined owner_mockups /
+# owner_designs and page through them on the order's owner_mockups /
+# owner_designs endpoints instead.
+OWNER_ASSETS_PARAM = "owner_assets"
+OWNER_ASSETS_SEPARATE = "separate"
+
+
+class OwnerAssetCache:
+    """Per-request cache of serialized mockups and designs keyed by owner id.
+
+    Lives in the serializer context, so every order on a page that belongs to
+    the same seller reuses one serialized copy of that seller's library.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.mockups = {}
+        self.designs = {}
+
+    @classmethod
+    def for_context(cls, context):
+        cache = context.get("owner_asset_cache")
+        if cache is None:
+            cache = context["owner_asset_cache"] = cls(context)
+        return cache
+
+    def load(self, owner_ids):
+        missing = {owner_id for owner_id in owner_ids if owner_id not in self.mockups}
+        if not missing:
+            return
+        mockups = {owner_id: [] for owner_id in missing}
+        designs = {owner_id: [] for owner_id in missing}
+        for mockup in Mockup.objects.filter(user_id__in=missing).select_related("linked_design"):
+            mockups[mockup.user_id].append(mockup)
+        for design in Design.objects.filter(user_id__in=missing):
+            designs[design.user_id].append(design)
+        ThumbnailStates.for_context(self.context).load(
+            asset_file_names([*chain.from_iterable(mockups.values()), *chain.from_iterable(designs.values())])
+        )
+        for owner_id in missing:
+            self.mockups[owner_id] = MockupSerializer(mockups[owner_id], many=True, context=self.context).data
+            self.designs[owner_id] = DesignSerializer(designs[owner_id], many=True, context=self.context).data
+
+    def get(self, owner_id):
+        self.load([owner_id])
+        return self.mockups[owner_id], self.designs[owner_id]
+
+
+class OrderListSerializer(TimedDataMixin, serializers.ListSerializer):
+    def to_representation(self, data):
+        # Resolve the owner libraries for the whole page in two queries
+        # before the per-order representations ask for them.
+        iterable = data.all() if hasattr(data, "all") else data
+        if self.child._include_owner_assets():
+            OwnerAssetCache.for_context(self.context).load({order.user_id for order in iterable})
+        # Likewise the thumbnails of every item on the page in one query.
+        ThumbnailStates.for_context(self.context).load(asset_file_names(
+            item for order in iterable if "items" in getattr(order, "_prefetched_objects_cache", {})
+            for item in order.items.all()
+        ))
+        return [self.child.to_representation(item) for item in iterable]
+
+
+class OrderSerializer(TimedDataMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, required=False)
     username = serializers.CharField(source="user.username", read_only=True)
     owner_mockups = MockupSerializer(many=True, read_only=True, required=False)
@@ -52,119 +201,78 @@ class OrderSerializer(serializers.ModelSerializer):
                   "unique_id", "created_at", "updated_at", "items",
                   "owner_mockups", "owner_designs"]
         read_only_fields = ["unique_id", "user", "owner_mockups", "owner_designs", "profit"] # 'profit' is now read-only for input, calculated internally
+        list_serializer_class = OrderListSerializer
 
    
     def _calculate_total_cost_and_profit(self, order_instance, items_data_or_queryset):
         """Helper to calculate total cost of items and update order profit.
         Also applies a deduction to profit based on order_instance.areaId.
         """
-        total_cost_of_items = 0
-
         if isinstance(items_data_or_queryset, list): # For create or pre-save update
-            for item_data in items_data_or_queryset:
-                product_type = item_data.get('type')
-                if product_type:
-                    try:
-                        inventory_product = InventoryProduct.objects.get(name=product_type)
-                        try:
-                            custom_price_obj = UserProductPrice.objects.get(user=order_instance.user, product=inventory_product)
-                            item_cost = custom_price_obj.custom_price
-                        except UserProductPrice.DoesNotExist:
-                            item_cost = inventory_product.price if inventory_product.price is not None else 0
-                        total_cost_of_items += item_cost
-                    except InventoryProduct.DoesNotExist:
-                        print(f"Warning: InventoryProduct not found for type: {product_type}")
-                        pass
+            product_types = [item_data.get('type') for item_data in items_data_or_queryset]
         else: # For post-save update (using instance.items.all())
-            for item in items_data_or_queryset:
-                if item.type:
-                    try:
-                        inventory_product = InventoryProduct.objects.get(name=item.type)
-                        # Use 0 if inventory_product.price is None
-                        item_cost = inventory_product.price if inventory_product.price is not None else 0
-                        total_cost_of_items += item_cost
-                    except InventoryProduct.DoesNotExist:
-                        print(f"Warning: InventoryProduct not found for type: {item.type}")
-                        pass
-
-        # Ensure profit is an integer as per your model
-        # Also ensure order_instance.price is treated as a number
-        order_selling_price = order_instance.price if order_instance.price is not None else 0
-        order_instance.profit = int(order_selling_price - total_cost_of_items)
-
-        # --- NEW LOGIC: Deduct from profit based on areaId ---
-        area_id = order_instance.areaId # Assuming areaId exists on order_instance
-
-        if area_id == 590:
-            order_instance.profit -= 30
-        elif area_id > 593:
-            order_instance.profit -= 55
-        else:
-            order_instance.profit -= 20
-        # --- END NEW LOGIC ---
+            product_types = [item.type for item in items_data_or_queryset]
 
+        set_order_profit(order_instance, product_types)
         order_instance.save(update_fields=['profit']) # Only save the profit field
 
+    def _stock_reservation(self, current_items, new_items_data):
+        """Net stock change for replacing `current_items` with `new_items_data`.
+
+        Items that are removed, or whose type/size/color changed, give their
+        unit back; new or changed items take one.
+        """
+        reservation = InventoryReservation()
+        current_items_map = {item.id: item for item in current_items}
+        for current_item_id, current_item in current_items_map.items():
+            is_removed = True
+            for new_item_data in new_items_data:
+                if new_item_data.get('id') == current_item_id:
+                    is_removed = False
+                    # Check if item details that affect inventory have changed
+                    if (current_item.type != new_item_data.get('type') or
+                        current_item.size != new_item_data.get('size') or
+                        current_item.color != new_item_data.get('color')):
+                        reservation.release_items([current_item])
+                        reservation.take_items([new_item_data])
+                    break
+            if is_removed:
+                reservation.release_items([current_item])
 
+        for item_data in new_items_data:
+            if item_data.get('id') not in current_items_map:
+                # New item: consume stock for it
+                reservation.take_items([item_data])
+        return reservation
+
+    def validate_status(self, value):
+        # Edits follow the same status rules as update_status
+        if self.instance is not None:
+            try:
+                check_transition(self.instance.status, value)
+            except TransitionError as exc:
+                raise serializers.ValidationError(str(exc))
+        return value
 
     def validate(self, data):
         instance = self.instance # instance will be available during update
+        current_items = instance.items.all() if instance else []
 
-        new_items_data = data.get("items", [])
-        stock_changes = {} # { (product_name, size, color): quantity_change }
-        if instance:
-            current_items_map = {item.id: item for item in instance.items.all()}
-            for current_item_id, current_item in current_items_map.items():
-                is_removed = True
-                for new_item_data in new_items_data:
-                    if new_item_data.get('id') == current_item_id:
-                        is_removed = False
-                        # Check if item details that affect inventory have changed
-                        if (current_item.type != new_item_data.get('type') or
-                            current_item.size != new_item_data.get('size') or
-                            current_item.color != new_item_data.get('color')):
-                            # If details changed, "return" stock from old item
-                            key = (current_item.type, current_item.size, current_item.color)
-                            stock_changes[key] = stock_changes.get(key, 0) + 1
-                        break
-                if is_removed:
-                    # Item was removed, return its stock
-                    key = (current_item.type, current_item.size, current_item.color)
-                    stock_changes[key] = stock_changes.get(key, 0) + 1
-
-        # For new or updated items
-        for item_data in new_items_data:
-            item_id = item_data.get('id')
-            if item_id and instance and item_id in current_items_map:
-                # This is an existing item, already handled above if its details changed
-                pass
-            else:
-                # This is a new item, or an existing item whose details changed (and was "returned" above)
-                # so we need to "consume" stock for it now
-                key = (item_data['type'], item_data['size'], item_data['color'])
-                stock_changes[key] = stock_changes.get(key, 0) - 1
-
-        # Now, check if there's enough stock for all proposed changes
-        for (product_name, size, color), change in stock_changes.items():
-            if change < 0: # If we need to consume stock (change is negative)
-                try:
-                    inventory_item = InventoryItem.objects.get(
-                        product__name=product_name,
-                        size=size,
-                        color=color
-                    )
-                    # Check if current quantity plus the negative change (i.e., new quantity) is sufficient
-                    if inventory_item.quantity + change < 0: # inventory_item.quantity - abs(change)
-                        raise serializers.ValidationError(
-                            f"Insufficient stock for {product_name} (Size: {size}, Color: {color}). Available: {inventory_item.quantity}"
-                        )
-                except InventoryItem.DoesNotExist:
-                    raise serializers.ValidationError(
-                        f"Inventory item not found for {product_name} (Size: {size}, Color: {color})."
-                    )
+        # Early, lock-free check so every shortage is reported together;
+        # create/update re-check under row locks when applying.
+        try:
+            self._stock_reservation(current_items, data.get("items", [])).check()
+        except InventoryShortage as exc:
+            raise serializers.ValidationError(exc.messages)
 
         return data
 
+    def _apply_reservation(self, reservation):
+        try:
+            reservation.apply()
+        except InventoryShortage as exc:
+            raise serializers.ValidationError(exc.messages)
+
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
         validated_data.pop("owner_mockups", None)
@@ -172,32 +280,10 @@ class OrderSerializer(serializers.ModelSerializer):
 
         with transaction.atomic():
             order = Order.objects.create(**validated_data)
+            OrderItem.objects.bulk_create([OrderItem(order=order, **item_data) for item_data in items_data])
 
-            for item_data in items_data:
-                OrderItem.objects.create(order=order, **item_data)
-
-                # Decrement InventoryItem quantity
-                product_type = item_data.get('type')
-                size = item_data.get('size')
-                color = item_data.get('color')
-
-                if product_type and size and color:
-                    try:
-                        inventory_item = InventoryItem.objects.get(
-                            product__name=product_type,
-                            size=size,
-                            color=color
-                        )
-                        if inventory_item.quantity > 0:
-                            inventory_item.quantity -= 1
-                            inventory_item.save()
-                        else:
-                            raise serializers.ValidationError(
-                                f"No stock for {product_type} (Size: {size}, Color: {color})."
-                            )
-                    except InventoryItem.DoesNotExist:
-                        print(f"Warning: Inventory item not found for {product_type}, {size}, {color}")
-                        pass # Consider raising an error here if a non-existent item should prevent order creation
+            # Decrement inventory for every item in one locked batch
+            self._apply_reservation(self._stock_reservation([], items_data))
 
             # --- Calculate and set profit after all items are created ---
             self._calculate_total_cost_and_profit(order, items_data) # Pass the created order and its raw items data
@@ -208,6 +294,9 @@ class OrderSerializer(serializers.ModelSerializer):
         items_data = validated_data.pop("items", [])
         validated_data.pop("owner_mockups", None)
         validated_data.pop("owner_designs", None)
+        # Applied last through api.transitions, like update_status, so
+        # cancelling and returning have their side effects.
+        new_status = validated_data.pop("status", instance.status)
 
         with transaction.atomic():
             # Update main Order fields
@@ -216,107 +305,54 @@ class OrderSerializer(serializers.ModelSerializer):
             instance.save()
 
             # --- Handle OrderItem updates and inventory changes ---
-            current_order_items = {item.id: item for item in instance.items.all()}
+            current_order_items = {item.id: item for item in OrderItem.objects.filter(order=instance)}
             updated_item_ids = {item_data.get("id") for item_data in items_data if item_data.get("id")}
 
-            # 1. Handle deleted items: return stock to inventory
-            for item_id, item in current_order_items.items():
-                if item_id not in updated_item_ids:
-                    try:
-                        inventory_item = InventoryItem.objects.get(
-                            product__name=item.type,
-                            size=item.size,
-                            color=item.color
-                        )
-                        inventory_item.quantity += 1
-                        inventory_item.save()
-                    except InventoryItem.DoesNotExist:
-                        print(f"Warning: Inventory item not found for deleted order item: {item.type}, {item.size}, {item.color}")
-                    item.delete()
-
-            # 2. Handle created/updated items: decrement stock
+            # Return stock for removed/changed items and take it for new/changed
+            # ones in a single locked batch.
+            self._apply_reservation(self._stock_reservation(current_order_items.values(), items_data))
+
+            # 1. Handle deleted items
+            removed_ids = [item_id for item_id in current_order_items if item_id not in updated_item_ids]
+            if removed_ids:
+                OrderItem.objects.filter(id__in=removed_ids).delete()
+
+            # 2. Handle updated and created items
+            new_items = []
             for item_data in items_data:
                 item_id = item_data.get("id")
-                new_type = item_data.get("type")
-                new_size = item_data.get("size")
-                new_color = item_data.get("color")
-
-                if item_id:
-                    existing_item = current_order_items.get(item_id)
-                    if existing_item:
-                        if (existing_item.type != new_type or
-                            existing_item.size != new_size or
-                            existing_item.color != new_color):
-                            # Item details changed, return stock for old item and consume for new
-                            try:
-                                old_inventory_item = InventoryItem.objects.get(
-                                    product__name=existing_item.type,
-                                    size=existing_item.size,
-                                    color=existing_item.color
-                                )
-                                old_inventory_item.quantity += 1
-                                old_inventory_item.save()
-                            except InventoryItem.DoesNotExist:
-                                print(f"Warning: Old inventory item not found during update: {existing_item.type}, {existing_item.size}, {existing_item.color}")
-
-                            try:
-                                new_inventory_item = InventoryItem.objects.get(
-                                    product__name=new_type,
-                                    size=new_size,
-                                    color=new_color
-                                )
-                                if new_inventory_item.quantity > 0:
-                                    new_inventory_item.quantity -= 1
-                                    new_inventory_item.save()
-                                else:
-                                     raise serializers.ValidationError(
-                                        f"No stock for {new_type} (Size: {new_size}, Color: {new_color})."
-                                    )
-                            except InventoryItem.DoesNotExist:
-                                raise serializers.ValidationError(
-                                    f"Inventory item not found for {new_type} (Size: {new_size}, Color: {new_color})."
-                                )
-
-                        OrderItem.objects.filter(id=item_id, order=instance).update(**item_data)
+                if item_id and item_id in current_order_items:
+                    OrderItem.objects.filter(id=item_id, order=instance).update(**item_data)
                 else:
-                    # New item - decrement stock
-                    try:
-                        inventory_item = InventoryItem.objects.get(
-                            product__name=new_type,
-                            size=new_size,
-                            color=new_color
-                        )
-                        if inventory_item.quantity > 0:
-                            inventory_item.quantity -= 1
-                            inventory_item.save()
-                        else:
-                            raise serializers.ValidationError(
-                                f"No stock for {new_type} (Size: {new_size}, Color: {new_color})."
-                            )
-                    except InventoryItem.DoesNotExist:
-                        raise serializers.ValidationError(
-                            f"Inventory item not found for {new_type} (Size: {new_size}, Color: {new_color})."
-                        )
-                    OrderItem.objects.create(order=instance, **item_data)
+                    new_items.append(OrderItem(order=instance, **item_data))
+            OrderItem.objects.bulk_create(new_items)
 
             # --- Calculate and set profit after all item modifications ---
-            # Use instance.items.all() to get the final state of order items
-            # after all additions, deletions, and updates are processed.
-            self._calculate_total_cost_and_profit(instance, instance.items.all())
-            
+            # Re-read the items so the final state (after additions, deletions
+            # and updates) is used rather than any prefetched copy.
+            self._calculate_total_cost_and_profit(instance, OrderItem.objects.filter(order=instance))
+
+            if new_status != instance.status:
+                result, = transition(Order.objects.all(), [(instance.id, new_status)])
+                if result["status"] == TRANSITION_ERROR:
+                    raise serializers.ValidationError({"status": [result["error"]]})
+                instance.refresh_from_db(fields=["status", "price", "profit", "updated_at"])
 
         return instance
 
+    def _include_owner_assets(self):
+        request = self.context.get("request")
+        if not (request and request.user and request.user.is_staff):
+            return False
+        return request.query_params.get(OWNER_ASSETS_PARAM) != OWNER_ASSETS_SEPARATE
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        request = self.context.get("request")
 
-        if request and request.user and request.user.is_staff:
-            owner = instance.user
-            mockups = Mockup.objects.filter(user=owner)
-            designs = Design.objects.filter(user=owner)
-            representation["owner_mockups"] = MockupSerializer(mockups, many=True, context=self.context).data
-            representation["owner_designs"] = DesignSerializer(designs, many=True, context=self.context).data
+        if self._include_owner_assets():
+            mockups, designs = OwnerAssetCache.for_context(self.context).get(instance.user_id)
+            representation["owner_mockups"] = mockups
+            representation["owner_designs"] = designs
         else:
             representation.pop("owner_mockups", None)
             representation.pop("owner_designs", None)
@@ -324,6 +360,30 @@ class OrderSerializer(serializers.ModelSerializer):
         return representation
 
 
+class StatusTransitionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.CharField()
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    """{"ids": [...], "status": "..."} or {"transitions": [{"id": ..., "status": ...}, ...]}"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    status = serializers.CharField(required=False)
+    transitions = StatusTransitionSerializer(many=True, required=False, allow_empty=False)
+
+    def validate(self, data):
+        if "transitions" in data:
+            moves = [(entry["id"], entry["status"]) for entry in data["transitions"]]
+        elif "ids" in data and "status" in data:
+            moves = [(order_id, data["status"]) for order_id in data["ids"]]
+        else:
+            raise serializers.ValidationError('Expected "ids" and "status", or a list of "transitions".')
+        max_rows = getattr(settings, "BULK_ORDER_MAX_ROWS", 1000)
+        if len(moves) > max_rows:
+            raise serializers.ValidationError(f"At most {max_rows} orders per batch")
+        return {"moves": moves}
+
+
 class InventoryItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
 
@@ -350,3 +410,11 @@ class UserProductPriceSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProductPrice
         fields = ['id', 'user', 'username', 'product', 'product_name', 'custom_price']
+
+
+class CourierExportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourierExportJob
+        fields = ["id", "status", "total", "submitted", "failed", "attempts", "message",
+                  "created_at", "started_at", "heartbeat_at", "finished_at"]
+        read_only_fields = fields
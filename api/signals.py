@@ -0,0 +1,90 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalog, recipients, rollups, search, storage, thumbnails
+from .models import Design, InventoryItem, InventoryProduct, Mockup, Order
+
+
+@receiver([post_save, post_delete], sender=InventoryProduct)
+@receiver([post_save, post_delete], sender=InventoryItem)
+def invalidate_catalog(sender, **kwargs):
+    # After commit, so a concurrent rebuild cannot cache the old rows.
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(post_init, sender=Design)
+@receiver(post_init, sender=Mockup)
+def remember_stored_file(sender, instance, **kwargs):
+    instance._stored_file_name = instance.file.name if instance.file else ""
+
+
+@receiver(post_save, sender=Design)
+@receiver(post_save, sender=Mockup)
+def count_blob_references(sender, instance, **kwargs):
+    current = instance.file.name if instance.file else ""
+    previous = getattr(instance, "_stored_file_name", "")
+    if current != previous:
+        storage.add_reference(current)
+        storage.drop_reference(previous)
+        instance._stored_file_name = current
+        if current:
+            transaction.on_commit(partial(thumbnails.schedule, current))
+
+
+@receiver(post_delete, sender=Design)
+@receiver(post_delete, sender=Mockup)
+def release_blob_reference(sender, instance, **kwargs):
+    storage.drop_reference(getattr(instance, "_stored_file_name", "") or instance.file.name)
+
+
+@receiver(post_init, sender=Order)
+def remember_rollup_state(sender, instance, **kwargs):
+    instance._rollup_snapshot = rollups.snapshot(instance)
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_delete, sender=Order)
+def load_rollup_state(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._rollup_snapshot = None
+    else:
+        # The row as the rollups count it now; the instance may be stale or deferred.
+        instance._rollup_snapshot = rollups.stored_snapshots([instance.pk]).get(instance.pk)
+
+
+@receiver(post_init, sender=Order)
+def remember_contact(sender, instance, **kwargs):
+    instance._recipient_contact = recipients.contact(instance)
+
+
+@receiver(pre_save, sender=Order)
+def link_recipient(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None:
+        return
+    current = recipients.contact(instance)
+    if instance._state.adding or instance.recipient_id is None or (
+        current is not None and current != instance._recipient_contact
+    ):
+        recipients.link([instance])
+        instance._recipient_contact = current
+
+
+@receiver(post_save, sender=Order)
+def update_rollups(sender, instance, **kwargs):
+    rollups.record_changes([instance])
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_rollups(sender, instance, **kwargs):
+    rollups.record_deleted(instance)
+
+
+@receiver(post_save, sender=User)
+def sync_search_username(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    search.sync_username(instance)
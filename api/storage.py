@@ -0,0 +1,153 @@
+"""
+Content-addressed storage for design and mockup uploads.
+
+Uploads are hashed (SHA-256) while they are streamed to a temporary file and
+then moved to `blobs/<first two hex digits>/<digest><ext>`. If that blob
+already exists the temporary copy is dropped, so identical artwork is stored
+once however many times it is uploaded (once per extension: the name keeps
+it so the file is served with the right content type). StoredBlob keeps a reference count of
+the Design/Mockup rows pointing at each blob (maintained in api.signals) and
+the file is removed when the last reference goes away.
+
+An upload counts its reference in `_save`, before it looks for an existing
+file, and the row's post_save (`add_reference`) then takes over that count
+instead of adding another. Collection rechecks the count under a row lock, so
+a blob an upload is about to reuse is either kept, or removed before the
+upload looks and written again.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+BLOB_PREFIX = 'blobs'
+
+# Blobs referenced by _save() on this thread and not yet claimed by add_reference().
+_pinned = threading.local()
+
+
+def blob_name_for(digest, extension):
+    return f"{BLOB_PREFIX}/{digest[:2]}/{digest}{extension.lower()}"
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f"{BLOB_PREFIX}/")
+
+
+def digest_from_name(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save().
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1]
+        tmp_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+
+            final_name = blob_name_for(digest.hexdigest(), extension)
+            # Referenced before the existence check, so it cannot be collected under us.
+            pin(final_name, size)
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(final_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+
+def blob_storage():
+    # Location and URL follow MEDIA_ROOT / MEDIA_URL (read lazily).
+    return ContentAddressedStorage()
+
+
+def _pins():
+    pins = getattr(_pinned, 'names', None)
+    if pins is None:
+        pins = _pinned.names = Counter()
+    return pins
+
+
+def pin(name, size):
+    """Count a reference for an upload of blob `name` until its row is saved."""
+    from .models import StoredBlob
+
+    while True:
+        blob, _ = StoredBlob.objects.get_or_create(
+            name=name, defaults={'sha256': digest_from_name(name), 'size': size}
+        )
+        # The row may have just been collected; then create it again.
+        if StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1):
+            break
+    _pins()[name] += 1
+
+
+def add_reference(name):
+    """Count one more Design/Mockup row pointing at blob `name`."""
+    from .models import StoredBlob
+
+    if not is_blob_name(name):
+        return
+    pins = _pins()
+    if pins[name]:
+        # Already counted by the upload that stored it.
+        pins[name] -= 1
+        return
+    storage = blob_storage()
+    blob, _ = StoredBlob.objects.get_or_create(
+        name=name,
+        defaults={
+            'sha256': digest_from_name(name),
+            'size': storage.size(name) if storage.exists(name) else 0,
+        },
+    )
+    StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def drop_reference(name):
+    """Count one reference less; delete the blob once nothing points at it."""
+    from .models import StoredBlob
+
+    if not is_blob_name(name):
+        return
+    StoredBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    def collect():
+        # Only delete when the row is still unreferenced after commit; the lock
+        # holds back an upload pinning it until the file is gone.
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.ref_count > 0:
+                return
+            if blob is not None:
+                blob.delete()
+            blob_storage().delete(name)
+
+    transaction.on_commit(collect)
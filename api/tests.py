@@ -1,3 +1,1731 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .dates import business_today, shortcut_range, to_business_date
+from . import benchmarks, bulk, catalog, courier, exports, jobs, media, pricing, recipients, returns, rollups, routers, storage, thumbnails
+from .collection import DailyCollection
+from .inventory import InventoryReservation, InventoryShortage
+from .models import (
+    CourierSyncState, Order, OrderItem, OrderSequence, Mockup, Design, InventoryProduct, InventoryItem, UserProductPrice,
+    CourierExportJob, OrderRollup, Recipient, StoredBlob,
+)
+from .storage import digest_from_name
+
+
+# The suite clears and bumps cache keys (catalog generations, replica pins):
+# keep it off the shared cache of the host running it.
+_test_cache = override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+
+
+def setUpModule():
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+
+
+def make_order(user, design=None, mockup=None, items=2, **kwargs):
+    order = Order.objects.create(
+        user=user,
+        name=kwargs.get("name", "Customer"),
+        phone=kwargs.get("phone", "0599000000"),
+        area=kwargs.get("area", "Ramallah"),
+        areaId=kwargs.get("areaId", 1),
+        price=kwargs.get("price", 100),
+        status=kwargs.get("status", "pending"),
+    )
+    for _ in range(items):
+        OrderItem.objects.create(order=order, mockup=mockup, design=design, type="t-shirt", size="M", color="black")
+    return order
+
+
+class OrderQueryPlanTests(TestCase):
+    """The order list and detail must cost a fixed number of queries."""
+
+    # auth-free client (force_authenticate), so every query counted here is
+    # spent by the view and the serializer.
+    MAX_LIST_QUERIES = 4
+    MAX_DETAIL_QUERIES = 4
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.design = Design.objects.create(user=self.seller, name="logo", file="designs/user_1/logo.png")
+        self.mockup = Mockup.objects.create(
+            user=self.seller, name="front", file="mockups/user_1/front.png", linked_design=self.design
+        )
+        self.client = APIClient()
+
+    def _list_queries(self, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        make_order(self.seller, design=self.design, mockup=self.mockup)
+        few = self._list_queries(self.seller)
+        for _ in range(20):
+            make_order(self.seller, design=self.design, mockup=self.mockup, items=3)
+        many = self._list_queries(self.seller)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.MAX_LIST_QUERIES)
+
+    def test_detail_query_count(self):
+        order = make_order(self.seller, design=self.design, mockup=self.mockup, items=5)
+        self.client.force_authenticate(self.seller)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/api/orders/{order.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["items"]), 5)
+        self.assertEqual(response.data["items"][0]["mockup_details"]["linked_design_details"]["name"], "logo")
+        self.assertLessEqual(len(ctx.captured_queries), self.MAX_DETAIL_QUERIES)
+
+
+class OwnerAssetTests(TestCase):
+    """Staff order lists fetch each owner's library once per request."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.sellers = [User.objects.create_user(f"seller{i}", password="x") for i in range(2)]
+        for seller in self.sellers:
+            for n in range(3):
+                design = Design.objects.create(user=seller, name=f"d{n}", file=f"designs/user_{seller.id}/d{n}.png")
+                Mockup.objects.create(
+                    user=seller, name=f"m{n}", file=f"mockups/user_{seller.id}/m{n}.png", linked_design=design
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _list(self, url="/api/orders/"):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_staff_list_query_count_does_not_grow_with_orders(self):
+        make_order(self.sellers[0])
+        _, few = self._list()
+        for seller in self.sellers:
+            for _ in range(10):
+                make_order(seller)
+        response, many = self._list()
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, OrderQueryPlanTests.MAX_LIST_QUERIES + 2)
+        orders = response.data["results"]
+        self.assertEqual(len(orders[0]["owner_mockups"]), 3)
+        self.assertEqual(len(orders[0]["owner_designs"]), 3)
+
+    def test_separate_mode_moves_assets_to_paginated_endpoints(self):
+        order = make_order(self.sellers[0])
+        response, _ = self._list("/api/orders/?owner_assets=separate")
+        orders = response.data["results"]
+        self.assertNotIn("owner_mockups", orders[0])
+        self.assertNotIn("owner_designs", orders[0])
+
+        response = self.client.get(f"/api/orders/{order.id}/owner_mockups/?page_size=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(f"/api/orders/{order.id}/owner_designs/")
+        self.assertEqual(response.data["count"], 3)
+
+    def test_owner_asset_endpoints_are_staff_only(self):
+        order = make_order(self.sellers[0])
+        self.client.force_authenticate(self.sellers[0])
+        response = self.client.get(f"/api/orders/{order.id}/owner_mockups/")
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderPaginationTests(TestCase):
+    """Order lists are keyset-paginated on (created_at, id)."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.orders = [make_order(self.seller, items=1, name=f"c{i}") for i in range(7)]
+        # Force ties on created_at so the id tiebreaker is exercised.
+        Order.objects.filter(id__in=[o.id for o in self.orders[2:5]]).update(created_at=self.orders[2].created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(order["id"] for order in response.data["results"])
+            url = response.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_walks_every_order_once_newest_first(self):
+        ids, pages = self._walk("/api/orders/?page_size=3")
+        expected = list(
+            Order.objects.filter(user=self.seller).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_the_prior_page(self):
+        first = self.client.get("/api/orders/?page_size=3").data
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual([o["id"] for o in back["results"]], [o["id"] for o in first["results"]])
+
+    def test_ordering_parameter_is_honoured(self):
+        ids, _ = self._walk("/api/orders/?page_size=2&ordering=name")
+        self.assertEqual(ids, [o.id for o in self.orders])
+
+    def test_later_pages_cost_the_same_as_the_first(self):
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get("/api/orders/?page_size=2")
+        with CaptureQueriesContext(connection) as later:
+            self.client.get(response.data["next"])
+        self.assertEqual(len(first.captured_queries), len(later.captured_queries))
+        self.assertFalse(any("OFFSET" in q["sql"].upper() for q in later.captured_queries))
+
+    def test_works_with_filters_and_date_shortcuts(self):
+        Order.objects.filter(id=self.orders[0].id).update(status="shipped")
+        ids, _ = self._walk("/api/orders/?page_size=2&status=shipped&date=today")
+        self.assertEqual(ids, [self.orders[0].id])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get("/api/orders/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+
+class BusinessDateTests(TestCase):
+    """Date filters are half-open ranges on the local business_date column."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _ids(self, query):
+        response = self.client.get(f"/api/orders/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return {order["id"] for order in response.data["results"]}
+
+    def test_business_date_uses_local_day(self):
+        # 22:30 UTC on June 1st is already June 2nd in Asia/Jerusalem.
+        order = make_order(self.seller)
+        order.created_at = datetime(2025, 6, 1, 22, 30, tzinfo=dt_timezone.utc)
+        order.business_date = None
+        order.save()
+        self.assertEqual(order.business_date, date(2025, 6, 2))
+
+    def test_specific_date_and_month(self):
+        june = make_order(self.seller)
+        may = make_order(self.seller)
+        Order.objects.filter(id=june.id).update(business_date=date(business_today().year, 6, 2))
+        Order.objects.filter(id=may.id).update(business_date=date(business_today().year, 5, 31))
+        self.assertEqual(self._ids(f"specific_date={business_today().year}-06-02"), {june.id})
+        self.assertEqual(self._ids("month=5"), {may.id})
+        self.assertEqual(self._ids("month=bogus"), {june.id, may.id})
+
+    def test_date_shortcuts(self):
+        today = make_order(self.seller)
+        old = make_order(self.seller)
+        Order.objects.filter(id=old.id).update(business_date=date(2000, 1, 1))
+        self.assertEqual(self._ids("date=today"), {today.id})
+        self.assertEqual(self._ids("date=this_month"), {today.id})
+        self.assertEqual(self._ids("date=yesterday"), set())
+
+    def test_shortcut_ranges_are_half_open(self):
+        today = date(2025, 12, 17)  # a Wednesday
+        self.assertEqual(shortcut_range("this_week", today), (date(2025, 12, 15), date(2025, 12, 18)))
+        self.assertEqual(shortcut_range("this_month", today), (date(2025, 12, 1), date(2026, 1, 1)))
+        self.assertEqual(shortcut_range("yesterday", today), (date(2025, 12, 16), today))
+
+    def test_filter_is_a_plain_column_range(self):
+        make_order(self.seller)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/orders/?date=this_week")
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertIn("business_date", sql)
+        self.assertNotIn("django_datetime_cast", sql)
+
+
+class OrderSequenceTests(TransactionTestCase):
+    """Order numbers come from an atomic per-user counter."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+
+    def test_numbers_are_sequential_per_user(self):
+        other = User.objects.create_user("other", password="x")
+        first = make_order(self.seller, items=0)
+        second = make_order(self.seller, items=0)
+        mine = make_order(other, items=0)
+        self.assertEqual(first.unique_id, "seller-1")
+        self.assertEqual(second.unique_id, "seller-2")
+        self.assertEqual(mine.unique_id, "other-1")
+
+    def test_reserve_block(self):
+        make_order(self.seller, items=0)
+        self.assertEqual(list(OrderSequence.reserve(self.seller.id, 3)), [2, 3, 4])
+        self.assertEqual(make_order(self.seller, items=0).unique_id, "seller-5")
+
+    def test_concurrent_creates_never_collide(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "the shared-cache in-memory test database raises 'table is locked' instead of waiting; "
+                "set DJANGO_TEST_DB_NAME to run against a file"
+            )
+        workers, per_worker = 8, 10
+        errors = []
+        barrier = threading.Barrier(workers)
+
+        def create_orders():
+            try:
+                barrier.wait()
+                for _ in range(per_worker):
+                    make_order(self.seller, items=0)
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=create_orders) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = sorted(
+            int(unique_id.split("-")[-1])
+            for unique_id in Order.objects.filter(user=self.seller).values_list("unique_id", flat=True)
+        )
+        self.assertEqual(numbers, list(range(1, workers * per_worker + 1)))
+
+
+class InventoryReservationTests(TestCase):
+    """Order writes reserve stock in one batch with conditional updates."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.black = InventoryItem.objects.create(product=self.product, size="M", color="black", quantity=5)
+        self.white = InventoryItem.objects.create(product=self.product, size="M", color="white", quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _payload(self, *colors):
+        return {
+            "name": "Customer", "phone": "0599000000", "area": "Ramallah", "areaId": 1, "price": "100.00",
+            "items": [{"type": "t-shirt", "size": "M", "color": color} for color in colors],
+        }
+
+    def _quantity(self, item):
+        item.refresh_from_db()
+        return item.quantity
+
+    def test_create_decrements_stock(self):
+        response = self.client.post("/api/orders/", self._payload("black", "black", "white"), format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self._quantity(self.black), 3)
+        self.assertEqual(self._quantity(self.white), 0)
+
+    def test_every_shortage_is_reported_at_once(self):
+        payload = self._payload("white", "white", "red")
+        response = self.client.post("/api/orders/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        errors = " ".join(response.data["non_field_errors"])
+        self.assertIn("Insufficient stock for t-shirt (Size: M, Color: white)", errors)
+        self.assertIn("Inventory item not found for t-shirt (Size: M, Color: red)", errors)
+        self.assertEqual(self._quantity(self.white), 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_update_swaps_stock(self):
+        order_id = self.client.post("/api/orders/", self._payload("black"), format="json").data["id"]
+        payload = self._payload("white")
+        response = self.client.put(f"/api/orders/{order_id}/", payload, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self._quantity(self.black), 5)
+        self.assertEqual(self._quantity(self.white), 0)
+        self.assertEqual([item["color"] for item in response.data["items"]], ["white"])
+
+    def test_cancel_restocks(self):
+        order_id = self.client.post("/api/orders/", self._payload("black", "black"), format="json").data["id"]
+        response = self.client.patch(f"/api/orders/{order_id}/update_status/", {"status": "cancelled"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._quantity(self.black), 5)
+
+    def test_create_queries_do_not_grow_with_items(self):
+        def create_queries(count):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post("/api/orders/", self._payload(*["black"] * count), format="json")
+            self.assertEqual(response.status_code, 201, response.data)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(create_queries(1), create_queries(4))
+
+    def test_apply_is_all_or_nothing(self):
+        reservation = InventoryReservation().take("t-shirt", "M", "black", 2).take("t-shirt", "M", "white", 2)
+        with self.assertRaises(InventoryShortage) as ctx:
+            reservation.apply()
+        self.assertEqual(len(ctx.exception.messages), 1)
+        self.assertEqual(self._quantity(self.black), 5)
+
+
+class PriceBookTests(TestCase):
+    """Profit pricing loads in bulk, once per request, from current prices."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.shirt = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.hoodie = InventoryProduct.objects.create(name="hoodie", price=80)
+        UserProductPrice.objects.create(user=self.seller, product=self.hoodie, custom_price=70)
+
+    def test_order_of_any_size_costs_at_most_two_queries(self):
+        book = pricing.PriceBook()
+        with self.assertNumQueries(2):
+            total = book.total_cost(self.seller.id, ["t-shirt", "hoodie"] * 50 + ["unknown"])
+        self.assertEqual(total, 50 * 30 + 50 * 70)
+        self.assertEqual(book.unit_cost(self.other.id, "hoodie"), 80)
+
+    def test_prices_are_memoized_per_book_only(self):
+        book = pricing.PriceBook()
+        book.total_cost(self.seller.id, ["t-shirt", "hoodie"])
+        with self.assertNumQueries(0):
+            self.assertEqual(book.total_cost(self.seller.id, ["t-shirt", "hoodie"]), 100)
+
+        self.shirt.price = 35
+        self.shirt.save()
+        self.assertEqual(pricing.PriceBook().unit_cost(self.seller.id, "t-shirt"), 35)
+
+        UserProductPrice.objects.create(user=self.seller, product=self.shirt, custom_price=25)
+        self.assertEqual(pricing.PriceBook().unit_cost(self.seller.id, "t-shirt"), 25)
+
+    def test_order_profit_uses_custom_price(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        InventoryItem.objects.create(product=self.hoodie, size="L", color="black", quantity=3)
+        response = client.post("/api/orders/", {
+            "name": "Customer", "phone": "0599000000", "area": "Ramallah", "areaId": 1, "price": "150.00",
+            "items": [{"type": "hoodie", "size": "L", "color": "black"}],
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get(id=response.data["id"]).profit, 150 - 70 - 20)
+
+
+class BulkOrderImportTests(TestCase):
+    """POST /api/orders/bulk/ imports batches in one pass."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.black = InventoryItem.objects.create(product=product, size="M", color="black", quantity=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _row(self, *colors, **fields):
+        row = {"name": "Customer", "phone": "0599000000", "area": "Ramallah", "areaId": 1, "price": "100.00"}
+        row.update(fields)
+        row["items"] = [{"type": "t-shirt", "size": "M", "color": color} for color in colors]
+        return row
+
+    def test_atomic_batch_creates_everything(self):
+        rows = [self._row("black"), self._row("black", "black")]
+        response = self.client.post("/api/orders/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([r["unique_id"] for r in response.data["results"]], ["seller-1", "seller-2"])
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.quantity, 0)
+        order = Order.objects.get(unique_id="seller-2")
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.profit, 100 - 60 - 20)
+        self.assertIsNotNone(order.business_date)
+        # The per-order path continues the same sequence.
+        self.assertEqual(make_order(self.seller, items=0).unique_id, "seller-3")
+
+    def test_atomic_batch_is_all_or_nothing(self):
+        rows = [self._row("black", "black"), self._row("black", "black"), self._row("black", price="oops")]
+        response = self.client.post("/api/orders/bulk/", {"orders": rows, "mode": "atomic"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r["status"] for r in response.data["results"]], ["skipped", "skipped", "error"])
+        self.assertFalse(Order.objects.exists())
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.quantity, 3)
+
+    def test_best_effort_creates_what_fits(self):
+        rows = [self._row("black", "black"), self._row("black", "black"), self._row("black"), self._row("red")]
+        response = self.client.post("/api/orders/bulk/?mode=best_effort", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        statuses = [r["status"] for r in response.data["results"]]
+        self.assertEqual(statuses, ["created", "error", "created", "error"])
+        self.assertIn("Insufficient stock", response.data["results"][1]["errors"]["non_field_errors"][0])
+        self.assertIn("not found", response.data["results"][3]["errors"]["non_field_errors"][0])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_csv_upload_groups_items_by_ref(self):
+        content = (
+            "ref,name,phone,area,areaId,cod,price,type,size,color\n"
+            "a,Sara,0599111111,Nablus,5,true,120,t-shirt,M,black\n"
+            "a,,,,,,,t-shirt,M,black\n"
+            ",Omar,0599222222,Jenin,6,false,90,t-shirt,M,black\n"
+        )
+        upload = SimpleUploadedFile("orders.csv", content.encode("utf-8"), content_type="text/csv")
+        response = self.client.post("/api/orders/bulk/", {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["results"][0]["ref"], "a")
+        self.assertEqual(Order.objects.get(name="Sara").items.count(), 2)
+        self.assertTrue(Order.objects.get(name="Sara").cod)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def import_queries(count):
+            InventoryItem.objects.filter(id=self.black.id).update(quantity=100)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post("/api/orders/bulk/", [self._row("black")] * count, format="json")
+            self.assertEqual(response.status_code, 201)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(import_queries(2), import_queries(20))
+
+    def test_business_date_follows_created_at_across_midnight(self):
+        # The batch's business day is picked just before midnight; created_at is stamped after it.
+        calls = []
+
+        def before_midnight(value):
+            calls.append(value)
+            return to_business_date(value) - timedelta(days=1 if len(calls) == 1 else 0)
+
+        with mock.patch("api.bulk.to_business_date", before_midnight):
+            response = self.client.post("/api/orders/bulk/", [self._row("black")], format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get()
+        self.assertEqual(order.business_date, to_business_date(order.created_at))
+        self.assertEqual(
+            list(OrderRollup.objects.filter(order_count__gt=0).values_list("business_date", flat=True)),
+            [order.business_date],
+        )
+
+
+class StubCourier:
+    """Local HTTP server standing in for the courier API.
+
+    `statuses` is consumed one per request (the last one repeats); every
+    request body is recorded in `requests`.
+    """
+
+    def __init__(self, statuses=(200,), response=None):
+        self.statuses = list(statuses)
+        self.response = response or {"result": {"records": []}}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append({"path": self.path, "body": json.loads(body or b"null")})
+                code = stub.statuses.pop(0) if len(stub.statuses) > 1 else stub.statuses[0]
+                payload = json.dumps(stub.handle(self.path, stub.requests[-1]["body"]) if code == 200 else {}).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def handle(self, path, body):
+        return self.response
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(COURIER_EXPORT_CHUNK_SIZE=2, COURIER_EXPORT_RETRY_BACKOFF=0, COURIER_EXPORT_MAX_RETRIES=2)
+class CourierExportJobTests(TestCase):
+    """export queues a job; the worker sends chunks and marks orders delivered."""
+
+    def setUp(self):
+        courier.breaker.reset()
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.seller = User.objects.create_user("seller", password="x")
+        self.shipped = [make_order(self.seller, items=0, status="shipped") for _ in range(5)]
+        self.pending = make_order(self.seller, items=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _export(self):
+        response = self.client.get("/api/orders/export/")
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_export_only_enqueues(self):
+        data = self._export()
+        self.assertEqual(data["orders_queued"], 5)
+        self.assertEqual(Order.objects.filter(status="shipped").count(), 5)
+        status_response = self.client.get(f"/api/export-jobs/{data['job_id']}/")
+        self.assertEqual(status_response.data["status"], "queued")
+
+    def test_worker_sends_chunks_and_marks_delivered(self):
+        data = self._export()
+        with StubCourier() as courier, override_settings(COURIER_EXPORT_URL=courier.url + "/create_super_multi_orders"):
+            call_command("run_export_jobs", "--once", stdout=io.StringIO())
+        self.assertEqual(len(courier.requests), 3)
+        sent = [order["reference_id"] for r in courier.requests for order in json.loads(r["body"])["orders_list"]]
+        self.assertEqual(sorted(sent), sorted(o.unique_id for o in self.shipped))
+        self.assertEqual(Order.objects.filter(status="delivered").count(), 5)
+        job = self.client.get(f"/api/export-jobs/{data['job_id']}/").data
+        self.assertEqual((job["status"], job["submitted"], job["failed"]), ("succeeded", 5, 0))
+
+    def test_transient_failures_are_retried(self):
+        self._export()
+        with StubCourier(statuses=[503, 200]) as courier, override_settings(COURIER_EXPORT_URL=courier.url):
+            jobs.run_pending_jobs()
+        self.assertEqual(len(courier.requests), 4)
+        self.assertEqual(Order.objects.filter(status="delivered").count(), 5)
+
+    def test_rejected_chunks_stay_shipped_and_rerun_is_idempotent(self):
+        data = self._export()
+        with StubCourier(statuses=[200, 400, 200]) as courier, override_settings(COURIER_EXPORT_URL=courier.url):
+            jobs.run_pending_jobs()
+        job = CourierExportJob.objects.get(id=data["job_id"])
+        self.assertEqual((job.status, job.submitted, job.failed), ("failed", 3, 2))
+        self.assertEqual(Order.objects.filter(status="shipped").count(), 2)
+
+        # Re-queue the job: only the orders that were not accepted are sent.
+        CourierExportJob.objects.filter(id=job.id).update(status="queued")
+        with StubCourier() as courier, override_settings(COURIER_EXPORT_URL=courier.url):
+            jobs.run_pending_jobs()
+        self.assertEqual(len(courier.requests), 1)
+        self.assertEqual(len(json.loads(courier.requests[0]["body"])["orders_list"]), 2)
+        self.assertFalse(Order.objects.filter(status="shipped").exists())
+
+    def test_orders_changed_during_submission_are_not_counted(self):
+        data = self._export()
+        submit_chunk = jobs.submit_chunk
+
+        def cancel_while_sending(job, payload):
+            Order.objects.filter(id=self.shipped[0].id).update(status="cancelled")
+            return submit_chunk(job, payload)
+
+        with StubCourier() as courier, override_settings(COURIER_EXPORT_URL=courier.url), \
+                mock.patch.object(jobs, "submit_chunk", cancel_while_sending):
+            jobs.run_pending_jobs()
+        job = CourierExportJob.objects.get(id=data["job_id"])
+        self.assertEqual((job.status, job.submitted, job.failed), ("succeeded", 4, 0))
+        self.assertEqual(Order.objects.get(id=self.shipped[0].id).status, "cancelled")
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        data = self._export()
+        self.assertEqual(jobs.claim_next_job().id, data["job_id"])
+        self.assertIsNone(jobs.claim_next_job())
+        CourierExportJob.objects.filter(id=data["job_id"]).update(heartbeat_at=datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(jobs.claim_next_job().id, data["job_id"])
+
+
+class MediaRootMixin:
+    """Runs the test against a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_MODE="off")
+        self.media_override.enable()
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+    def write_media(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as handle:
+            handle.write(content)
+        return name
+
+
+class DesignExportTests(MediaRootMixin, TestCase):
+    """Design exports stream a ZIP without copying files first."""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.seller = User.objects.create_user("seller", password="x")
+        png = Design.objects.create(
+            user=self.seller, name="logo", file=self.write_media("designs/user_1/logo.png", b"\x89PNG" + b"p" * 5000)
+        )
+        svg = Design.objects.create(
+            user=self.seller, name="art", file=self.write_media("designs/user_1/art.svg", b"<svg>" + b"s" * 5000)
+        )
+        gone = Design.objects.create(user=self.seller, name="gone", file="designs/user_1/gone.png")
+        make_order(self.seller, design=png, items=2)
+        make_order(self.seller, design=svg, items=1)
+        make_order(self.seller, design=gone, items=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        today = business_today().isoformat()
+        self.url = f"/api/orders/export_designs_by_order_date/?start_date={today}&end_date={today}"
+
+    def _check_archive(self, archive):
+        infos = {info.filename: info for info in archive.infolist()}
+        self.assertEqual(set(infos), {"logo.png", "logo_copy1.png", "art.svg"})
+        self.assertEqual(infos["logo.png"].compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(infos["art.svg"].compress_type, zipfile.ZIP_DEFLATED)
+        self.assertIsNone(archive.testzip())
+
+    def test_stream_delivery(self):
+        response = self.client.get(self.url + "&delivery=stream")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self._check_archive(zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "exported_order_designs")))
+
+    def test_file_delivery_writes_a_single_zip(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["message"], "3 designs collected and zipped.")
+        export_dir = os.path.join(self.media_root, "exported_order_designs")
+        self.assertEqual(len(os.listdir(export_dir)), 1)
+        name = os.listdir(export_dir)[0]
+        self.assertTrue(urlsplit(response.data["zip_url"]).path.endswith(name))
+        self._check_archive(zipfile.ZipFile(os.path.join(export_dir, name)))
+        # The link is signed: a browser download carries no Authorization header.
+        download = APIClient().get(response.data["zip_url"])
+        self.assertEqual(download.status_code, 200)
+        self._check_archive(zipfile.ZipFile(io.BytesIO(b"".join(download.streaming_content))))
+
+    def test_no_designs_is_404(self):
+        response = self.client.get(
+            "/api/orders/export_designs_by_order_date/?start_date=2000-01-01&end_date=2000-01-02"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_zip_is_chunked(self):
+        self.write_media("big.png", os.urandom(64 * 1024))
+        chunks = list(exports.stream_zip([("big.png", "big.png")], chunk_size=4096))
+        self.assertGreater(len(chunks), 8)
+        self.assertLess(max(len(chunk) for chunk in chunks), 16 * 1024)
+
+
+class ContentAddressedStorageTests(MediaRootMixin, TestCase):
+    """Uploads are stored once per content hash and reference counted."""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.client = APIClient()
+
+    def _upload(self, user, filename, content):
+        self.client.force_authenticate(user)
+        upload = SimpleUploadedFile(filename, content, content_type="image/png")
+        response = self.client.post("/api/designs/", {"name": filename, "file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.data)
+        return Design.objects.get(id=response.data["id"])
+
+    def _blob_files(self):
+        root = os.path.join(self.media_root, "blobs")
+        return [
+            name for folder, _, files in os.walk(root) if not folder.endswith("tmp") for name in files
+        ]
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self._upload(self.seller, "barce.png", b"same artwork")
+        second = self._upload(self.other, "barce-copy.png", b"same artwork")
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith("blobs/"))
+        self.assertEqual(second.original_filename, "barce-copy.png")
+        self.assertEqual(len(self._blob_files()), 1)
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).ref_count, 2)
+
+    def test_same_content_under_another_extension(self):
+        png = self._upload(self.seller, "a.png", b"same artwork")
+        jpg = self._upload(self.seller, "a.jpg", b"same artwork")
+        self.assertNotEqual(png.file.name, jpg.file.name)
+        self.assertEqual(StoredBlob.objects.filter(sha256=digest_from_name(png.file.name)).count(), 2)
+
+        Design.objects.create(user=self.other, name="legacy", file=self.write_media("designs/user_2/a.jpeg", b"same artwork"))
+        call_command("dedupe_media", stdout=io.StringIO())
+        self.assertEqual(StoredBlob.objects.count(), 3)
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        first = self._upload(self.seller, "a.png", b"artwork")
+        second = self._upload(self.other, "b.png", b"artwork")
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(len(self._blob_files()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self._blob_files(), [])
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_upload_reusing_a_blob_being_collected_keeps_it(self):
+        first = self._upload(self.seller, "a.png", b"artwork")
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        add_reference = storage.add_reference
+
+        def collect_then_add_reference(name):
+            # The deferred delete lands after _save found the file, before the row counts it.
+            for callback in callbacks:
+                callback()
+            add_reference(name)
+
+        with mock.patch.object(storage, "add_reference", collect_then_add_reference):
+            second = self._upload(self.other, "b.png", b"artwork")
+        self.assertEqual(StoredBlob.objects.get(name=second.file.name).ref_count, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, second.file.name)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self._blob_files(), [])
+
+    def test_backfill_moves_existing_files(self):
+        name_a = self.write_media("designs/user_1/barce.png", b"legacy")
+        name_b = self.write_media("designs/user_2/barce.png", b"legacy")
+        Design.objects.create(user=self.seller, name="a", file=name_a)
+        Design.objects.create(user=self.other, name="b", file=name_b)
+        Mockup.objects.create(user=self.seller, name="m", file=name_a)
+
+        call_command("dedupe_media", "--delete-originals", stdout=io.StringIO())
+
+        names = set(Design.objects.values_list("file", flat=True)) | set(Mockup.objects.values_list("file", flat=True))
+        self.assertEqual(len(names), 1)
+        blob = StoredBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(Design.objects.get(name="a").display_filename, "barce.png")
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, name_a)))
+
+    def test_export_can_skip_files_already_written(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        first = self._upload(self.seller, "a.png", b"artwork")
+        second = self._upload(self.other, "b.png", b"artwork")
+        make_order(self.seller, design=first, items=2)
+        make_order(self.other, design=second, items=1)
+        self.client.force_authenticate(staff)
+        today = business_today().isoformat()
+        url = f"/api/orders/export_designs_by_order_date/?start_date={today}&end_date={today}&delivery=stream"
+
+        names = zipfile.ZipFile(io.BytesIO(b"".join(self.client.get(url).streaming_content))).namelist()
+        self.assertEqual(sorted(names), ["a.png", "a_copy1.png", "b.png"])
+        names = zipfile.ZipFile(io.BytesIO(b"".join(self.client.get(url + "&dedupe=true").streaming_content))).namelist()
+        self.assertEqual(names, ["a.png"])
+
+
+@override_settings(THUMBNAIL_SIZES={"small": 32, "large": 64})
+class ThumbnailTests(MediaRootMixin, TestCase):
+    """Mockups and designs expose WebP thumbnails rendered off the request path."""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _png(self, width=200, height=100):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def _upload(self):
+        upload = SimpleUploadedFile("art.png", self._png(), content_type="image/png")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/designs/", {"name": "art", "file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.data)
+        return Design.objects.get(id=response.data["id"])
+
+    def test_original_is_served_until_thumbnails_exist(self):
+        design = self._upload()
+        response = self.client.get(f"/api/designs/{design.id}/")
+        self.assertEqual(set(response.data["thumbnails"]), {"small", "large"})
+        for url in response.data["thumbnails"].values():
+            self.assertEqual(urlsplit(url).path, design.file.url)
+
+    @override_settings(THUMBNAIL_MODE="sync")
+    def test_saving_renders_each_size_once(self):
+        from PIL import Image
+
+        design = self._upload()
+        response = self.client.get(f"/api/designs/{design.id}/")
+        small = thumbnails.thumbnail_name(design.file.name, "small")
+        self.assertTrue(urlsplit(response.data["thumbnails"]["small"]).path.endswith(small))
+        with Image.open(os.path.join(self.media_root, small)) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (32, 16))
+        self.assertEqual(thumbnails.missing_sizes(design.file.name), [])
+        blob = StoredBlob.objects.get(name=design.file.name)
+        self.assertEqual((blob.thumbnail_status, blob.thumbnail_sizes), ("ready", ["small", "large"]))
+
+    @override_settings(THUMBNAIL_MODE="sync")
+    def test_reads_use_the_stored_state_without_storage_calls(self):
+        self._upload()
+        self._upload()
+        with mock.patch.object(default_storage, "exists", side_effect=AssertionError("storage call")), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/designs/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(1 for query in queries.captured_queries if "api_storedblob" in query["sql"]), 1)
+
+    @override_settings(THUMBNAIL_MODE="sync", THUMBNAIL_RETRY_BACKOFF=60)
+    def test_failed_renders_are_retried_on_upload_with_backoff(self):
+        def upload_broken():
+            upload = SimpleUploadedFile("broken.png", b"not a png", content_type="image/png")
+            with self.captureOnCommitCallbacks(execute=True), mock.patch("sys.stdout", new_callable=io.StringIO):
+                return self.client.post("/api/designs/", {"name": "broken", "file": upload}, format="multipart").data["id"]
+
+        design_id = upload_broken()
+        blob = StoredBlob.objects.get(name=Design.objects.get(id=design_id).file.name)
+        self.assertEqual((blob.thumbnail_status, blob.thumbnail_attempts), ("failed", 1))
+
+        with mock.patch.object(thumbnails, "render_sizes") as render:
+            StoredBlob.objects.filter(id=blob.id).update(thumbnail_retry_at=timezone.now())
+            # Reads never queue a render, even once the backoff has passed.
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(f"/api/designs/{design_id}/")
+            render.assert_not_called()
+            self.assertFalse([query for query in queries.captured_queries if query["sql"].startswith("UPDATE")])
+
+            upload_broken()
+            upload_broken()
+            self.assertEqual(render.call_count, 1)
+        blob.refresh_from_db()
+        self.assertEqual((blob.thumbnail_status, blob.thumbnail_attempts), ("failed", 2))
+        self.assertGreater(blob.thumbnail_retry_at, timezone.now() + timedelta(seconds=100))
+
+    def test_non_images_fall_back_to_the_original(self):
+        name = self.write_media("designs/spec.pdf", b"%PDF-1.4")
+        design = Design.objects.create(user=self.seller, name="spec", file=name)
+        self.assertEqual(
+            thumbnails.thumbnail_urls(design.file), {"small": design.file.url, "large": design.file.url}
+        )
+
+
+class DailyCollectionTests(MediaRootMixin, TestCase):
+    """collect_designs only copies and appends designs it has not collected yet."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _design(self, filename, content):
+        name = self.write_media(f"designs/{filename}", content)
+        return Design.objects.create(user=self.admin, name=filename, file=name)
+
+    def _collect(self):
+        response = self.client.post("/api/designs/collect_designs/")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_repeated_runs_append_only_new_designs(self):
+        first = self._design("a.png", b"first")
+        data = self._collect()
+        self.assertEqual([added["id"] for added in data["added"]], [first.id])
+        self.assertIsNone(data["previous_run_at"])
+
+        self.assertEqual(self._collect()["added"], [])
+
+        second = self._design("a.png", b"second")
+        data = self._collect()
+        self.assertEqual(data["added"], [{"id": second.id, "name": "a.png", "filename": "a_copy1.png"}])
+        self.assertEqual(data["total_count"], 2)
+        self.assertIsNotNone(data["previous_run_at"])
+
+        zip_path = os.path.join(self.media_root, "collected_designs", f"{data['date']}.zip")
+        with zipfile.ZipFile(zip_path) as archive:
+            self.assertEqual(archive.namelist(), ["a.png", "a_copy1.png"])
+            self.assertEqual(archive.read("a_copy1.png"), b"second")
+
+    def test_interrupted_run_is_not_appended_twice(self):
+        design = self._design("a.png", b"art")
+        collection = DailyCollection()
+        # The archive got the design but the manifest was never written.
+        exports.append_zip([("a.png", design.file.name)], collection.zip_path)
+        added, manifest = collection.collect()
+        self.assertEqual([entry["id"] for entry in added], [design.id])
+        with zipfile.ZipFile(collection.zip_path) as archive:
+            self.assertEqual(archive.namelist(), ["a.png"])
+
+
+class ReturnsCourier(StubCourier):
+    """Serves `records` like the courier's search_read: keyset domain plus limit."""
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def handle(self, path, body):
+        params = body["params"]
+        domain = params["domain"]
+        records = self.records
+        if len(domain) > 1:
+            after = (domain[2][2], domain[5][2])
+            records = [record for record in records if (record["write_date"], record["id"]) > after]
+        return {"result": {"records": records[:params["limit"]]}}
+
+
+@override_settings(COURIER_RETURNS_PAGE_SIZE=2, RESTOCK_RETURNED_ORDERS=True, COURIER_RETRY_BACKOFF=0)
+class ReturnSyncTests(TestCase):
+    """sync_returns pages through new courier returns and applies them in bulk."""
+
+    def setUp(self):
+        courier.breaker.reset()
+        self.seller = User.objects.create_user("seller", password="x")
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.black = InventoryItem.objects.create(product=product, size="M", color="black", quantity=0)
+        self.orders = [make_order(self.seller, status="delivered") for _ in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _record(self, record_id, order, write_date="2026-10-01 10:00:00"):
+        return {"id": record_id, "reference_id": order.unique_id, "state": "completed_returned", "write_date": write_date}
+
+    def _sync(self, courier, **params):
+        with override_settings(COURIER_RETURNS_URL=courier.url):
+            response = self.client.get("/api/orders/sync_returns/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_returns_are_applied_page_by_page(self):
+        records = [self._record(index + 1, order) for index, order in enumerate(self.orders)]
+        records.append({"id": 9, "reference_id": "unknown-1", "state": "completed_returned", "write_date": "2026-10-02 08:00:00"})
+        with ReturnsCourier(records) as courier:
+            data = self._sync(courier)
+        self.assertEqual(data["pages"], 2)
+        self.assertEqual(data["updated_orders"], 3)
+        self.assertEqual(data["skipped_orders"], 1)
+        self.assertEqual(data["high_water_mark"], {"write_date": "2026-10-02 08:00:00", "id": 9})
+        for order in Order.objects.filter(id__in=[order.id for order in self.orders]):
+            self.assertEqual((order.status, order.price, order.profit), ("returned", 0, -60))
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.quantity, 6)
+
+    @override_settings(RESTOCK_RETURNED_ORDERS=False)
+    def test_restocking_is_opt_in(self):
+        with ReturnsCourier([self._record(1, self.orders[0])]) as courier:
+            data = self._sync(courier)
+        self.assertEqual(data["updated_orders"], 1)
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.quantity, 0)
+
+    def test_next_run_only_fetches_newer_changes(self):
+        first = self._record(1, self.orders[0])
+        with ReturnsCourier([first]) as courier:
+            self._sync(courier)
+        second = self._record(2, self.orders[1], write_date="2026-10-01 10:00:00")
+        with ReturnsCourier([first, second]) as courier:
+            data = self._sync(courier)
+            self.assertEqual(len(courier.requests), 1)
+        self.assertEqual(data["total_external_returns_processed"], 1)
+        self.assertEqual(data["updated_orders"], 1)
+        self.orders[2].refresh_from_db()
+        self.assertEqual(self.orders[2].status, "delivered")
+
+    def test_failed_fetch_keeps_the_high_water_mark(self):
+        with StubCourier(statuses=[500]) as courier:
+            with override_settings(COURIER_RETURNS_URL=courier.url):
+                response = self.client.get("/api/orders/sync_returns/")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(CourierSyncState.objects.get(name="returns").last_write_date, "")
+
+
+@override_settings(COURIER_MAX_RETRIES=2, COURIER_RETRY_BACKOFF=0, COURIER_BREAKER_THRESHOLD=3, COURIER_BREAKER_RESET=60)
+class CourierClientTests(TestCase):
+    """The courier client retries, times every call and trips a circuit breaker."""
+
+    def setUp(self):
+        courier.breaker.reset()
+        courier.latency.clear()
+
+    def tearDown(self):
+        courier.breaker.reset()
+
+    def test_retries_transient_statuses_and_records_latency(self):
+        with StubCourier(statuses=[502, 200]) as stub:
+            response = courier.post(stub.url, "test", json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stub.requests), 2)
+        stats = courier.latency_stats()["test"]
+        self.assertEqual((stats["calls"], stats["errors"]), (2, 1))
+
+    def test_client_errors_are_returned_without_retrying(self):
+        with StubCourier(statuses=[400]) as stub:
+            self.assertEqual(courier.post(stub.url, "test", json={}).status_code, 400)
+        self.assertEqual(len(stub.requests), 1)
+        self.assertFalse(courier.breaker.is_open)
+
+    def test_open_breaker_fails_fast(self):
+        with StubCourier(statuses=[503]) as stub:
+            self.assertEqual(courier.post(stub.url, "test", json={}).status_code, 503)
+            self.assertTrue(courier.breaker.is_open)
+            with self.assertRaises(courier.CourierUnavailable):
+                courier.post(stub.url, "test", json={})
+        self.assertEqual(len(stub.requests), 3)
+
+
+class OrderRollupTests(TestCase):
+    """Rollups follow every order write and match a rebuild from scratch."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        InventoryItem.objects.create(product=product, size="M", color="black", quantity=100)
+        self.client = APIClient()
+
+    def _rollups(self):
+        return sorted(
+            OrderRollup.objects.filter(order_count__gt=0).values_list(
+                "user_id", "business_date", "status", "order_count", "revenue", "profit"
+            )
+        )
+
+    def _assert_matches_rebuild(self):
+        incremental = self._rollups()
+        rollups.rebuild()
+        self.assertEqual(incremental, self._rollups())
+
+    def test_rollups_follow_saves_status_changes_and_bulk_writes(self):
+        first = make_order(self.seller, price=100)
+        make_order(self.other, price=50)
+        self.client.force_authenticate(self.seller)
+        response = self.client.patch(f"/api/orders/{first.id}/update_status/", {"status": "cancelled"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        shipped = make_order(self.seller, status="shipped", price=70)
+        with transaction.atomic():
+            returns.apply_returns([{"reference_id": shipped.unique_id}])
+
+        rows = [{"name": "A", "phone": "0599", "area": "Jenin", "price": "80", "items": [{"type": "t-shirt", "size": "M", "color": "black"}]}]
+        bulk.BulkOrderImport(self.seller, rows).run()
+        self._assert_matches_rebuild()
+
+        first.delete()
+        self._assert_matches_rebuild()
+
+    def test_report_sums_rollups_for_the_requesting_seller(self):
+        make_order(self.seller, price=100)
+        make_order(self.seller, price=40, status="delivered")
+        make_order(self.other, price=999)
+        cancelled = make_order(self.seller, price=60)
+        cancelled.status, cancelled.price = "cancelled", 0
+        cancelled.save()
+
+        self.client.force_authenticate(self.seller)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/orders/report/", {"date": "today"})
+        self.assertEqual(response.status_code, 200)
+        totals = response.data["totals"]
+        self.assertEqual((totals["orders"], totals["revenue"], totals["cancelled"]), (3, 140, 1))
+        self.assertEqual(response.data["results"][0]["period"], business_today().isoformat())
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get("/api/orders/report/", {"group_by": "month"})
+        self.assertEqual(response.data["totals"]["orders"], 4)
+        self.assertEqual(response.data["results"][0]["period"], business_today().strftime("%Y-%m"))
+        response = self.client.get("/api/orders/report/", {"user_id": self.other.id})
+        self.assertEqual(response.data["totals"]["revenue"], 999)
+        self.assertEqual(self.client.get("/api/orders/report/", {"user_id": "abc"}).status_code, 400)
+
+
+class CatalogCacheTests(TestCase):
+    """The public catalog is built in one query, cached and served with ETags."""
+
+    def setUp(self):
+        cache.clear()
+        self.product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.black = InventoryItem.objects.create(product=self.product, size="M", color="black", quantity=5)
+        InventoryItem.objects.create(product=self.product, size="L", color="white", quantity=2)
+        InventoryProduct.objects.create(name="mug", price=15)
+        self.client = APIClient()
+
+    def test_catalog_is_built_in_one_query_and_then_cached(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/inventory-products/")
+        self.assertEqual([len(product["variants"]) for product in response.data], [2, 0])
+        self.assertEqual(response.data[0]["variants"][0]["product_name"], "t-shirt")
+        with self.assertNumQueries(0):
+            self.client.get("/api/inventory-products/")
+            detail = self.client.get(f"/api/inventory-products/{self.product.id}/")
+        self.assertEqual(detail.data["name"], "t-shirt")
+
+    def test_matching_etag_gets_304(self):
+        etag = self.client.get("/api/inventory-products/")["ETag"]
+        response = self.client.get("/api/inventory-products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_stock_changes_invalidate_after_commit(self):
+        etag = self.client.get("/api/inventory-products/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            InventoryReservation().take("t-shirt", "M", "black", 2).apply()
+        response = self.client.get("/api/inventory-products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["variants"][0]["quantity"], 3)
+
+    def test_invalidation_reaches_other_workers(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        file_cache = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+        env = {key: value for key, value in os.environ.items() if key != "REDIS_URL"}
+        with override_settings(CACHES=file_cache):
+            before = catalog._generation()
+            script = "import django; django.setup(); from api import catalog; catalog.invalidate()"
+            subprocess.run(
+                [sys.executable, "-c", script], cwd=settings.BASE_DIR, check=True,
+                env={**env, "DJANGO_SETTINGS_MODULE": "order_management.settings", "CACHE_DIR": cache_dir},
+            )
+            self.assertNotEqual(catalog._generation(), before)
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+        entry = catalog.build()
+
+        def slow_build():
+            # Threads cannot see this test's uncommitted rows; hand out a prebuilt entry.
+            builds.append(1)
+            time.sleep(0.2)
+            return entry
+
+        with mock.patch.object(catalog, "build", slow_build):
+            threads = [threading.Thread(target=catalog.get_catalog) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(builds), 1)
+
+
+class OrderConditionalGetTests(TestCase):
+    """Unchanged order polls get a 304 without loading the order graph."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.order = make_order(self.seller)
+        make_order(self.seller)
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def test_unchanged_list_is_not_modified_with_one_query(self):
+        response = self.client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            repeat = self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat["ETag"], response["ETag"])
+
+    def test_list_etag_changes_on_update_and_delete(self):
+        etag = self.client.get("/api/orders/")["ETag"]
+        self.order.name = "Changed"
+        self.order.save()
+        changed = self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        Order.objects.exclude(id=self.order.id).delete()
+        self.assertEqual(self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 200)
+
+    def test_detail_uses_the_order_updated_at(self):
+        response = self.client.get(f"/api/orders/{self.order.id}/")
+        # Signed URLs expire on a clock a date validator cannot follow.
+        self.assertNotIn("Last-Modified", response)
+        with self.assertNumQueries(1):
+            repeat = self.client.get(f"/api/orders/{self.order.id}/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(repeat.status_code, 304)
+        self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "processing"}, format="json")
+        self.assertEqual(
+            self.client.get(f"/api/orders/{self.order.id}/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200
+        )
+
+    def test_new_signing_window_refreshes_media_urls(self):
+        design = Design.objects.create(user=self.seller, name="art", file=f"blobs/ab/{'a' * 64}.png")
+        make_order(self.seller, design=design, items=1)
+        now = time.time()
+        with mock.patch("api.media.time.time", return_value=now):
+            response = self.client.get("/api/orders/")
+            self.assertEqual(self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        with mock.patch("api.media.time.time", return_value=now + settings.MEDIA_SIGNED_URL_TTL):
+            fresh = self.client.get("/api/orders/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh["ETag"], response["ETag"])
+        expires = [
+            int(parse_qs(urlsplit(item["design_details"]["file"]).query)["e"][0])
+            for r in (response, fresh) for order in r.data["results"] for item in order["items"] if item["design"]
+        ]
+        self.assertGreater(expires[1], expires[0])
+
+    def test_recorded_thumbnail_changes_the_etag(self):
+        etag = self.client.get(f"/api/orders/{self.order.id}/")["ETag"]
+        thumbnails.record("blobs/ab/missing.png")
+        self.assertEqual(
+            self.client.get(f"/api/orders/{self.order.id}/", HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_other_sellers_cannot_probe_orders(self):
+        other = User.objects.create_user("other", password="x")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f"/api/orders/{self.order.id}/", HTTP_IF_NONE_MATCH="*").status_code, 404)
+
+
+class MediaServingTests(MediaRootMixin, TestCase):
+    """/media/ checks ownership, then offloads or serves ranges itself."""
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.blob = self.write_media("blobs/ab/abcdef.png", b"0123456789")
+        Design.objects.create(user=self.seller, name="art", file=self.blob)
+        self.client = APIClient()
+
+    def test_only_owners_and_staff_get_uploads(self):
+        self.assertEqual(self.client.get(f"/media/{self.blob}").status_code, 404)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(f"/media/{self.blob}").status_code, 404)
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(f"/media/{self.blob}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        export = self.write_media("exported_order_designs/day.zip", b"zip")
+        self.assertEqual(self.client.get(f"/media/{export}").status_code, 404)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(f"/media/{export}").status_code, 200)
+
+    def test_range_requests(self):
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(f"/media/{self.blob}", HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        suffix = self.client.get(f"/media/{self.blob}", HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(suffix.streaming_content), b"789")
+        self.assertEqual(self.client.get(f"/media/{self.blob}", HTTP_RANGE="bytes=20-").status_code, 416)
+
+    def test_revalidation_and_traversal(self):
+        self.client.force_authenticate(self.seller)
+        etag = self.client.get(f"/media/{self.blob}")["ETag"]
+        self.assertEqual(self.client.get(f"/media/{self.blob}", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+
+    def test_signed_urls_work_without_authentication(self):
+        self.client.force_authenticate(self.seller)
+        upload = SimpleUploadedFile("art.png", b"artwork", content_type="image/png")
+        design = self.client.post("/api/designs/", {"name": "art", "file": upload}, format="multipart").data
+        browser = APIClient()
+        response = browser.get(design["file"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"artwork")
+        self.assertEqual(browser.get(design["thumbnails"]["small"]).status_code, 200)
+
+        url = urlsplit(design["file"])
+        self.assertEqual(browser.get(url.path).status_code, 404)
+        self.assertEqual(browser.get(f"{url.path}?{url.query.replace('s=', 's=x')}").status_code, 404)
+        # A signature is bound to its path, and ownership is still checked.
+        self.assertEqual(browser.get(f"/media/{self.blob}?{url.query}").status_code, 404)
+        other_url = media.signed_url(self.blob, self.other)
+        self.assertEqual(browser.get(other_url).status_code, 404)
+        with mock.patch("api.media.time.time", return_value=time.time() + 3 * 24 * 60 * 60):
+            self.assertEqual(browser.get(design["file"]).status_code, 404)
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel", MEDIA_ACCEL_PREFIX="/protected-media/")
+    def test_proxy_offload(self):
+        self.client.force_authenticate(self.seller)
+        response = self.client.get(f"/media/{self.blob}")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.blob}")
+        self.assertEqual(response.content, b"")
+        with override_settings(MEDIA_SERVE_MODE="x-sendfile"):
+            response = self.client.get(f"/media/{self.blob}")
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.media_root, self.blob))
+
+
+class OrderSearchTests(TestCase):
+    """?search= goes through the indexes and ranks exact matches first."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("barce", password="x")
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.exact = make_order(self.seller, name="Ahmad Saleh", phone="0599123")
+        self.longer = make_order(self.seller, name="Sara Khalil", phone="0599123456")
+        self.other = make_order(self.seller, name="Omar 0599123", phone="0522000000")
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _search(self, term, **params):
+        response = self.client.get("/api/orders/", {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [order["id"] for order in response.data["results"]]
+
+    def test_exact_then_prefix_then_text_matches(self):
+        self.assertEqual(self._search("0599123"), [self.exact.id, self.longer.id, self.other.id])
+
+    def test_words_usernames_and_unique_id_prefixes(self):
+        self.assertEqual(self._search("khal"), [self.longer.id])
+        self.assertEqual(len(self._search("barce")), 3)
+        self.assertEqual(self._search(self.exact.unique_id)[0], self.exact.id)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.longer.name = "Layla Haddad"
+        self.longer.save()
+        self.assertEqual(self._search("khalil"), [])
+        self.assertEqual(self._search("layla"), [self.longer.id])
+        self.longer.delete()
+        self.assertEqual(self._search("layla"), [])
+        self.seller.username = "renamed"
+        self.seller.save()
+        self.assertEqual(len(self._search("renamed")), 2)
+
+    def test_ranked_results_page_with_cursors(self):
+        first = self.client.get("/api/orders/", {"search": "0599123", "page_size": 1})
+        ids = [order["id"] for order in first.data["results"]]
+        url = first.data["next"]
+        while url:
+            page = self.client.get(url)
+            ids += [order["id"] for order in page.data["results"]]
+            url = page.data["next"]
+        self.assertEqual(ids, [self.exact.id, self.longer.id, self.other.id])
+        back = self.client.get(page.data["previous"])
+        self.assertEqual([order["id"] for order in back.data["results"]], [self.longer.id])
+
+
+class RecipientDirectoryTests(TestCase):
+    """Orders feed a per-seller directory keyed by normalized phone."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def test_normalize_phone(self):
+        for raw in ("0599123456", "+970 59-912-3456", "00972599123456", "599123456", "٠٥٩٩١٢٣٤٥٦"):
+            self.assertEqual(recipients.normalize_phone(raw), "0599123456", raw)
+        self.assertEqual(recipients.normalize_phone("n/a"), "")
+
+    def test_orders_share_a_recipient_per_seller(self):
+        first = make_order(self.seller, name="Sara", phone="0599123456", items=0)
+        second = make_order(self.seller, name="Sara K.", phone="+970599123456", area="Nablus", items=0)
+        theirs = make_order(self.other, phone="0599123456", items=0)
+        self.assertEqual(first.recipient_id, second.recipient_id)
+        self.assertNotEqual(first.recipient_id, theirs.recipient_id)
+        recipient = Recipient.objects.get(pk=first.recipient_id)
+        self.assertEqual((recipient.name, recipient.area), ("Sara K.", "Nablus"))
+
+        second.phone = "0522000000"
+        second.save()
+        self.assertNotEqual(second.recipient_id, first.recipient_id)
+
+    def test_autocomplete_counts_in_one_query(self):
+        for status in ("delivered", "returned", "pending"):
+            make_order(self.seller, name="Sara", phone="0599123456", status=status, items=0)
+        make_order(self.seller, name="Samir", phone="0599777777", items=0)
+        make_order(self.other, name="Sara", phone="0599123456", items=0)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/recipients/", {"q": "+970 599"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        sara = next(row for row in response.data["results"] if row["name"] == "Sara")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual((sara["order_count"], sara["recent_order_count"], sara["returned_count"]), (3, 3, 1))
+        self.assertEqual(sara["phone"], "0599123456")
+
+        names = self.client.get("/api/recipients/", {"q": "Sam"}).data["results"]
+        self.assertEqual([row["name"] for row in names], ["Samir"])
+
+    def test_staff_filter_by_seller(self):
+        make_order(self.seller, name="Sara", phone="0599123456", items=0)
+        make_order(self.other, name="Sami", phone="0599123457", items=0)
+        self.client.force_authenticate(User.objects.create_user("staff", password="x", is_staff=True))
+        response = self.client.get("/api/recipients/", {"q": "0599", "user_id": self.other.id})
+        self.assertEqual([row["name"] for row in response.data["results"]], ["Sami"])
+        self.assertEqual(self.client.get("/api/recipients/", {"q": "0599", "user_id": "abc"}).status_code, 400)
+
+    def test_backfill_links_existing_orders_in_chunks(self):
+        orders = [make_order(self.seller, phone=phone, items=0) for phone in ("0599123456", "599123456", "0522000000")]
+        Order.objects.update(recipient=None)
+        Recipient.objects.all().delete()
+        out = io.StringIO()
+        call_command("backfill_recipients", "--chunk-size", "2", stdout=out)
+        self.assertIn("Done: 3 orders linked", out.getvalue())
+        linked = dict(Order.objects.values_list("id", "recipient__phone"))
+        self.assertEqual([linked[order.id] for order in orders], ["0599123456", "0599123456", "0522000000"])
+        self.assertEqual(Recipient.objects.count(), 2)
+
+
+class ReadReplicaRoutingTests(TestCase):
+    """Opted-in safe reads go to the replica; writes pin reads to the primary."""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", password="x")
+        self.order = make_order(self.seller, items=0)
+        routers.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        # TestCase wraps every test in a transaction, which routes to the primary.
+        patcher = mock.patch.object(routers, "in_transaction", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(routers.reset)
+
+    def test_router_reads_replica_until_the_request_writes(self):
+        router = routers.ReadReplicaRouter()
+        with override_settings(DATABASE_READ_REPLICA="replica"):
+            self.assertIsNone(router.db_for_read(Order))
+            with routers.replica_reads():
+                self.assertEqual(router.db_for_read(Order), "replica")
+                self.assertEqual(router.db_for_write(Order), "default")
+                self.assertIsNone(router.db_for_read(Order))
+            self.assertFalse(router.allow_migrate("replica", "api"))
+            self.assertIsNone(router.allow_migrate("default", "api"))
+        with routers.replica_reads():
+            routers.reset()
+            self.assertIsNone(router.db_for_read(Order))
+
+    def test_views_opt_in_and_writers_are_pinned(self):
+        decisions = []
+        db_for_read = routers.ReadReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            decisions.append(db_for_read(router, model, **hints))
+            return decisions[-1]
+
+        # The replica alias must exist to run the queries; `default` stands in.
+        with override_settings(DATABASE_READ_REPLICA="default"), \
+                mock.patch.object(routers.ReadReplicaRouter, "db_for_read", spy):
+            self.assertEqual(self.client.get("/api/orders/").status_code, 200)
+            self.assertEqual(set(decisions), {"default"})
+
+            decisions.clear()
+            response = self.client.patch(f"/api/orders/{self.order.id}/update_status/", {"status": "processing"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(decisions), {None})
+
+            decisions.clear()
+            self.client.get("/api/orders/")
+            self.assertEqual(set(decisions), {None})
+
+
+class OrderStatusTransitionTests(TestCase):
+    """Status changes follow TRANSITIONS and are applied per target status in bulk."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        self.other = User.objects.create_user("other", password="x")
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        product = InventoryProduct.objects.create(name="t-shirt", price=30)
+        self.black = InventoryItem.objects.create(product=product, size="M", color="black", quantity=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _bulk(self, payload):
+        response = self.client.post("/api/orders/bulk-status/", payload, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_update_status_refuses_disallowed_moves(self):
+        order = make_order(self.seller, items=0)
+        for target in ("delivered", "bogus"):
+            response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": target}, format="json")
+            self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f"/api/orders/{order.id}/", {"status": "returned"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": "processing"}, format="json")
+        self.assertEqual(response.data["status"], "processing")
+        response = self.client.patch(f"/api/orders/{order.id}/update_status/", {"status": ["x"]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_plain_edits_apply_status_side_effects(self):
+        order = make_order(self.seller, items=1, price=100)
+        Order.objects.filter(id=order.id).update(profit=80)
+        response = self.client.patch(f"/api/orders/{order.id}/", {"status": "cancelled"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["status"], "cancelled")
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.price, order.profit), ("cancelled", 0, 0))
+        self.black.refresh_from_db()
+        self.assertEqual(self.black.quantity, 1)
+
+    def test_bulk_rejects_malformed_bodies(self):
+        order = make_order(self.seller, items=0)
+        for payload in (
+            [order.id],
+            {"ids": [order.id], "status": ["x"]},
+            {"ids": ["abc"], "status": "processing"},
+            {"ids": order.id, "status": "processing"},
+            {"ids": [order.id]},
+            {"transitions": [{"id": order.id, "status": {"a": 1}}]},
+            {"transitions": "all"},
+        ):
+            response = self.client.post("/api/orders/bulk-status/", payload, format="json")
+            self.assertEqual(response.status_code, 400, payload)
+        self.assertEqual(Order.objects.get(id=order.id).status, "pending")
+
+    def test_bulk_updates_cost_one_update_per_status(self):
+        def move(count, target):
+            orders = [make_order(self.seller, items=0) for _ in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                data = self._bulk({"ids": [order.id for order in orders], "status": target})
+            self.assertEqual(data["updated"], count)
+            return [query["sql"] for query in queries.captured_queries]
+
+        few, many = move(2, "processing"), move(20, "processing")
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(sum(1 for sql in many if sql.startswith('UPDATE "api_order"')), 1)
+
+    def test_bulk_cancel_restocks_in_one_pass_and_reports_each_order(self):
+        pending = [make_order(self.seller, items=2) for _ in range(3)]
+        shipped = make_order(self.seller, status="shipped", items=1)
+        delivered = make_order(self.seller, status="delivered", items=1)
+        data = self._bulk({"transitions": [
+            *({"id": order.id, "status": "cancelled"} for order in pending),
+            {"id": shipped.id, "status": "returned"},
+            {"id": delivered.id, "status": "pending"},
+            {"id": 999999, "status": "cancelled"},
+        ]})
+        self.assertEqual((data["updated"], data["error"]), (4, 2))
+        self.assertEqual([result["status"] for result in data["results"]][-2:], ["error", "error"])
+        self.assertEqual(data["results"][-2]["from"], "delivered")
+        self.black.refresh_from_db()
+        # Returns are not restocked unless RESTOCK_RETURNED_ORDERS is on.
+        self.assertEqual(self.black.quantity, 3 * 2)
+        self.assertEqual(Order.objects.get(pk=pending[0].pk).price, 0)
+        self.assertEqual(Order.objects.get(pk=shipped.pk).status, "returned")
+
+        incremental = sorted(OrderRollup.objects.filter(order_count__gt=0).values_list("status", "order_count"))
+        rollups.rebuild()
+        self.assertEqual(incremental, sorted(OrderRollup.objects.values_list("status", "order_count")))
+
+    def test_sellers_only_move_their_own_orders(self):
+        mine, theirs = make_order(self.seller, items=0), make_order(self.other, items=0)
+        self.client.force_authenticate(self.seller)
+        data = self._bulk({"ids": [mine.id, theirs.id], "status": "processing"})
+        self.assertEqual([result["status"] for result in data["results"]], ["updated", "error"])
+        self.assertEqual(Order.objects.get(pk=theirs.pk).status, "pending")
+
+
+class BenchmarkSuiteTests(MediaRootMixin, TestCase):
+    """The benchmark suite runs end to end on a small dataset."""
+
+    def test_suite_measures_every_scenario(self):
+        benchmarks.DatasetGenerator(400).generate()
+        self.assertEqual(Order.objects.count(), 400)
+        suite = benchmarks.BenchmarkSuite(repeat=1)
+        results = suite.run()
+        self.assertEqual(set(results), {scenario.name for scenario in suite.scenarios()})
+        for name, result in results.items():
+            self.assertGreater(result["queries"], 0, name)
+            self.assertEqual(result["runs"], 1, name)
+
+    def test_compare_reports_regressions(self):
+        baseline = {"meta": {"orders": 10}, "results": {
+            "orders_list_staff": {"median_ms": 10.0, "queries": 5, "peak_memory_kb": 100.0},
+        }}
+        same = {"meta": {"orders": 10}, "results": {
+            "orders_list_staff": {"median_ms": 11.0, "queries": 5, "peak_memory_kb": 110.0},
+        }}
+        worse = {"meta": {"orders": 10}, "results": {
+            "orders_list_staff": {"median_ms": 30.0, "queries": 6, "peak_memory_kb": 200.0},
+        }}
+        self.assertEqual(benchmarks.compare(same, baseline, 0.25), [])
+        self.assertEqual(len(benchmarks.compare(worse, baseline, 0.25)), 3)
+        with self.assertRaises(benchmarks.BenchmarkError):
+            benchmarks.compare({**worse, "meta": {"orders": 20}}, baseline)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Opt-in Server-Timing headers, slow query warnings and sampled cProfile dumps."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="x")
+        make_order(self.seller)
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+
+    def get_orders(self, **settings):
+        # The middleware chain is built on the client's first request.
+        with override_settings(**settings):
+            client = APIClient()
+            client.force_authenticate(self.seller)
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                response = client.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        return response, stdout.getvalue()
+
+    def test_disabled_by_default(self):
+        response, _output = self.get_orders(PROFILING_ENABLED=False)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_server_timing_and_slow_queries(self):
+        response, output = self.get_orders(PROFILING_ENABLED=True, PROFILING_SLOW_QUERY_MS=0)
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="[1-9]\d* queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIn("Warning: slow query", output)
+        self.assertIn(f"at {os.path.join('api', 'pagination.py')}:", output)
+
+        response, output = self.get_orders(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0)
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(output, "")
+
+    def test_sampled_cprofile_dumps(self):
+        self.get_orders(
+            PROFILING_ENABLED=True, PROFILING_CPROFILE_PATHS=[r"^/api/orders/$"],
+            PROFILING_CPROFILE_SAMPLE_RATE=1, PROFILING_CPROFILE_DIR=self.profile_dir,
+        )
+        dumps = os.listdir(self.profile_dir)
+        self.assertEqual(len(dumps), 1)
+        self.assertIn("-GET-api-orders-", dumps[0])
+        self.assertTrue(dumps[0].endswith(".prof"))
+        self.assertTrue(pstats.Stats(os.path.join(self.profile_dir, dumps[0])).total_calls > 0)
+
+        self.get_orders(
+            PROFILING_ENABLED=True, PROFILING_CPROFILE_PATHS=[r"^/api/recipients/"],
+            PROFILING_CPROFILE_SAMPLE_RATE=1, PROFILING_CPROFILE_DIR=self.profile_dir,
+        )
+        self.assertEqual(len(os.listdir(self.profile_dir)), 1)
@@ -0,0 +1,255 @@
+"""
+WebP thumbnails for mockups and designs.
+
+Thumbnails come in a few fixed sizes (settings.THUMBNAIL_SIZES) and live at
+`thumbnails/<source hash>/<size>.webp`, so a source that is uploaded many
+times (see api.storage) is thumbnailed once. They are rendered off the request
+path: saving a Mockup/Design schedules them after commit, and the outcome is
+recorded on the source's StoredBlob (ready with its sizes, or failed).
+Serializers read that state in bulk through ThumbnailStates - no storage
+calls per asset - and fall back to the original file URL until it is ready.
+Every recorded outcome bumps a generation number in the shared cache, which
+the order validators (api.conditional) fold into their ETags.
+Reads never queue renders (a GET must not write); failed renders are retried
+when the same content is uploaded again, at most once per
+THUMBNAIL_RETRY_BACKOFF window (doubling after every failed attempt, up to
+THUMBNAIL_MAX_ATTEMPTS), and backfilled by `manage.py generate_thumbnails`.
+Files not moved into blob storage yet (`manage.py dedupe_media`) are served
+as originals.
+
+Rendering runs in a process pool so the CPU-heavy Pillow work never runs on a
+web worker thread; THUMBNAIL_MODE = 'sync' renders inline (tests, the
+`generate_thumbnails` command) and 'off' disables scheduling.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .media import signed_url
+from .storage import digest_from_name, is_blob_name
+
+RASTER_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+DEFAULT_SIZES = {'small': 128, 'medium': 384, 'large': 1024}
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+GENERATION_CACHE_KEY = 'thumbnails:generation'
+
+_executor = None
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+
+
+def generation():
+    """Changes whenever a thumbnail outcome is recorded."""
+    value = cache.get(GENERATION_CACHE_KEY)
+    if value is None:
+        cache.add(GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+        value = cache.get(GENERATION_CACHE_KEY)
+    return value
+
+
+def sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def is_thumbnailable(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in RASTER_EXTENSIONS
+
+
+def source_hash(name):
+    if is_blob_name(name):
+        return digest_from_name(name)
+    # Not content-addressed yet (see `manage.py dedupe_media`): key on the name.
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+
+def thumbnail_name(source_name, size_name):
+    return f"thumbnails/{source_hash(source_name)}/{size_name}.webp"
+
+
+def render(source_path, target_path, max_side):
+    """Write a WebP thumbnail of `source_path`. Runs in a pool worker."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        partial_path = f"{target_path}.{os.getpid()}.part"
+        image.save(partial_path, 'WEBP', quality=80, method=4)
+    os.replace(partial_path, target_path)
+    return target_path
+
+
+def render_sizes(source_path, targets):
+    """Render every (target_path, max_side) of one source. Runs in a pool worker."""
+    for target_path, max_side in targets:
+        render(source_path, target_path, max_side)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def missing_sizes(source_name):
+    return [
+        (size_name, max_side) for size_name, max_side in sizes().items()
+        if not default_storage.exists(thumbnail_name(source_name, size_name))
+    ]
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'THUMBNAIL_RETRY_BACKOFF', 60) * 2 ** max(attempts - 1, 0))
+
+
+def claim(source_name):
+    """Count one render attempt of a blob; False if one is in flight, backing off or out of attempts."""
+    from .models import StoredBlob
+
+    now = timezone.now()
+    attempts = StoredBlob.objects.filter(name=source_name).values_list('thumbnail_attempts', flat=True).first()
+    if attempts is None or attempts >= getattr(settings, 'THUMBNAIL_MAX_ATTEMPTS', 5):
+        return False
+    # Conditional on the attempt count read above, so concurrent callers claim it once.
+    return bool(
+        StoredBlob.objects.filter(name=source_name, thumbnail_attempts=attempts)
+        .filter(Q(thumbnail_retry_at__isnull=True) | Q(thumbnail_retry_at__lte=now))
+        .update(thumbnail_attempts=attempts + 1, thumbnail_retry_at=now + retry_delay(attempts + 1))
+    )
+
+
+def record(source_name, error=None):
+    """Store the outcome of a render on the source's StoredBlob."""
+    from .models import StoredBlob
+
+    rendered = [size_name for size_name in sizes() if default_storage.exists(thumbnail_name(source_name, size_name))]
+    if error is None and len(rendered) < len(sizes()):
+        error = FileNotFoundError("thumbnails missing after rendering")
+    if error is not None:
+        print(f"Warning: thumbnail generation failed for {source_name}: {error}")
+        StoredBlob.objects.filter(name=source_name).update(thumbnail_status=FAILED)
+    else:
+        StoredBlob.objects.filter(name=source_name).update(
+            thumbnail_status=READY, thumbnail_sizes=rendered, thumbnail_attempts=0, thumbnail_retry_at=None
+        )
+    _bump_generation()
+
+
+def _done(source_name, future):
+    # Runs on the executor's callback thread, with its own connection.
+    try:
+        record(source_name, future.exception())
+    finally:
+        connection.close()
+
+
+def schedule(source_name, mode=None):
+    """Queue (or, in sync mode, render) every missing thumbnail of a blob.
+
+    Does nothing while an earlier attempt is in flight or backing off.
+    """
+    mode = mode or getattr(settings, 'THUMBNAIL_MODE', 'pool')
+    if mode == 'off' or not is_blob_name(source_name) or not is_thumbnailable(source_name):
+        return
+    if not claim(source_name):
+        return
+    if not default_storage.exists(source_name):
+        record(source_name, FileNotFoundError(source_name))
+        return
+    source_path = default_storage.path(source_name)
+    targets = [
+        (default_storage.path(thumbnail_name(source_name, size_name)), max_side)
+        for size_name, max_side in missing_sizes(source_name)
+    ]
+    if not targets or mode == 'sync':
+        try:
+            render_sizes(source_path, targets)
+        except Exception as e:
+            record(source_name, e)
+        else:
+            record(source_name)
+        return
+    future = _get_executor().submit(render_sizes, source_path, targets)
+    future.add_done_callback(lambda f: _done(source_name, f))
+
+
+class ThumbnailStates:
+    """Per-request thumbnail state of blobs, loaded in bulk from StoredBlob.
+
+    Lives in the serializer context; list serializers load every asset of the
+    page at once so nested representations do not query one by one.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+
+    @classmethod
+    def for_context(cls, context):
+        states = context.get('thumbnail_states')
+        if states is None:
+            states = context['thumbnail_states'] = cls()
+        return states
+
+    def load(self, names):
+        from .models import StoredBlob
+
+        missing = {name for name in names if is_blob_name(name) and is_thumbnailable(name) and name not in self.blobs}
+        if missing:
+            self.blobs.update(dict.fromkeys(missing))
+            self.blobs.update({
+                blob.name: blob
+                for blob in StoredBlob.objects.filter(name__in=missing).only('name', 'thumbnail_status', 'thumbnail_sizes')
+            })
+        return self
+
+    def get(self, name):
+        self.load([name])
+        return self.blobs.get(name)
+
+
+def thumbnail_urls(field_file, request=None, states=None):
+    """{size: url} for a file field, falling back to the original until ready.
+
+    With a request the URLs are signed for its user (see api.media).
+    """
+    if not field_file:
+        return {}
+    user = getattr(request, 'user', None)
+    source_name = field_file.name
+    original_url = signed_url(source_name, user)
+    blob = (states or ThumbnailStates()).get(source_name) if is_thumbnailable(source_name) else None
+    ready = set(blob.thumbnail_sizes) if blob is not None and blob.thumbnail_status == READY else set()
+    urls = {
+        size_name: signed_url(thumbnail_name(source_name, size_name), user) if size_name in ready else original_url
+        for size_name in sizes()
+    }
+    if request is not None:
+        urls = {size_name: request.build_absolute_uri(url) for size_name, url in urls.items()}
+    return urls
@@ -0,0 +1,119 @@
+"""
+Order status transitions.
+
+TRANSITIONS lists where each status may move next; anything else is refused.
+`transition` moves a batch of orders in one transaction:
+
+- the orders are locked in id order and each requested move is checked
+  against its current status;
+- every target status is written with one `UPDATE` (cancelling also zeroes
+  price and profit); returns go through `returns.mark_returned`, which
+  charges the seller the items' cost;
+- the items of every cancelled order are put back into stock with one
+  aggregated InventoryReservation, and the rollups are updated.
+
+Courier sync (api.jobs, api.returns) moves orders on its own and is not
+checked here.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .inventory import InventoryReservation
+from .models import Order, OrderItem
+from .returns import mark_returned
+
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('pending', 'shipped', 'cancelled'),
+    'shipped': ('delivered', 'returned', 'cancelled'),
+    'delivered': ('completed', 'returned'),
+    'completed': ('returned',),
+    'cancelled': (),
+    'returned': (),
+}
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+
+
+class TransitionError(Exception):
+    pass
+
+
+def check(current, target):
+    """Raise TransitionError unless an order may move from `current` to `target`."""
+    if not isinstance(target, str) or target not in TRANSITIONS:
+        raise TransitionError(f"Unknown status '{target}'.")
+    if target != current and target not in TRANSITIONS.get(current, ()):
+        allowed = ', '.join(TRANSITIONS.get(current, ())) or 'none'
+        raise TransitionError(f"Cannot move an order from '{current}' to '{target}' (allowed: {allowed}).")
+
+
+def _cancel(orders, now):
+    Order.objects.filter(id__in=[order.id for order in orders]).update(
+        status='cancelled', price=0, profit=0, updated_at=now
+    )
+    for order in orders:
+        order.status, order.price, order.profit, order.updated_at = 'cancelled', 0, 0, now
+    items = OrderItem.objects.filter(order_id__in=[order.id for order in orders]).values('type', 'size', 'color')
+    return InventoryReservation().release_items(items)
+
+
+def transition(queryset, moves):
+    """Apply `moves` ([(order_id, target_status), ...]) to orders in `queryset`.
+
+    Returns one result per move, in order: {'id', 'status': updated /
+    unchanged / error, 'from', 'to'} plus 'error' for refused moves. Moves
+    that fail checking are reported and skipped; the rest are applied
+    together.
+    """
+    results = [{'id': order_id, 'to': target} for order_id, target in moves]
+    with transaction.atomic():
+        ids = {order_id for order_id, _target in moves}
+        orders = {
+            order.id: order
+            for order in queryset.select_for_update(of=('self',)).filter(id__in=ids).order_by('id')
+        }
+
+        targets = defaultdict(list)
+        moved = set()
+        for result in results:
+            order = orders.get(result['id'])
+            if order is None:
+                result.update(status=ERROR, error='Not found.')
+                continue
+            result['from'] = order.status
+            if result['id'] in moved:
+                result.update(status=ERROR, error='Order listed more than once.')
+                continue
+            try:
+                check(order.status, result['to'])
+            except TransitionError as exc:
+                result.update(status=ERROR, error=str(exc))
+                continue
+            moved.add(order.id)
+            if order.status == result['to']:
+                result['status'] = UNCHANGED
+            else:
+                result['status'] = UPDATED
+                targets[result['to']].append(order)
+
+        now = timezone.now()
+        reservation = InventoryReservation()
+        for target, batch in sorted(targets.items()):
+            if target == 'returned':
+                mark_returned(batch)
+            elif target == 'cancelled':
+                reservation = _cancel(batch, now)
+            else:
+                Order.objects.filter(id__in=[order.id for order in batch]).update(status=target, updated_at=now)
+                for order in batch:
+                    order.status, order.updated_at = target, now
+        rollups.record_changes([order for batch in targets.values() for order in batch])
+        reservation.apply()
+    return results
@@ -8,6 +8,8 @@ router.register(r'mockups', views.MockupViewSet, basename='mockup')
 router.register(r'designs', views.DesignViewSet, basename='design')
 router.register(r'inventory-products', views.InventoryProductViewSet, basename='inventoryproduct')
 router.register(r'inventory-items', views.InventoryItemViewSet, basename='inventoryitem')
+router.register(r'export-jobs', views.CourierExportJobViewSet, basename='exportjob')
+router.register(r'recipients', views.RecipientViewSet, basename='recipient')
 # router.register(r'users', views.UserViewSet, basename='user') # Optional: If admin needs user management via API
 
 urlpatterns = [
@@ -1,9 +1,11 @@
 import shutil
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.utils import timezone
 from django.db import transaction
 from datetime import datetime, timedelta
@@ -17,8 +19,18 @@ import json
 import requests
 import json
 from django.conf import settings
-from .models import Order, OrderItem, Mockup, Design , InventoryItem, InventoryProduct ,  UserProductPrice
-from .serializers import OrderSerializer, OrderItemSerializer, MockupSerializer, DesignSerializer, UserSerializer , InventoryItemSerializer, InventoryProductSerializer, UserProductPriceSerializer
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from .models import Order, OrderItem, Mockup, Design , InventoryItem, InventoryProduct ,  UserProductPrice, CourierExportJob, OrderRollup, Recipient
+from .serializers import OrderSerializer, OrderItemSerializer, MockupSerializer, DesignSerializer, UserSerializer , InventoryItemSerializer, InventoryProductSerializer, UserProductPriceSerializer, CourierExportJobSerializer, BulkStatusSerializer
+from .pagination import OwnerAssetPagination, OrderCursorPagination
+from .filters import BusinessDateFilterBackend, OrderSearchFilterBackend
+from . import bulk, catalog, conditional, recipients, returns, rollups, transitions
+from .jobs import enqueue_export
+from .media import signed_url
+from .exports import ArchiveNames, stream_zip, write_zip
+from .collection import COLLECTED_FOLDER, DailyCollection
+from .routers import ReplicaReadMixin
 
 class IsOwnerOrAdmin(permissions.BasePermission):
     
@@ -54,25 +66,6 @@ class OrderFilter(django_filters.FilterSet):
     phone = django_filters.CharFilter(lookup_expr='icontains')
     status = django_filters.CharFilter(lookup_expr='iexact')
     unique_id = django_filters.CharFilter(lookup_expr='icontains')
-    month = django_filters.CharFilter(method='filter_month')
-
-    # NEW: Custom filter for 'month'
-    def filter_month(self, queryset, name, value):
-        today = timezone.now().date()
-        print(int(value))
-        if value:
-            try:
-                # Convert value to integer as month numbers are integers
-                month_num = int(value)
-                return queryset.filter(
-                    created_at__year=today.year,
-                    created_at__month=month_num
-                )
-            except ValueError:
-                # Handle cases where value is not a valid integer (e.g., empty string)
-                pass
-        return queryset
-
 
     class Meta:
         model = Order
@@ -82,196 +75,196 @@ class OrderFilter(django_filters.FilterSet):
             'phone',
             'status',
             'unique_id'
-            # Custom filter methods are automatically discovered,
-            # so no need to list 'order_start_date', 'order_end_date', or 'month' here.
+            # 'month', 'date' and 'specific_date' are handled by
+            # BusinessDateFilterBackend on the indexed business_date column.
         ]
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
-    filter_backends = [filters.OrderingFilter , DjangoFilterBackend]
+    filter_backends = [filters.OrderingFilter , DjangoFilterBackend, BusinessDateFilterBackend, OrderSearchFilterBackend]
     filterset_class = OrderFilter # Ensure this is set
+    business_date_field = 'business_date'
     ordering_fields = ['created_at', 'status', 'name', 'phone', 'unique_id']
     ordering = ['-created_at']
+    pagination_class = OrderCursorPagination
+    replica_actions = ('list', 'retrieve', 'report')
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Order.objects.all()
+        # Load the whole order graph up front: users are joined in, items come
+        # in one prefetch with their mockup, linked design and design joined.
+        queryset = Order.objects.select_related('user').prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related('mockup__linked_design', 'design'),
+            )
+        )
 
         if not user.is_staff:
             queryset = queryset.filter(user=user)
 
-        # KEEP this block if you still want the 'date' and 'specific_date' shortcuts
-        # (e.g., 'today', 'yesterday', 'this_week', 'this_month').
-        # These operate *before* django-filter's filters are applied.
-        date_filter = self.request.query_params.get('date')
-        specific_date = self.request.query_params.get('specific_date')
-
-        if specific_date:
-            try:
-                date_obj = datetime.strptime(specific_date, '%Y-%m-%d').date()
-                print(specific_date)
-                queryset = queryset.filter(created_at__date=date_obj)
-            except ValueError:
-                pass
-        elif date_filter:
-            today = timezone.now().date()
-            if date_filter == 'today':
-                queryset = queryset.filter(created_at__date=today)
-            elif date_filter == 'yesterday':
-                queryset = queryset.filter(created_at__date=today - timedelta(days=1))
-            elif date_filter == 'this_week':
-                start_of_week = today - timedelta(days=today.weekday())
-                queryset = queryset.filter(
-                    created_at__date__gte=start_of_week,
-                    created_at__date__lte=today
-                )
-            elif date_filter == 'this_month':
-                queryset = queryset.filter(
-                    created_at__year=today.year,
-                    created_at__month=today.month
-                )
-
+        # The 'date' / 'specific_date' / 'month' shortcuts are applied by
+        # BusinessDateFilterBackend.
         return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # Answer unchanged polls from max(updated_at) + count, before any serialization
+        etag = conditional.list_validators(request, self.filter_queryset(self.get_queryset()))
+        not_modified = conditional.not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        response = super().list(request, *args, **kwargs)
+        for header, value in conditional.validator_headers(etag).items():
+            response[header] = value
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = conditional.detail_validators(request, self.get_queryset(), kwargs['pk'])
+        if etag is not None:
+            not_modified = conditional.not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+        response = super().retrieve(request, *args, **kwargs)
+        if etag is not None:
+            for header, value in conditional.validator_headers(etag).items():
+                response[header] = value
+        return response
         
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk_create(self, request):
+        # Import a batch of orders (JSON list or CSV upload) for the current user
+        mode = request.query_params.get('mode')
+        if not mode and isinstance(request.data, dict):
+            mode = request.data.get('mode')
+        mode = mode or bulk.ATOMIC
+        if mode not in bulk.MODES:
+            return Response({'error': f"mode must be one of {', '.join(bulk.MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = bulk.rows_from_request(request)
+        max_rows = getattr(settings, 'BULK_ORDER_MAX_ROWS', 1000)
+        if len(rows) > max_rows:
+            return Response({'error': f'At most {max_rows} orders per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = bulk.BulkOrderImport(request.user, rows, mode=mode, context=self.get_serializer_context())
+        created = importer.run()
+        failed = importer.error_count
+        if mode == bulk.ATOMIC and failed:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        return Response({
+            'mode': mode,
+            'created': len(created),
+            'failed': failed,
+            'results': importer.results,
+        }, status=response_status)
+
     @action(detail=True, methods=['patch'], permission_classes=[permissions.IsAuthenticated, IsOwnerOrAdmin])
     def update_status(self, request, pk=None):
         order = self.get_object()
         new_status = request.data.get('status')
-        old_status = order.status
-
         if not new_status:
             return Response({'error': 'Status is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            order.status = new_status
-            order.save()
-
-            if old_status != 'cancelled' and new_status == 'cancelled':
-                order.price = 0
-                order.profit = 0
-                order.save()
-                # If order is being cancelled, return items to inventory
-                for item in order.items.all():
-                    print(item)
-                    try:
-                        inventory_item = InventoryItem.objects.get(
-                            product__name=item.type,
-                            size=item.size,
-                            color=item.color
-                        )
-                        inventory_item.quantity += 1
-                        inventory_item.save()
-                    except InventoryItem.DoesNotExist:
-                        print(f"Warning: Inventory item not found for cancelled order item: {item.type}, {item.size}, {item.color}")
-
-        serializer = self.get_serializer(order)
+        result, = transitions.transition(Order.objects.all(), [(order.id, new_status)])
+        if result['status'] == transitions.ERROR:
+            return Response({'error': result['error']}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(self.get_object())
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        # {"ids": [...], "status": "..."} or {"transitions": [{"id": ..., "status": ...}, ...]}
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moves = serializer.validated_data['moves']
+
+        queryset = Order.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(user=request.user)
+        results = transitions.transition(queryset, moves)
+        counts = {outcome: sum(1 for result in results if result['status'] == outcome)
+                  for outcome in (transitions.UPDATED, transitions.UNCHANGED, transitions.ERROR)}
+        return Response({**counts, 'results': results})
+
+    def _paginated_owner_assets(self, queryset, serializer_class):
+        paginator = OwnerAssetPagination()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def owner_mockups(self, request, pk=None):
+        # Paginated replacement for the inlined owner_mockups (?owner_assets=separate)
+        order = self.get_object()
+        mockups = Mockup.objects.filter(user_id=order.user_id).select_related('linked_design').order_by('-created_at', '-id')
+        return self._paginated_owner_assets(mockups, MockupSerializer)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def owner_designs(self, request, pk=None):
+        # Paginated replacement for the inlined owner_designs (?owner_assets=separate)
+        order = self.get_object()
+        designs = Design.objects.filter(user_id=order.user_id).order_by('-created_at', '-id')
+        return self._paginated_owner_assets(designs, DesignSerializer)
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def export(self, request):
-        try:
-            today = datetime.now().strftime('%d-%m-%Y')
-            sheet_name = f"{today}-orders"
-
-            orders = self.get_queryset()
-            exported_count = 0
-            rows_to_append = []
-
-            shipping_orders = []
-
-            for order in orders:
-                # Only process if status is 'shipped' and it hasn't been exported yet (by unique_id)
-                if order.status == "shipped":
-                    # Prepare order for shipping API
-                    shipping_order = {
-                        "note": None,  # Can be customized if needed
-                        "product_note": None,  # Can be customized if needed
-                        "reference_id": order.unique_id,  # Using unique_id as reference
-                        "customer_area": order.areaId,
-                        "customer_name": order.name,
-                        "copy_total_cost": int(order.price),  # Convert to string if needed
-                        "customer_mobile": order.phone,
-                        "customer_address": order.area,  # Add if available in your order model
-                        "customer_sub_area": None,  # Add if available in your order model
-                        "second_mobile_number": None  # Add if available in your order model
-                    }
-                    shipping_orders.append(shipping_order)
-                    order.status = "delivered"  # Change status to delivered after preparing for export
-                    order.save()  # Save the status change
-                    exported_count += 1
-
-          
-            # ===== SHIPPING API SUBMISSION =====
-            shipping_api_success = False
-            shipping_api_message = "No orders to submit to shipping company"
-
-            if shipping_orders:
-                # Prepare payload for shipping API
-                payload = {
-                    "context": "{\"lang\":\"en_US\",\"uid\":2}",
-                    "password": "12345678",
-                    "sessionId": "b59c61dea31e1f626436c91e2afe56c6272c3d3f",
-                    "orders_list": shipping_orders
-                }
-                json_output = json.dumps(payload, indent=4)
-
-                print(json_output)
-                # Set headers for the API request
-                headers = {
-                    'Cookie': 'session_id=b59c61dea31e1f626436c91e2afe56c6272c3d3f; fileToken=dummy-because-api-expects-one; frontend_lang=en_US',
-                    'Content-Type': 'application/json'
-                }
-
-                # Make the API request
-                try:
-                    shipping_api_url = "https://111hiexpress.ps/create_super_multi_orders"
-                    response = requests.post(shipping_api_url, json=json_output, headers=headers)
-                    # Check if the request was successful
-                    if response.status_code == 200:
-                        
-                        shipping_api_success = True
-                        shipping_api_message = f"Successfully submitted {len(shipping_orders)} orders to shipping company"
-
-                        # You might want to parse the response for more details
-                        try:
-                            shipping_response_data = response.json()
-                            shipping_api_message += f". Response: {shipping_response_data}"
-                        except:
-                            shipping_api_message += f". Raw response: {response.text[:100]}..."
-                    else:
-                        shipping_api_message = f"Failed to submit orders to shipping company. Status code: {response.status_code}. Response: {response.text[:100]}..."
-                except Exception as e:
-                    shipping_api_message = f"Error submitting orders to shipping company: {str(e)}"
-
-            # Return combined response
+        # Queue the shipped orders for the courier; `manage.py run_export_jobs`
+        # sends them and marks them delivered once the courier accepts them.
+        orders = BusinessDateFilterBackend().filter_queryset(request, self.get_queryset(), self)
+        order_ids = list(orders.filter(status='shipped').order_by('id').values_list('id', flat=True))
+
+        if not order_ids:
             return Response({
                 'success': True,
-                'shipping_api': {
-                    'success': shipping_api_success,
-                    'message': shipping_api_message,
-                    'orders_submitted': len(shipping_orders) if shipping_orders else 0
-                }
+                'job_id': None,
+                'message': 'No orders to submit to shipping company',
+                'orders_queued': 0,
             })
 
-        except gspread.exceptions.APIError as e:
-            error_message = f"Google Sheets API Error: {e.args[0].get('message', str(e))}"
-            if 'PERMISSION_DENIED' in str(e):
-                 error_message += ". Ensure the service account has editor access to the target Google Drive folder or spreadsheet."
-            return Response({
-                'success': False,
-                'message': f'Failed to export orders: {error_message}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception as e:
-            return Response({
-                'success': False,
-                'message': f'Failed to export orders: {str(e)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        job = enqueue_export(order_ids, user=request.user)
+        return Response({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'orders_queued': job.total,
+            'status_url': reverse('exportjob-detail', args=[job.id], request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def report(self, request):
+        # Counts, revenue and profit per day or month, read from OrderRollup only
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in ('day', 'month'):
+            return Response({'error': "group_by must be 'day' or 'month'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = OrderRollup.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(user=request.user)
+        elif request.query_params.get('user_id'):
+            try:
+                queryset = queryset.filter(user_id=int(request.query_params['user_id']))
+            except ValueError:
+                return Response({'error': 'user_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if request.query_params.get('start_date'):
+                start_date = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date()
+                queryset = queryset.filter(business_date__gte=start_date)
+            if request.query_params.get('end_date'):
+                end_date = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date()
+                queryset = queryset.filter(business_date__lt=end_date + timedelta(days=1))
+        except ValueError:
+            return Response({'error': 'Date format should be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        # The 'date' / 'specific_date' / 'month' shortcuts work here too.
+        queryset = BusinessDateFilterBackend().filter_queryset(request, queryset, self)
+
+        return Response(rollups.report(queryset, group_by))
 
-    
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def export_designs_by_order_date(self, request):
         start_date_str = request.query_params.get('start_date')
@@ -289,217 +282,101 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Ensure end_date includes the entire day
         end_date = end_date + timedelta(days=1)
 
-        # Filter orders by created_at date range
-        orders = Order.objects.filter(created_at__date__gte=start_date, created_at__date__lt=end_date)
+        # Designs of the items of orders in the business day range, in one query
+        items = (
+            OrderItem.objects
+            .filter(order__business_date__gte=start_date, order__business_date__lt=end_date, design__isnull=False)
+            .exclude(design__file='')
+            .order_by('order_id', 'id')
+            .values_list('design__file', 'design__original_filename')
+        )
+        # ?dedupe=true writes each stored file once instead of once per item
+        dedupe = request.query_params.get('dedupe') in ('1', 'true')
+        archive_name = ArchiveNames()
+        entries, written = [], set()
+        for path, original_filename in items.iterator():
+            if (dedupe and path in written) or not default_storage.exists(path):
+                continue
+            written.add(path)
+            entries.append((archive_name(original_filename or os.path.basename(path)), path))
 
-        # Create a unique folder for this export
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        export_folder_name = f"order_designs_{start_date_str}_to_{end_date_str}_{timestamp}"
-        base_export_dir = os.path.join(settings.MEDIA_ROOT, 'exported_order_designs')
-        destination_folder = os.path.join(base_export_dir, export_folder_name)
-
-        os.makedirs(destination_folder, exist_ok=True)
-
-        copied_count = 0
-        for order in orders:
-            for item in order.items.all():
-                if item.design and item.design.file and os.path.isfile(item.design.file.path):
-                    design = item.design
-                    
-                    # Original filename and extension
-                    filename_without_ext, extension = os.path.splitext(os.path.basename(design.file.name))
-                    
-                    # Construct initial destination path
-                    dest_path = os.path.join(destination_folder, os.path.basename(design.file.name))
-                    
-                    # Check if file exists and create a unique name if it does
-                    counter = 1
-                    while os.path.exists(dest_path):
-                        new_filename = f"{filename_without_ext}_copy{counter}{extension}"
-                        dest_path = os.path.join(destination_folder, new_filename)
-                        counter += 1
-
-                    try:
-                        shutil.copy(design.file.path, dest_path)
-                        copied_count += 1
-                    except Exception as e:
-                        print(f"Error copying file {filename_without_ext}{extension} for order {order.unique_id}: {str(e)}")
-
-        if copied_count == 0:
-            shutil.rmtree(destination_folder) # Clean up empty folder
+        if not entries:
             return Response({
                 'success': False,
                 'message': 'No designs found for the specified date range.'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        # Zip the collected designs
-        zip_base_name = os.path.join(base_export_dir, export_folder_name)
-        shutil.make_archive(zip_base_name, 'zip', destination_folder)
+        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+        export_name = f"order_designs_{start_date_str}_to_{end_date_str}_{timestamp}"
 
-        # Clean up the unzipped folder
-        shutil.rmtree(destination_folder)
+        if request.query_params.get('delivery') == 'stream':
+            # Write the archive straight into the response
+            response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="{export_name}.zip"'
+            return response
 
-        zip_url = f"{settings.MEDIA_URL}exported_order_designs/{export_folder_name}.zip"
+        # Otherwise stream it into a single file under MEDIA_ROOT and link to it
+        write_zip(entries, os.path.join(settings.MEDIA_ROOT, 'exported_order_designs', f"{export_name}.zip"))
+        zip_url = signed_url(f"exported_order_designs/{export_name}.zip", request.user)
 
         return Response({
             'success': True,
-            'message': f'{copied_count} designs collected and zipped.',
+            'message': f'{len(entries)} designs collected and zipped.',
             'zip_url': zip_url
         })
 
     
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
     def sync_returns(self, request):
-        
-        external_api_url = "https://hiexpress.ps/web/dataset/search_read" # <--- IMPORTANT: Replace with the actual API URL
-        payload = {
-    "jsonrpc": "2.0",
-    "method": "call",
-    "params": {
-        "model": "rb_delivery.order",
-        "domain": [
-            [
-                "state",
-                "=",
-                "completed_returned"
-            ]
-        ],
-        "fields": [
-            "web_color",
-            "is_block_delivery_fee",
-            "is_data_entry",
-            "delivery_profit",
-            "note",
-            "sequence_related",
-            "reference_id",
-            "assign_to_business",
-            "state",
-            "customer_name",
-            "customer_mobile",
-            "assign_to_agent",
-            "customer_area",
-            "customer_address",
-            "create_date",
-            "first_delivery_attempt_date",
-            "write_date",
-            "required_from_business",
-            "required_to_company",
-            "delivery_cost",
-            "money_collection_cost",
-            "business_state"
-        ],
-        
-        "sort": "",
-        "context": {
-            "lang": "ar_SY",
-            "tz": "Asia/Jerusalem",
-            "uid": 7227
-        }
-    },
-    "id": 69987485
-}
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Cookie': 'session_id=b59c61dea31e1f626436c91e2afe56c6272c3d3f; Expires=Mon, 08-Sep-2025 14:03:53 GMT; Max-Age=7776000; HttpOnly; Path=/;SameSite=None; Secure',
-        }
-        
+        # Only returns written since the last run are fetched; ?full=true starts over.
+        reset = request.query_params.get('full', '').lower() in ('1', 'true', 'yes')
         try:
-            response = requests.post(external_api_url, json=payload, headers=headers)
-            response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-            external_api_response_data = response.json()
-            external_returns_data = external_api_response_data.get('result', {}).get('records', [])
-            print(external_returns_data)
+            summary = returns.sync_returns(reset=reset)
         except requests.exceptions.RequestException as e:
             return Response(
                 {'error': f"Failed to fetch return data from external API: {e}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        except ValueError: # Catches JSONDecodeError if response is not valid JSON
+        except ValueError as e: # Invalid JSON or an unexpected payload shape
             return Response(
-                {'error': "External API returned invalid JSON."},
+                {'error': f"External API returned invalid data: {e}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        updated_count = 0
-        skipped_count = 0
-        errors_during_update = []
+        return Response({
+            'message': 'Return synchronization process completed.',
+            **summary,
+        }, status=status.HTTP_200_OK)
 
-        if not isinstance(external_returns_data, list):
-            return Response(
-                {'error': "Expected a list of returns from external API, but got a different format."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
 
-        # Get all unique_ids from your database for efficient lookup
-        # This prevents N+1 queries inside the loop
-        existing_order_unique_ids = set(Order.objects.values_list('unique_id', flat=True))
 
-        for return_entry in external_returns_data:
-            external_order_unique_id = return_entry.get('reference_id')
-            print(external_order_unique_id)
-            if not external_order_unique_id:
-                errors_during_update.append(f"Skipped return entry due to missing 'unique_id': {return_entry}")
-                skipped_count += 1
-                continue
 
-            # Check if this unique_id actually exists in your system to avoid unnecessary DB calls
-            if external_order_unique_id not in existing_order_unique_ids:
-                skipped_count += 1
-                continue # No matching order in our database
-
-            try:
-                # Use select_for_update to lock the row during the transaction
-                # if you expect concurrent updates.
-                with transaction.atomic():
-                    order = Order.objects.select_for_update().get(unique_id=external_order_unique_id)
-                    
-                  
-                    if order.status != 'returned':
-                        old_status = order.status
-                        order.profit = 0
-                        new_profit = 0
-                        order.status = 'returned'
-                        for item in order.items.all():
-                            inventory_Product = InventoryProduct.objects.get(name=item.type,)
-                            try:
-                                inventory_product2 = UserProductPrice.objects.get(user=order.user, product=inventory_Product)
-                                new_profit -= inventory_product2.custom_price
-                            except UserProductPrice.DoesNotExist:
-                            
-                                try:
-                                    
-                                    new_profit-= inventory_Product.price
-                                except InventoryProduct.DoesNotExist:
-                                    print(f"Warning: Inventory item not found for cancelled order item: {item.type}, {item.size}, {item.color}")
-
-                        order.profit = new_profit
-                        order.price = 0
-                        order.save()
-                        updated_count += 1
-
-                    else:
-                        skipped_count += 1 # Already returned, no update needed
-
-            except Order.DoesNotExist:
-                # This case should be mostly covered by the initial unique_id check,
-                # but good to keep for robustness (e.g., race conditions).
-                errors_during_update.append(f"Order with unique_id {external_order_unique_id} not found in database.")
-                skipped_count += 1
-            except Exception as e:
-                errors_during_update.append(f"Error updating order {external_order_unique_id}: {str(e)}")
-                skipped_count += 1
-
-        return Response({
-            'message': 'Return synchronization process completed.',
-            'updated_orders': updated_count,
-            'skipped_orders': skipped_count,
-            'errors': errors_during_update,
-            'total_external_returns_processed': len(external_returns_data)
-        }, status=status.HTTP_200_OK)
 
+class RecipientViewSet(ReplicaReadMixin, viewsets.GenericViewSet):
+    """Customer autocomplete: GET /api/recipients/?q=<phone or name prefix>."""
+    permission_classes = [permissions.IsAuthenticated]
+    replica_actions = ('list',)
 
+    def get_queryset(self, user_id=None):
+        queryset = Recipient.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        elif user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
 
+    def list(self, request):
+        limit = getattr(settings, 'RECIPIENT_AUTOCOMPLETE_LIMIT', 10)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', limit)), limit))
+        except ValueError:
+            pass
+        try:
+            user_id = int(request.query_params['user_id']) if request.query_params.get('user_id') else None
+        except ValueError:
+            return Response({'error': 'user_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        term = request.query_params.get('q', '')
+        return Response({'results': recipients.autocomplete(self.get_queryset(user_id), term, limit)})
 
 
 class OrderItemViewSet(viewsets.ModelViewSet):
@@ -547,32 +424,20 @@ class DesignViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def collect_designs(self, request):
-        today_str = timezone.now().strftime('%Y-%m-%d')
-        base_folder = os.path.join(settings.MEDIA_ROOT, 'collected_designs')
-        destination_folder = os.path.join(base_folder, today_str)
-
-        os.makedirs(destination_folder, exist_ok=True)
-
-        # Filter designs for the current day
-        designs = Design.objects.filter(created_at__date=timezone.now().date())
-        print(timezone.now().date())
-        copied_count = 0
-        for design in designs:
-            if design.file and os.path.isfile(design.file.path):
-                filename = os.path.basename(design.file.name)
-                dest_path = os.path.join(destination_folder, filename)
-
-                try:
-                    shutil.copy(design.file.path, dest_path)
-                    copied_count += 1
-                except Exception as e:
-                    print(f"Error copying file {filename}: {str(e)}")
-        zip_filename = f"{destination_folder}.zip"
-        shutil.make_archive(destination_folder, 'zip', destination_folder)
+        # Only designs missing from today's manifest are copied and appended.
+        collection = DailyCollection()
+        added, manifest = collection.collect()
         return Response({
             'success': True,
-            'message': f'{copied_count} designs copied to {destination_folder}',
-            'zip_url': f"http://localhost:8000/media/collected_designs/{today_str}.zip"
+            'message': f'{len(added)} designs copied to {collection.folder}',
+            'date': collection.label,
+            'added': added,
+            'added_count': len(added),
+            'total_count': len(manifest['designs']),
+            'previous_run_at': manifest['previous_run_at'],
+            'zip_url': request.build_absolute_uri(
+                signed_url(f"{COLLECTED_FOLDER}/{collection.label}.zip", request.user)
+            ),
         })
 
 class InventoryProductViewSet(viewsets.ModelViewSet):
@@ -584,6 +449,30 @@ class InventoryProductViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [permissions.IsAdminUser]
         return [permission() for permission in permission_classes]
+
+    def _catalog_response(self, request, data, etag):
+        headers = {'ETag': etag, 'Cache-Control': 'public, no-cache'}
+        if catalog.not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        # Served from the cached catalog (see api.catalog)
+        entry = catalog.get_catalog()
+        return self._catalog_response(request, catalog.with_absolute_images(entry['products'], request), entry['etag'])
+
+    def retrieve(self, request, *args, **kwargs):
+        entry = catalog.get_catalog()
+        try:
+            product_id = int(kwargs['pk'])
+        except ValueError:
+            product_id = None
+        if product_id not in entry['product_etags']:
+            return Response({'detail': 'No InventoryProduct matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+        product = next(product for product in entry['products'] if product['id'] == product_id)
+        return self._catalog_response(
+            request, catalog.with_absolute_images([product], request)[0], entry['product_etags'][product_id]
+        )
     
 class InventoryItemViewSet(viewsets.ModelViewSet):
     queryset = InventoryItem.objects.all()
@@ -600,3 +489,10 @@ class UserProductPriceViewSet(viewsets.ModelViewSet):
     queryset = UserProductPrice.objects.all()
     serializer_class = UserProductPriceSerializer
     permission_classes = [permissions.IsAdminUser]  
+
+
+
+class CourierExportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = CourierExportJob.objects.order_by('-id')
+    serializer_class = CourierExportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
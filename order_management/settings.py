@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware', # Opt-in, see PROFILING_ENABLED
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Add whitenoise middleware
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.routers.ReplicaReadsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -99,13 +101,95 @@ WSGI_APPLICATION = 'order_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+    'OPTIONS': {
+        # Readers don't block on the writer, and writers queue for the lock
+        # up front instead of failing with "database is locked" on upgrade.
+        'init_command': 'PRAGMA journal_mode=WAL;',
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    },
+    # Defaults to an in-memory database for tests; point it at a file to
+    # exercise concurrent writers (see OrderSequenceTests).
+    'TEST': {'NAME': os.environ.get('DJANGO_TEST_DB_NAME')},
 }
 
+
+def postgres_database(host):
+    """PostgreSQL settings for `host` from the POSTGRES_* environment.
+
+    POSTGRES_POOL picks how connections are reused:
+    - 'persistent' (default): each worker keeps its connection open for
+      POSTGRES_CONN_MAX_AGE seconds, health-checked before reuse;
+    - 'pgbouncer': the same, through a transaction-pooling PgBouncer
+      (server-side cursors don't survive it, so they are disabled);
+    - 'native': a psycopg connection pool per worker (needs psycopg 3 with
+      psycopg_pool instead of psycopg2; Django then requires CONN_MAX_AGE 0).
+    """
+    pool = os.environ.get('POSTGRES_POOL', 'persistent')
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'connect_timeout': 5},
+    }
+    if pool == 'pgbouncer':
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    elif pool == 'native':
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+            'timeout': 10,
+        }
+    return database
+
+
+# SQLite unless POSTGRES_DB is set. POSTGRES_REPLICA_HOST adds a read replica
+# (same database, credentials and pooling) used by api.routers.
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {'default': postgres_database(os.environ.get('POSTGRES_HOST', 'localhost'))}
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **postgres_database(os.environ['POSTGRES_REPLICA_HOST']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {'default': SQLITE_DATABASE}
+
+DATABASE_ROUTERS = ['api.routers.ReadReplicaRouter']
+DATABASE_READ_REPLICA = 'replica' if 'replica' in DATABASES else None
+# How long a user's reads stay on the primary after they write
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 5))
+
+# Shared cache. The catalog cache and its invalidation (api.catalog) and the
+# replica read pins (api.routers) must be seen by every gunicorn worker, so
+# this is never the per-process LocMemCache. Set REDIS_URL (needs the `redis`
+# package) when running more than one host; otherwise a file cache under
+# CACHE_DIR is shared by the workers of this host.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -159,6 +243,65 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Orders are bucketed into business days in this zone (see api.dates)
+BUSINESS_TIME_ZONE = os.environ.get('BUSINESS_TIME_ZONE', 'Asia/Jerusalem')
+
+# Opt-in: put the items of returned orders back into stock. Off by default,
+# returned items are not restocked unless this is explicitly enabled.
+RESTOCK_RETURNED_ORDERS = os.environ.get('RESTOCK_RETURNED_ORDERS', 'False') == 'True'
+
+# Largest batch accepted by POST /api/orders/bulk/
+BULK_ORDER_MAX_ROWS = int(os.environ.get('BULK_ORDER_MAX_ROWS', 1000))
+
+# Recipient autocomplete (see api.recipients): window for `recent_order_count`
+RECIPIENT_RECENT_DAYS = int(os.environ.get('RECIPIENT_RECENT_DAYS', 90))
+RECIPIENT_AUTOCOMPLETE_LIMIT = 10
+
+# Courier (hiexpress) integration
+COURIER_EXPORT_URL = os.environ.get('COURIER_EXPORT_URL', 'https://111hiexpress.ps/create_super_multi_orders')
+COURIER_SESSION_ID = os.environ.get('COURIER_SESSION_ID', 'b59c61dea31e1f626436c91e2afe56c6272c3d3f')
+COURIER_PASSWORD = os.environ.get('COURIER_PASSWORD', '12345678')
+COURIER_TIMEOUT = (5, 30)  # (connect, read) seconds
+# api.courier: shared connection pool, retries and circuit breaker
+COURIER_POOL_SIZE = int(os.environ.get('COURIER_POOL_SIZE', 10))
+COURIER_MAX_RETRIES = int(os.environ.get('COURIER_MAX_RETRIES', 3))
+COURIER_RETRY_BACKOFF = float(os.environ.get('COURIER_RETRY_BACKOFF', 0.5))
+COURIER_BREAKER_THRESHOLD = int(os.environ.get('COURIER_BREAKER_THRESHOLD', 5))
+COURIER_BREAKER_RESET = int(os.environ.get('COURIER_BREAKER_RESET', 30))
+COURIER_SLOW_CALL = float(os.environ.get('COURIER_SLOW_CALL', 5))
+
+# Export jobs (see api.jobs / `manage.py run_export_jobs`)
+COURIER_EXPORT_CHUNK_SIZE = int(os.environ.get('COURIER_EXPORT_CHUNK_SIZE', 50))
+COURIER_EXPORT_MAX_RETRIES = int(os.environ.get('COURIER_EXPORT_MAX_RETRIES', 3))
+COURIER_EXPORT_RETRY_BACKOFF = float(os.environ.get('COURIER_EXPORT_RETRY_BACKOFF', 2))
+COURIER_EXPORT_STALE_AFTER = int(os.environ.get('COURIER_EXPORT_STALE_AFTER', 300))
+COURIER_RETURNS_URL = os.environ.get('COURIER_RETURNS_URL', 'https://hiexpress.ps/web/dataset/search_read')
+COURIER_RETURNS_PAGE_SIZE = int(os.environ.get('COURIER_RETURNS_PAGE_SIZE', 200))
+
+# Public catalog cache (see api.catalog)
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+CATALOG_BUILD_LOCK_TIMEOUT = 10
+CATALOG_BUILD_WAIT = 2
+
+# Mockup/design thumbnails (see api.thumbnails): 'pool', 'sync' or 'off'
+THUMBNAIL_MODE = os.environ.get('THUMBNAIL_MODE', 'pool')
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+THUMBNAIL_SIZES = {'small': 128, 'medium': 384, 'large': 1024}
+# Failed renders are retried on read after THUMBNAIL_RETRY_BACKOFF seconds,
+# doubling per attempt, at most THUMBNAIL_MAX_ATTEMPTS times
+THUMBNAIL_RETRY_BACKOFF = int(os.environ.get('THUMBNAIL_RETRY_BACKOFF', 60))
+THUMBNAIL_MAX_ATTEMPTS = int(os.environ.get('THUMBNAIL_MAX_ATTEMPTS', 5))
+
+# Request profiling (see api.profiling): Server-Timing headers on a sample of
+# requests, slow query warnings, and cProfile dumps for PROFILING_CPROFILE_PATHS
+# (regexes matched against the request path)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 1.0))
+PROFILING_SLOW_QUERY_MS = float(os.environ.get('PROFILING_SLOW_QUERY_MS', 200))
+PROFILING_CPROFILE_PATHS = [path for path in os.environ.get('PROFILING_CPROFILE_PATHS', '').split(',') if path]
+PROFILING_CPROFILE_SAMPLE_RATE = float(os.environ.get('PROFILING_CPROFILE_SAMPLE_RATE', 0.01))
+PROFILING_CPROFILE_DIR = os.environ.get('PROFILING_CPROFILE_DIR', str(BASE_DIR / 'profiles'))
+
 USE_I18N = True
 
 USE_TZ = True
@@ -173,6 +316,14 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Media files (User uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'mediafiles'
+# How /media/ bytes are sent once api.media has checked access:
+# 'django' (built-in, Range + sendfile via wsgi.file_wrapper), 'x-accel'
+# (nginx X-Accel-Redirect to MEDIA_ACCEL_PREFIX) or 'x-sendfile'.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Signed /media/ links handed out by the API stay stable for this long and
+# are valid for up to twice that (see api.media)
+MEDIA_SIGNED_URL_TTL = int(os.environ.get('MEDIA_SIGNED_URL_TTL', 6 * 60 * 60))
 
 # Whitenoise storage for static files
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'